@@ -0,0 +1,20 @@
+"""Register address map of the :class:`entangler.phy.Entangler` RTIO PHY.
+
+Shared by the gateware, the ARTIQ driver & the core model, so it depends on neither
+ARTIQ nor Migen.
+"""
+
+
+def address_index_width(num_outputs=4, num_inputs=4):
+    """Return the width of the register index in the RTIO address of an ``Entangler``.
+
+    The next two address bits above the index select the register bank (low
+    registers, timing writes, status reads & timestamp reads), the lower bits index
+    into the bank. The timing bank holds ``num_outputs + num_inputs`` registers, and
+    the timestamp bank ``num_inputs + 1``. The index is at least 3 bits wide for the
+    low registers.
+
+    The top address bit selects the extended registers instead, which are indexed
+    by all the lower address bits.
+    """
+    return max(3, (num_outputs + num_inputs - 1).bit_length(), num_inputs.bit_length())
@@ -2,14 +2,17 @@
 import typing
 
 import migen.build.generic_platform as platform
+from migen import Array
 from migen import Cat
 from migen import FSM
 from migen import If
 from migen import Instance
+from migen import Memory
 from migen import Module
 from migen import Mux
 from migen import NextState
 from migen import NextValue
+from migen import Replicate
 from migen import Signal
 
 # Width of sequence duration counters and the coarse part of input timestamps
@@ -70,6 +73,91 @@ class ChannelSequencer(Module):
         ]
 
 
+class EdgeSequencer(Module):
+    """Drives several outputs from a table of edges stored in block RAM.
+
+    Each table entry is a ``(time, channel mask, level)`` tuple, packed LSB first as
+    ``len(m)`` bits of time, ``num_channels`` bits of channel mask, and one bit of
+    level. When the counter ``m`` equals the time of the current entry, all outputs
+    selected by the mask are set to the level, and the sequencer moves on to the
+    next entry. Unlike :class:`ChannelSequencer`, this allows any number of pulses
+    per channel, using a single comparator irrespective of the number of edges or
+    channels.
+
+    Entries must be sorted by strictly increasing time (edges on different channels
+    at the same time must share one entry). Only the first :attr:`n_edges` entries
+    are used.
+
+    The table is written sequentially: :attr:`write_reset` rewinds the write
+    pointer to the first entry, and each :attr:`write_stb` pulse writes
+    :attr:`write_data` to the current entry and advances the pointer.
+
+    Attributes:
+        output (:class:`Signal`(num_channels)): the sequencer outputs
+        clear: de-asserts all outputs and rewinds to the first edge.
+        n_edges: number of valid entries in the table.
+    """
+
+    def __init__(self, m, num_channels=4, depth=64):
+        """Define the edge table memory and the logic to step through it.
+
+        Args:
+            m: the cycle counter :class:`Signal` that governs the output times.
+            num_channels (int, optional): number of outputs. Defaults to 4.
+            depth (int, optional): maximum number of edges in the table.
+                Defaults to 64.
+        """
+        self.output = Signal(num_channels)
+        self.clear = Signal()
+        self.n_edges = Signal(max=depth + 1)
+
+        self.write_reset = Signal()
+        self.write_stb = Signal()
+        self.write_data = Signal(len(m) + num_channels + 1)
+
+        # # #
+
+        table = Memory(len(self.write_data), depth)
+        wrport = table.get_port(write_capable=True)
+        rdport = table.get_port()
+        self.specials += table, wrport, rdport
+
+        write_ptr = Signal(max=depth)
+        self.comb += [
+            wrport.adr.eq(write_ptr),
+            wrport.dat_w.eq(self.write_data),
+            wrport.we.eq(self.write_stb),
+        ]
+        self.sync += [
+            If(self.write_stb, write_ptr.eq(write_ptr + 1)),
+            If(self.write_reset, write_ptr.eq(0)),
+        ]
+
+        # The read port is synchronous, so we always address the entry that will be
+        # current on the next clock cycle.
+        ptr = Signal(max=depth + 1)
+        t_edge = Signal(len(m))
+        mask = Signal(num_channels)
+        level = Signal()
+        self.stb_edge = Signal()
+        self.comb += [
+            Cat(t_edge, mask, level).eq(rdport.dat_r),
+            self.stb_edge.eq((ptr < self.n_edges) & (m == t_edge)),
+            rdport.adr.eq(Mux(self.clear, 0, Mux(self.stb_edge, ptr + 1, ptr))),
+        ]
+
+        self.sync += [
+            If(
+                self.stb_edge,
+                ptr.eq(ptr + 1),
+                self.output.eq(
+                    (self.output & ~mask) | (Replicate(level, num_channels) & mask)
+                ),
+            ),
+            If(self.clear, ptr.eq(0), self.output.eq(0)),
+        ]
+
+
 class TriggeredInputGater(Module):
     """Event gater that connects to ttl_serdes_generic phys.
 
@@ -84,14 +172,21 @@ class TriggeredInputGater(Module):
     Once the module is triggered subsequent signal edges are ignored.
     Clear has to be asserted to clear the reference edge and the triggered flag.
 
+    For multiple excitation windows per cycle, :attr:`new_window` can be asserted
+    together with a reference edge: the triggered flag is then cleared, and the gate
+    window restarts relative to the new reference edge.
+
     The start gate offset must be at least 8 * mu.
     """
 
     def __init__(self, m, phy_ref, phy_sig):
         """Define the gateware to gate & latch inputs."""
         self.clear = Signal()
+        self.new_window = Signal()
 
         self.triggered = Signal()
+        # Pulsed when the gate triggers on a signal edge
+        self.trigger_stb = Signal()
 
         n_fine = len(phy_ref.fine_ts)
 
@@ -129,23 +224,313 @@ class TriggeredInputGater(Module):
         past_window_start = Signal()
         before_window_end = Signal()
         triggering = Signal()
-        t_sig = Signal(full_timestamp_width)
+        self.t_sig = Signal(full_timestamp_width)  # Timestamp of current signal edge
         self.comb += [
-            t_sig.eq(Cat(phy_sig.fine_ts, m)),
-            past_window_start.eq(t_sig >= abs_gate_start),
-            before_window_end.eq(t_sig <= abs_gate_stop),
+            self.t_sig.eq(Cat(phy_sig.fine_ts, m)),
+            past_window_start.eq(self.t_sig >= abs_gate_start),
+            before_window_end.eq(self.t_sig <= abs_gate_stop),
             triggering.eq(past_window_start & before_window_end),
+            self.trigger_stb.eq(
+                phy_sig.stb_rising
+                & ~self.triggered
+                & triggering
+                & ~self.clear
+                & ~self.new_window
+            ),
         ]
 
         self.sync += [
             If(
                 phy_sig.stb_rising & ~self.triggered & triggering,
                 self.triggered.eq(triggering),
-                self.sig_ts.eq(t_sig),
-            )
+                self.sig_ts.eq(self.t_sig),
+            ),
+            If(self.new_window, self.triggered.eq(0)),
         ]
 
 
+class ArrivalHistogram(Module):
+    """Histogram of signal edge arrival times, relative to the reference edge.
+
+    Every signal edge seen by a :class:`TriggeredInputGater` after its reference
+    edge is binned, whether or not it falls in the gate window. Bin ``i`` counts the
+    edges that arrived between ``offset + i * 2**shift`` and
+    ``offset + (i + 1) * 2**shift - 1`` mu after the reference edge. The bins are
+    stored in block RAM, and incremented with a read-modify-write pipeline that
+    can accept one edge per clock cycle.
+
+    Pulsing :attr:`clear` zeroes all bins, which takes ``num_bins`` clock cycles
+    during which edges are not counted.
+
+    Attributes:
+        num_bins (int): number of bins.
+        enable: count edges while asserted.
+        offset: arrival time of the start of the first bin, in mu.
+        shift: log2 of the bin width, in mu.
+        readout_adr: bin to read out on :attr:`readout_data` on the next clock cycle.
+    """
+
+    def __init__(self, gater, phy_sig, num_bins=64, count_width=28):
+        """Define the histogram memory and binning logic.
+
+        Args:
+            gater (TriggeredInputGater): gater providing the reference and signal
+                edge timestamps.
+            phy_sig: the signal input phy of the gater.
+            num_bins (int, optional): number of bins. Defaults to 64.
+            count_width (int, optional): width of the bin counters. Defaults to 28.
+        """
+        self.num_bins = num_bins
+        self.enable = Signal()
+        self.clear = Signal()
+        self.offset = Signal(len(gater.ref_ts))
+        self.shift = Signal(4)
+
+        self.readout_adr = Signal(max=num_bins)
+        self.readout_data = Signal(count_width)
+
+        # # #
+
+        bins = Memory(count_width, num_bins)
+        rmw_rdport = bins.get_port()
+        wrport = bins.get_port(write_capable=True)
+        readout_port = bins.get_port()
+        self.specials += bins, rmw_rdport, wrport, readout_port
+
+        self.comb += [
+            readout_port.adr.eq(self.readout_adr),
+            self.readout_data.eq(readout_port.dat_r),
+        ]
+
+        clearing = Signal()
+        clear_adr = Signal(max=num_bins)
+        self.sync += [
+            If(
+                clearing,
+                clear_adr.eq(clear_adr + 1),
+                If(clear_adr == num_bins - 1, clearing.eq(0)),
+            ),
+            If(self.clear, clearing.eq(1), clear_adr.eq(0)),
+        ]
+
+        # Stage 0: bin the edge & read the bin count
+        t_rel = Signal(len(gater.ref_ts))
+        t_bin = Signal(len(gater.ref_ts))
+        hit = Signal()
+        self.comb += [
+            t_rel.eq(gater.t_sig - gater.ref_ts - self.offset),
+            t_bin.eq(t_rel >> self.shift),
+            hit.eq(
+                self.enable
+                & ~clearing
+                & phy_sig.stb_rising
+                & gater.got_ref
+                & (gater.t_sig >= gater.ref_ts + self.offset)
+                & (t_bin < num_bins)
+            ),
+            rmw_rdport.adr.eq(t_bin),
+        ]
+
+        # Stage 1: write back the incremented count. If the previous edge was in
+        # the same bin, its write has not been seen by the read, so forward it.
+        hit_d = Signal()
+        bin_d = Signal(max=num_bins)
+        last_we = Signal()
+        last_adr = Signal(max=num_bins)
+        last_count = Signal(count_width)
+        count = Signal(count_width)
+        self.comb += [
+            count.eq(
+                Mux(last_we & (last_adr == bin_d), last_count, rmw_rdport.dat_r) + 1
+            ),
+            If(
+                clearing, wrport.adr.eq(clear_adr), wrport.dat_w.eq(0), wrport.we.eq(1)
+            ).Else(wrport.adr.eq(bin_d), wrport.dat_w.eq(count), wrport.we.eq(hit_d)),
+        ]
+        self.sync += [
+            hit_d.eq(hit),
+            bin_d.eq(t_bin),
+            last_we.eq(hit_d & ~clearing),
+            last_adr.eq(bin_d),
+            last_count.eq(count),
+        ]
+
+
+class CycleTrace(Module):
+    """Ring buffer of per-cycle records in block RAM.
+
+    On each pulse of :attr:`write_stb`, a record of the current values of
+    ``fields`` is stored. Once ``depth`` records are stored, each new record
+    overwrites the oldest one. Each field is stored in its own ``word_width`` bit
+    word, and records are read out one word at a time.
+
+    Attributes:
+        write_stb: store a record.
+        clear: discard all records.
+        count: number of records stored (at most ``depth``).
+        n_words: number of words per record, i.e. number of fields.
+        readout_record: record to read out, counting from the oldest one.
+        readout_word: field of the record to read out.
+        readout_data: word selected by :attr:`readout_record` and
+            :attr:`readout_word` on the previous clock cycle.
+    """
+
+    def __init__(self, fields, depth=256, word_width=14):
+        """Define the ring buffer memory & pointers.
+
+        Args:
+            fields: list of signals to record, each at most ``word_width`` bits.
+            depth (int, optional): number of records, a power of 2. Defaults to 256.
+            word_width (int, optional): width of the readout words. Defaults to 14.
+        """
+        assert depth & (depth - 1) == 0
+        assert all(len(field) <= word_width for field in fields)
+        n_words = len(fields)
+        self.n_words = n_words
+
+        self.write_stb = Signal()
+        self.clear = Signal()
+        self.count = Signal(max=depth + 1)
+
+        self.readout_record = Signal(max=depth)
+        self.readout_word = Signal(max=max(2, n_words))
+        self.readout_data = Signal(word_width)
+
+        # # #
+
+        records = Memory(n_words * word_width, depth)
+        wrport = records.get_port(write_capable=True)
+        rdport = records.get_port()
+        self.specials += records, wrport, rdport
+
+        # The write pointer wraps around as depth is a power of 2
+        wr_ptr = Signal(max=depth)
+        self.comb += [wrport.adr.eq(wr_ptr), wrport.we.eq(self.write_stb & ~self.clear)]
+        self.comb += [
+            wrport.dat_w[word_width * i : word_width * i + len(field)].eq(field)  # noqa
+            for i, field in enumerate(fields)
+        ]
+        self.sync += If(self.clear, wr_ptr.eq(0), self.count.eq(0)).Elif(
+            self.write_stb,
+            wr_ptr.eq(wr_ptr + 1),
+            If(self.count != depth, self.count.eq(self.count + 1)),
+        )
+
+        readout_word = Signal.like(self.readout_word)
+        words = Array(
+            rdport.dat_r[word_width * i : word_width * (i + 1)]  # noqa
+            for i in range(n_words)
+        )
+        self.comb += [
+            rdport.adr.eq(wr_ptr - self.count + self.readout_record),
+            self.readout_data.eq(words[readout_word]),
+        ]
+        self.sync += readout_word.eq(self.readout_word)
+
+
+class ParameterScan(Module):
+    """Sequences the points of a parameter scan over the cycles of a run.
+
+    A scan starts on :attr:`start_stb` if :attr:`n_points` is not 0, and moves to the
+    next point every :attr:`cycles_per_point` completed cycles. At the end of each
+    point, a record of the number of heralded cycles and of clicks of each input
+    during the point is stored, and :attr:`step_stb` (or :attr:`done_stb` after the
+    last point) is pulsed. The counts saturate at 14 bits. The records are read out
+    as from a :class:`CycleTrace`.
+
+    Attributes:
+        cycles_per_point: number of cycles per point (at least 1).
+        n_points: number of points of the scan, 0 to disable scans.
+        start_stb: start a scan, discarding the records of the previous one.
+        stop: end the scan early. The current point is not recorded.
+        cycle_stb: pulsed on the last clock cycle of each completed cycle.
+        herald: asserted with :attr:`cycle_stb` if the cycle heralded.
+        clicks: click strobe of each input.
+        active: asserted while a scan is in progress.
+        step_stb: pulsed at the end of each point but the last.
+        done_stb: pulsed at the end of the last point.
+        end_stb: pulsed when the scan ends, whether done or stopped.
+        records: :class:`CycleTrace` of the points, each record is [heralds, clicks
+            of each input...].
+    """
+
+    def __init__(self, num_inputs=4, depth=64):
+        """Define the point counters & record memory.
+
+        Args:
+            num_inputs (int, optional): number of click inputs. Defaults to 4.
+            depth (int, optional): maximum number of points, a power of 2. Defaults
+                to 64.
+        """
+        self.cycles_per_point = Signal(14)
+        self.n_points = Signal(max=depth + 1)
+        self.start_stb = Signal()
+        self.stop = Signal()
+
+        self.cycle_stb = Signal()
+        self.herald = Signal()
+        self.clicks = [Signal() for _ in range(num_inputs)]
+
+        self.active = Signal()
+        self.step_stb = Signal()
+        self.done_stb = Signal()
+        self.end_stb = Signal()
+
+        # # #
+
+        increments = [self.cycle_stb & self.herald] + self.clicks
+        counts = [Signal(14) for _ in increments]
+        # Counts including the increments of the current clock cycle
+        counts_next = [Signal(14) for _ in increments]
+        self.comb += [
+            count_next.eq(Mux(increment & (count != 0x3FFF), count + 1, count))
+            for count_next, count, increment in zip(counts_next, counts, increments)
+        ]
+
+        self.submodules.records = CycleTrace(counts_next, depth=depth)
+
+        cycle = Signal(14)  # Cycles completed in the current point
+        point_end = Signal()
+        last_point = Signal()
+        self.comb += [
+            point_end.eq(
+                self.active
+                & ~self.stop
+                & self.cycle_stb
+                & (cycle + 1 == self.cycles_per_point)
+            ),
+            last_point.eq(self.records.count + 1 == self.n_points),
+            self.step_stb.eq(point_end & ~last_point),
+            self.done_stb.eq(point_end & last_point),
+            self.end_stb.eq(self.done_stb | (self.active & self.stop)),
+            self.records.write_stb.eq(point_end),
+            self.records.clear.eq(self.start_stb),
+        ]
+        self.sync += (
+            If(
+                self.start_stb,
+                self.active.eq(self.n_points != 0),
+                cycle.eq(0),
+                *(count.eq(0) for count in counts),
+            )
+            .Elif(self.stop, self.active.eq(0))
+            .Elif(
+                point_end,
+                cycle.eq(0),
+                *(count.eq(0) for count in counts),
+                If(last_point, self.active.eq(0)),
+            )
+            .Elif(
+                self.active,
+                If(self.cycle_stb, cycle.eq(cycle + 1)),
+                *(
+                    count.eq(count_next)
+                    for count, count_next in zip(counts, counts_next)
+                ),
+            )
+        )
+
+
 class PatternMatcher(Module):
     """Checks if input vector matches any pattern in patterns.
 
@@ -178,8 +563,77 @@ class PatternMatcher(Module):
         self.comb += self.is_match.eq(self.pattern_ens & self.matches != 0)
 
 
+class PatternLUT(Module):
+    """Checks if input vector is one of an arbitrary set of heralding patterns.
+
+    Instead of comparing the input against a list of patterns, this stores one bit
+    for each of the ``2 ** num_inputs`` possible input vectors, so any set of
+    patterns can be accepted at once. Patterns with "don't care" inputs are
+    expressed by setting the bits of all the matching input vectors.
+
+    The table is written 32 bits at a time through a shift register: each
+    :attr:`write_stb` pulse shifts :attr:`write_data` in from the top, so the
+    whole table is loaded by writing its 32-bit words from least to most
+    significant.
+
+    Attributes:
+        sig (:class:`Signal`(num_inputs)): input signal to match against
+        table (:class:`Signal`(2 ** num_inputs)): bit ``i`` is set if input
+            vector ``i`` is a herald.
+        is_match (:class:`Signal`): Asserted when the input is a herald.
+
+    """
+
+    def __init__(self, num_inputs=4):
+        """Define lookup table gateware."""
+        self.sig = Signal(num_inputs)
+        self.table = Signal(2 ** num_inputs)
+        self.is_match = Signal()
+
+        self.write_stb = Signal()
+        self.write_data = Signal(32)
+
+        # # #
+
+        table_bits = Array(self.table[i] for i in range(len(self.table)))
+        self.comb += self.is_match.eq(table_bits[self.sig])
+        if len(self.table) > 32:
+            self.sync += If(
+                self.write_stb, self.table.eq(Cat(self.table[32:], self.write_data))
+            )
+        else:
+            self.sync += If(self.write_stb, self.table.eq(self.write_data))
+
+
 class MainStateMachine(Module):
-    """State machine to run the entanglement generation process."""
+    """State machine to run the entanglement generation process.
+
+    By default, each cycle is separated from the next by an ``IDLE`` state, in which
+    the master re-triggers the slave (and the slave checks for a success broadcast by
+    the master). This costs a few clock cycles of dead time per attempt.
+
+    If :attr:`pipelined` is asserted, the master instead sends the trigger for the
+    next cycle during the last cycles of the current one, and the counter ``m`` wraps
+    directly from ``m_end`` to 0 without any idle cycles. Master and slave remain in
+    lockstep, and success/timeout still end the run at a cycle boundary. In this mode
+    the herald is sampled at ``m == m_end - 1`` (instead of ``m == m_end``), so the
+    herald gate windows must close before then, and ``m_end`` must be at least 2.
+
+    If :attr:`early_exit` is asserted, the master does not wait for the end of the
+    cycle to check the herald: a herald at any point of the cycle ends the run on the
+    next clock cycle. The master's success signal is forwarded to the slave over the
+    core link, and the slave then ends its run too.
+
+    A run normally finishes on the first success. If :attr:`n_successes_buf` is set
+    to ``N > 1`` when :attr:`run_stb` is pulsed, the core instead re-arms itself after
+    each of the first ``N - 1`` successes (pulsing :attr:`herald_stb`), and only
+    finishes on the ``N``-th success or on timeout.
+
+    Pulsing :attr:`abort_stb` during a run finishes it at the next cycle boundary,
+    as a timeout would. On the master, the abort is forwarded to the slave by
+    asserting both the trigger & timeout links (which the master otherwise never
+    does together), so the slave finishes too, and is :attr:`aborted` as well.
+    """
 
     def __init__(self, counter_width=10):
         """Define the state machine logic for running the input & output sequences."""
@@ -196,19 +650,37 @@ class MainStateMachine(Module):
         )  # Pulsed when core has finished (on timeout or success)
         self.running = Signal()  # Asserted on run_stb, cleared on done_stb
 
+        # Number of successes to run for, loaded on run_stb
+        self.n_successes_buf = Signal(16)
+        self.successes_remaining = Signal(16)
+        # Pulsed when the core re-arms after a success that did not finish the run
+        self.herald_stb = Signal()
+
         self.timeout = Signal()
         self.success = Signal()
 
+        # Pulse to finish the run at the next cycle boundary. aborted is then asserted
+        # until the next run_stb.
+        self.abort_stb = Signal()
+        self.aborted = Signal()
+        # Timeout signal to the slave: asserted on timeout or abort, so that the slave
+        # stops together with the master.
+        self.timeout_out = Signal()
+        # Abort signalled by the master (trigger & timeout links both asserted)
+        self.abort_in = Signal()
+
         self.ready = Signal()
 
         self.herald = Signal()
 
         self.is_master = Signal()
         self.standalone = Signal()  # Ignore state of partner for single-device testing.
+        self.pipelined = Signal()  # Run back-to-back cycles without idling in between.
+        self.early_exit = Signal()  # Finish as soon as herald is asserted.
         self.act_as_master = Signal()
         self.comb += self.act_as_master.eq(self.is_master | self.standalone)
 
-        self.trigger_out = Signal()  # Trigger to slave
+        self.trigger_out = Signal()  # Trigger to slave (or abort, with timeout_out)
 
         # Unregistered inputs from master
         self.trigger_in_raw = Signal()
@@ -228,9 +700,31 @@ class MainStateMachine(Module):
 
         self.cycle_ending = Signal()
 
+        # Asserted when the counter wraps straight into the next cycle (pipelined mode)
+        self.cycle_restart = Signal()
+
+        # Asserted for one clock cycle between consecutive cycles, to clear the
+        # per-cycle state of the sequencers & gaters.
+        self.cycle_clear = Signal()
+
+        # Pulsed on the last clock cycle of each completed cycle, while the per-cycle
+        # state of the gaters is still valid.
+        self.cycle_stb = Signal()
+
+        # Asserted while the counter runs through a cycle (m counts up from 0)
+        self.counting = Signal()
+
         # # #
 
-        self.comb += self.cycle_ending.eq(self.m == self.m_end)
+        trigger = Signal()  # Trigger to slave, from the state machine
+        cycle_prelast = Signal()
+        herald_point = Signal()
+        self.comb += [
+            self.cycle_ending.eq(self.m == self.m_end),
+            cycle_prelast.eq(self.m == self.m_end - 1),
+            herald_point.eq(Mux(self.pipelined, cycle_prelast, self.cycle_ending)),
+            self.cycle_clear.eq(self.cycle_starting | self.cycle_restart),
+        ]
 
         self.trigger_in = Signal()
         self.success_in = Signal()
@@ -251,9 +745,18 @@ class MainStateMachine(Module):
         # The core times out if time_remaining countdown reaches zero, or,
         # if we are a slave, if the master has timed out.
         # This is required to ensure the slave syncs with the master
-        self.comb += self.timeout.eq(
-            (self.time_remaining == 0) | (~self.act_as_master & self.timeout_in)
-        )
+        self.comb += [
+            self.timeout.eq(
+                (self.time_remaining == 0) | (~self.act_as_master & self.timeout_in)
+            ),
+            self.timeout_out.eq(self.timeout | self.aborted),
+            self.trigger_out.eq(self.aborted | (trigger & ~self.timeout)),
+            self.abort_in.eq(~self.act_as_master & self.trigger_in & self.timeout_in),
+        ]
+        self.sync += [
+            If((self.abort_stb | self.abort_in) & self.running, self.aborted.eq(1)),
+            If(self.run_stb, self.aborted.eq(0)),
+        ]
 
         self.sync += [
             If(self.run_stb, self.time_remaining.eq(self.time_remaining_buf)).Else(
@@ -264,9 +767,26 @@ class MainStateMachine(Module):
         done = Signal()
         done_d = Signal()
         finishing = Signal()
-        self.comb += finishing.eq(
-            ~self.run_stb & self.running & (self.timeout | self.success)
-        )
+        rearming = Signal()
+        last_success = Signal()
+        self.comb += [
+            last_success.eq(self.successes_remaining <= 1),
+            finishing.eq(
+                ~self.run_stb
+                & self.running
+                & (self.timeout | self.aborted | (self.success & last_success))
+            ),
+            rearming.eq(
+                ~self.run_stb
+                & self.running
+                & ~self.timeout
+                & ~self.aborted
+                & self.success
+                & ~last_success
+            ),
+        ]
+        # Re-arm at the end of the successful cycle, i.e. where done would be asserted
+        self.comb += self.herald_stb.eq(rearming & self.cycle_starting)
         # Done asserted at the at the end of the successful / timedout cycle
         self.comb += done.eq(finishing & self.cycle_starting)
         self.comb += self.done_stb.eq(done & ~done_d)
@@ -278,11 +798,29 @@ class MainStateMachine(Module):
                 self.ready.eq(1),
                 self.cycles_completed.eq(0),
                 self.success.eq(0),
+                self.successes_remaining.eq(self.n_successes_buf),
+            ),
+            If(
+                self.herald_stb,
+                self.success.eq(0),
+                self.successes_remaining.eq(self.successes_remaining - 1),
             ),
             done_d.eq(done),
             If(finishing, self.ready.eq(0)),
         ]
 
+        # Pipelined mode: master decides one clock before the end of the cycle whether
+        # to trigger the slave for another cycle. It must then follow that decision at
+        # the cycle boundary, so that both sides stay in lockstep.
+        pipeline_go = Signal()
+        pipeline_next = Signal()
+        self.comb += pipeline_go.eq(
+            ~self.herald
+            & ~finishing
+            & self.ready
+            & (self.slave_ready | self.standalone)
+        )
+
         fsm = FSM()
         self.submodules += fsm
 
@@ -297,23 +835,57 @@ class MainStateMachine(Module):
                 ),
             ).Else(If(~finishing & self.ready & self.trigger_in, NextState("COUNTER"))),
             NextValue(self.m, 0),
-            self.trigger_out.eq(0),
+            trigger.eq(0),
+        )
+        fsm.act("TRIGGER_SLAVE", NextState("TRIGGER_SLAVE2"), trigger.eq(1))
+        fsm.act("TRIGGER_SLAVE2", NextState("COUNTER"), trigger.eq(1))
+        # Early-exit mode: master finishes on herald, slave on the master's success.
+        exiting_early = Signal()
+        self.comb += exiting_early.eq(
+            self.early_exit
+            & Mux(self.act_as_master, self.herald, self.success_in)
+            & ~self.run_stb
+            & self.running
         )
-        fsm.act("TRIGGER_SLAVE", NextState("TRIGGER_SLAVE2"), self.trigger_out.eq(1))
-        fsm.act("TRIGGER_SLAVE2", NextState("COUNTER"), self.trigger_out.eq(1))
+
         fsm.act(
             "COUNTER",
+            self.counting.eq(1),
             NextValue(self.m, self.m + 1),
             If(
+                herald_point & self.act_as_master & self.herald,
+                NextValue(self.success, 1),
+            ),
+            If(
+                self.pipelined & cycle_prelast & self.act_as_master,
+                NextValue(pipeline_next, pipeline_go),
+                trigger.eq(pipeline_go),
+            ),
+            If(
+                exiting_early,
+                self.cycle_stb.eq(1),
+                NextValue(self.cycles_completed, self.cycles_completed + 1),
+                NextValue(self.success, 1),
+                NextState("IDLE"),
+            ).Elif(
                 self.cycle_ending,
+                self.cycle_stb.eq(1),
                 NextValue(self.cycles_completed, self.cycles_completed + 1),
                 If(
                     self.act_as_master,
-                    If(self.herald, NextValue(self.success, 1)),
-                    NextState("IDLE"),
-                ).Else(NextState("SLAVE_SUCCESS_WAIT")),
+                    If(
+                        self.pipelined & pipeline_next,
+                        NextValue(self.m, 0),
+                        self.cycle_restart.eq(1),
+                    ).Else(NextState("IDLE")),
+                ).Else(
+                    If(
+                        self.pipelined & self.trigger_in & ~finishing,
+                        NextValue(self.m, 0),
+                        self.cycle_restart.eq(1),
+                    ).Else(NextState("SLAVE_SUCCESS_WAIT"))
+                ),
             ),
-            self.trigger_out.eq(0),
         )
         fsm.act("SLAVE_SUCCESS_WAIT", NextState("SLAVE_SUCCESS_CHECK"))
         fsm.act(
@@ -337,6 +909,15 @@ class EntanglerCore(Module):
         passthrough_sigs: typing.Sequence[Signal],
         input_phys: typing.Sequence["PHY"],
         simulate: bool = False,
+        num_outputs: int = 4,
+        num_inputs: int = 4,
+        num_patterns: int = 4,
+        sequencer_idx_422ps: int = SEQUENCER_IDX_422ps,
+        num_histogram_bins: typing.Optional[int] = None,
+        trace_depth: typing.Optional[int] = None,
+        num_scan_points: typing.Optional[int] = None,
+        edge_depth: typing.Optional[int] = None,
+        herald_lut: bool = False,
     ):
         """Define the submodules & connections between them to form an ``Entangler``.
 
@@ -345,34 +926,113 @@ class EntanglerCore(Module):
                 used to link a master & slave ``Entangler`` device.
             output_pads (typing.Sequence[platform.Pins]): The output pins that will
                 be driven by the state machines to output the entanglement generation
-                signals.
+                signals. Expects ``num_outputs`` sequencer outputs, followed by the
+                "running" output.
             passthrough_sigs (typing.Sequence[Signal]): The signals that should be
                 passed through to the ``output_pads`` when the ``Entangler`` is not
                 running.
             input_phys (typing.Sequence["PHY"]): TTLInput physical gateware modules
-                that register an input TTL event. Expects a list of 4, with
-                the first 4 being the input APD/TTL signals, and the last one
-                as a sync signal with the entanglement laser.
+                that register an input TTL event. Expects a list of
+                ``num_inputs + 1``, with the first ``num_inputs`` being the input
+                APD/TTL signals, and the last one as a sync signal with the
+                entanglement laser.
             simulate (bool, optional): If this should be instantiated in
                 simulation mode. If it is simulated, it disables several options like
                 the passthrough_sigs. Defaults to False.
+            num_outputs (int, optional): Number of sequencer outputs. Defaults to 4.
+            num_inputs (int, optional): Number of gated APD inputs. Defaults to 4.
+            num_patterns (int, optional): Number of herald patterns. Defaults to 4.
+            sequencer_idx_422ps (int, optional): Index of the output that
+                triggers the shared 422ps laser. Defaults to
+                :data:`SEQUENCER_IDX_422ps`.
+            num_histogram_bins (int, optional): Number of bins of the arrival time
+                histogram of each APD input, or None to build without histograms.
+                Defaults to None.
+            trace_depth (int, optional): Number of cycles recorded by the cycle
+                trace ring buffer, or None to build without the trace. Defaults to
+                None.
+            num_scan_points (int, optional): Maximum number of points of a parameter
+                scan (a power of 2), or None to build without the scan engine.
+                Defaults to None.
+            edge_depth (int, optional): Number of entries of the edge sequencer
+                table, or None to build without the edge sequencer. Defaults to None.
+            herald_lut (bool, optional): Build the herald lookup table. Defaults to
+                False.
         """
         self.enable = Signal()
+        # Drive the outputs from the edge table instead of the channel sequencers
+        self.use_edge_sequencer = Signal()
+        # Herald using the lookup table instead of the list of patterns
+        self.use_herald_lut = Signal()
+        # Record the outcome of each cycle in the trace ring buffer
+        self.trace_enable = Signal()
+        # Finish the run at the next cycle boundary
+        self.abort_stb = Signal()
+        # Zero the arrival time histograms (takes num_histogram_bins clock cycles)
+        self.histogram_clear = Signal()
         # # #
 
-        phy_apds = input_phys[0:4]
-        phy_422pulse = input_phys[4]
+        phy_apds = input_phys[0:num_inputs]
+        phy_422pulse = input_phys[num_inputs]
 
         self.submodules.msm = MainStateMachine()
 
-        self.submodules.sequencers = [ChannelSequencer(self.msm.m) for _ in range(4)]
+        self.submodules.sequencers = [
+            ChannelSequencer(self.msm.m) for _ in range(num_outputs)
+        ]
+        # Output of each channel, from whichever sequencer engine is in use
+        if edge_depth is None:
+            self.edge_sequencer = None
+            self.outputs = [sequencer.output for sequencer in self.sequencers]
+        else:
+            self.outputs = [Signal() for _ in self.sequencers]
+            self.submodules.edge_sequencer = EdgeSequencer(
+                self.msm.m, num_channels=num_outputs, depth=edge_depth
+            )
+            self.comb += [
+                output.eq(
+                    Mux(
+                        self.use_edge_sequencer,
+                        self.edge_sequencer.output[i],
+                        sequencer.output,
+                    )
+                )
+                for i, (output, sequencer) in enumerate(
+                    zip(self.outputs, self.sequencers)
+                )
+            ]
 
         self.submodules.apd_gaters = [
             TriggeredInputGater(self.msm.m, phy_422pulse, phy_apd)
             for phy_apd in phy_apds
         ]
 
-        self.submodules.heralder = PatternMatcher(num_inputs=4, num_patterns=4)
+        self.submodules.heralder = PatternMatcher(
+            num_inputs=num_inputs, num_patterns=num_patterns
+        )
+        if herald_lut:
+            self.submodules.herald_lut = PatternLUT(num_inputs=num_inputs)
+        else:
+            self.herald_lut = None
+
+        # Arrival time histograms of all APD clicks (gated or not) during runs. They
+        # accumulate over runs until cleared, so that no clicks are missed while
+        # clearing at the start of a run.
+        self.histogram_offset = Signal(len(self.apd_gaters[0].ref_ts))
+        self.histogram_shift = Signal(4)
+        self.histograms = []
+        if num_histogram_bins is not None:
+            self.submodules.histograms = [
+                ArrivalHistogram(gater, phy_apd, num_bins=num_histogram_bins)
+                for gater, phy_apd in zip(self.apd_gaters, phy_apds)
+            ]
+        for histogram in self.histograms:
+            self.comb += [
+                histogram.enable.eq(self.msm.running),
+                histogram.clear.eq(self.histogram_clear),
+                histogram.offset.eq(self.histogram_offset),
+                histogram.shift.eq(self.histogram_shift),
+            ]
 
         if not simulate:
             # To be able to trigger the pulse picker from both systems without
@@ -386,19 +1046,17 @@ class EntanglerCore(Module):
 
             # Connect output pads to sequencer output when enabled, otherwise use
             # the RTIO phy output
-            for i, (sequencer, pad, passthrough_sig) in enumerate(
-                zip(self.sequencers, output_pads, passthrough_sigs)
+            for i, (output, pad, passthrough_sig) in enumerate(
+                zip(self.outputs, output_pads, passthrough_sigs)
             ):
-                if i == SEQUENCER_IDX_422ps:
-                    local_422ps_out = Mux(
-                        self.enable, sequencer.output, passthrough_sig
-                    )
+                if i == sequencer_idx_422ps:
+                    local_422ps_out = Mux(self.enable, output, passthrough_sig)
                     passthrough_sig = passthrough_sig | (
                         slave_422ps_raw & self.msm.is_master
                     )
                 self.specials += Instance(
                     "OBUFDS",
-                    i_I=Mux(self.enable, sequencer.output, passthrough_sig),
+                    i_I=Mux(self.enable, output, passthrough_sig),
                     o_O=pad.p,
                     o_OB=pad.n,
                 )
@@ -408,9 +1066,9 @@ class EntanglerCore(Module):
             # not running.
             self.specials += Instance(
                 "OBUFDS",
-                i_I=Mux(self.msm.running, 1, passthrough_sigs[4]),
-                o_O=output_pads[4].p,
-                o_OB=output_pads[4].n,
+                i_I=Mux(self.msm.running, 1, passthrough_sigs[num_outputs]),
+                o_O=output_pads[num_outputs].p,
+                o_OB=output_pads[num_outputs].n,
             )
 
             def ts_buf(pad, sig_o, sig_i, en_out):
@@ -461,23 +1119,113 @@ class EntanglerCore(Module):
             )
             ts_buf(
                 core_link_pads[3],
-                self.msm.timeout,
+                self.msm.timeout_out,
                 self.msm.timeout_in_raw,
                 self.msm.is_master,
             )
 
         # Connect heralder inputs.
         self.comb += self.heralder.sig.eq(Cat(*(g.triggered for g in self.apd_gaters)))
+        if self.herald_lut is not None:
+            self.comb += self.herald_lut.sig.eq(self.heralder.sig)
 
         # Clear gater and sequencer state at start of each cycle
+        self.comb += [gater.clear.eq(self.msm.cycle_clear) for gater in self.apd_gaters]
         self.comb += [
-            gater.clear.eq(self.msm.cycle_starting) for gater in self.apd_gaters
+            sequencer.clear.eq(self.msm.cycle_clear) for sequencer in self.sequencers
         ]
+        if self.edge_sequencer is not None:
+            self.comb += self.edge_sequencer.clear.eq(self.msm.cycle_clear)
+
+        # Herald of the current excitation window, and what to report for it: the
+        # matching patterns, or the click pattern in herald lookup table mode.
+        if self.herald_lut is None:
+            window_herald = self.heralder.is_match
+            window_result = self.heralder.matches
+        else:
+            window_herald = Mux(
+                self.use_herald_lut, self.herald_lut.is_match, self.heralder.is_match
+            )
+            window_result = Mux(
+                self.use_herald_lut, self.herald_lut.sig, self.heralder.matches
+            )
+        result_width = max(num_inputs, num_patterns)
+
+        # Burst mode: up to ``burst_windows`` excitation/detection windows per cycle,
+        # each gated relative to its own reference edge. Each reference edge after
+        # the first closes the previous window, whose herald is then latched.
+        self.burst_windows = Signal(4)
+        self.window = Signal(4)  # Index of the current window
+        self.herald_window = Signal(4)  # Index of the window that heralded
+        self.herald_result = Signal(result_width)
+        burst_herald = Signal()
+        cycle_herald = burst_herald | window_herald
+        burst_window = Signal(4)
+        burst_result = Signal(result_width)
+        new_window = Signal()
         self.comb += [
-            sequencer.clear.eq(self.msm.cycle_starting) for sequencer in self.sequencers
+            new_window.eq(
+                phy_422pulse.stb_rising
+                & self.apd_gaters[0].got_ref
+                & (self.window + 1 < self.burst_windows)
+                & ~self.msm.cycle_clear
+            ),
+            self.herald_window.eq(Mux(burst_herald, burst_window, self.window)),
+            self.herald_result.eq(Mux(burst_herald, burst_result, window_result)),
+        ]
+        self.comb += [gater.new_window.eq(new_window) for gater in self.apd_gaters]
+        self.sync += [
+            If(self.msm.cycle_clear, self.window.eq(0), burst_herald.eq(0)).Elif(
+                new_window,
+                self.window.eq(self.window + 1),
+                If(
+                    window_herald & ~burst_herald,
+                    burst_herald.eq(1),
+                    burst_window.eq(self.window),
+                    burst_result.eq(window_result),
+                ),
+            )
         ]
 
-        self.comb += self.msm.herald.eq(self.heralder.is_match)
+        # Parameter scan over the cycles of a run. Heralds are only counted during a
+        # scan, and do not finish the run. The run is aborted once the scan is done.
+        if num_scan_points is None:
+            self.scan = None
+            self.comb += [
+                self.msm.herald.eq(cycle_herald),
+                self.msm.abort_stb.eq(self.abort_stb),
+            ]
+        else:
+            self.submodules.scan = ParameterScan(num_inputs, depth=num_scan_points)
+            self.comb += [
+                self.scan.start_stb.eq(self.msm.run_stb),
+                self.scan.stop.eq(self.msm.done_stb),
+                self.scan.cycle_stb.eq(self.msm.cycle_stb),
+                self.scan.herald.eq(cycle_herald),
+                self.msm.herald.eq(cycle_herald & ~self.scan.active),
+                self.msm.abort_stb.eq(self.abort_stb | self.scan.done_stb),
+            ]
+            self.comb += [
+                click.eq(gater.trigger_stb)
+                for click, gater in zip(self.scan.clicks, self.apd_gaters)
+            ]
+
+        # Trace of the cycles of the current run: cycle index, gater triggered flags,
+        # then the signal timestamps of each gater and the reference timestamp.
+        # The timestamps of gaters that did not trigger are stale.
+        if trace_depth is None:
+            self.trace = None
+        else:
+            self.submodules.trace = CycleTrace(
+                [self.msm.cycles_completed, self.heralder.sig]
+                + [gater.sig_ts for gater in self.apd_gaters]
+                + [self.apd_gaters[0].ref_ts],
+                depth=trace_depth,
+            )
+            self.comb += [
+                self.trace.write_stb.eq(self.trace_enable & self.msm.cycle_stb),
+                self.trace.clear.eq(self.msm.run_stb),
+            ]
 
         # 422ps trigger event counter. We use got_ref from the first gater for
         # convenience (any other channel would work just as well).
@@ -490,3 +1238,84 @@ class EntanglerCore(Module):
                 )
             )
         ]
+
+        # Long-run statistics, cleared at the start of each run: completed cycles,
+        # cycles with a 422ps trigger, gated clicks of each APD, and excitation
+        # windows matching each enabled herald pattern (checked at the end of the
+        # window).
+        self.n_cycles = Signal(48)
+        self.n_triggers = Signal(48)
+        self.n_clicks = [Signal(32) for _ in range(num_inputs)]
+        self.n_matches = [Signal(32) for _ in range(num_patterns)]
+        window_ending = Signal()
+        self.comb += window_ending.eq(new_window | self.msm.cycle_stb)
+        self.sync += If(
+            self.msm.run_stb,
+            self.n_cycles.eq(0),
+            self.n_triggers.eq(0),
+            *(n.eq(0) for n in self.n_clicks + self.n_matches),
+        ).Else(
+            If(
+                self.msm.cycle_stb,
+                self.n_cycles.eq(self.n_cycles + 1),
+                If(self.apd_gaters[0].got_ref, self.n_triggers.eq(self.n_triggers + 1)),
+            ),
+            *(
+                If(gater.trigger_stb, n.eq(n + 1))
+                for gater, n in zip(self.apd_gaters, self.n_clicks)
+            ),
+            *(
+                If(
+                    window_ending
+                    & self.heralder.matches[i]
+                    & self.heralder.pattern_ens[i],
+                    n.eq(n + 1),
+                )
+                for i, n in enumerate(self.n_matches)
+            ),
+        )
+
+        # Telemetry: every telemetry_interval cycles of a run (if not 0), pulse
+        # telemetry_stb and latch [cycles completed, triggers, clicks of each APD...]
+        # into telemetry. The trigger & click counts are since the previous
+        # telemetry_stb, and saturate at 14 bits.
+        self.telemetry_interval = Signal(14)
+        self.telemetry_stb = Signal()
+        self.telemetry = [Signal(14) for _ in range(num_inputs + 2)]
+        interval_cycles = Signal(14)
+        interval_counts = [Signal(14) for _ in range(num_inputs + 1)]
+        increments = [self.msm.cycle_stb & self.apd_gaters[0].got_ref]
+        increments += [gater.trigger_stb for gater in self.apd_gaters]
+        self.comb += self.telemetry_stb.eq(
+            self.msm.cycle_stb
+            & (self.telemetry_interval != 0)
+            & (interval_cycles + 1 == self.telemetry_interval)
+        )
+        self.sync += (
+            If(
+                self.msm.run_stb,
+                interval_cycles.eq(0),
+                *(count.eq(0) for count in interval_counts),
+            )
+            .Elif(
+                self.telemetry_stb,
+                interval_cycles.eq(0),
+                self.telemetry[0].eq(self.msm.cycles_completed + 1),
+                *(
+                    If(count != 0x3FFF, telemetry.eq(count + increment)).Else(
+                        telemetry.eq(count)
+                    )
+                    for telemetry, count, increment in zip(
+                        self.telemetry[1:], interval_counts, increments
+                    )
+                ),
+                *(count.eq(0) for count in interval_counts),
+            )
+            .Else(
+                If(self.msm.cycle_stb, interval_cycles.eq(interval_cycles + 1)),
+                *(
+                    If(increment & (count != 0x3FFF), count.eq(count + 1))
+                    for count, increment in zip(interval_counts, increments)
+                ),
+            )
+        )
@@ -4,17 +4,26 @@ NOTE: requires ARTIQ >= 5, for the
 :func:`artiq.coredevice.rtio.rtio_input_timestamped_data` RUST syscall.
 """
 import numpy as np
-from artiq.coredevice.rtio import rtio_input_data
 from artiq.coredevice.rtio import rtio_input_timestamped_data
 from artiq.coredevice.rtio import rtio_output
 from artiq.language.core import delay_mu
 from artiq.language.core import kernel
+from artiq.language.core import portable
+
+from entangler.address import address_index_width
+
+# Register addresses below are for the default build of 4 outputs & 4 APD inputs.
+# For other builds, use the address helpers of the :class:`Entangler` driver.
 
 # Write only
 ADDR_W_CONFIG = 0
 ADDR_W_RUN = 1
 ADDR_W_TCYCLE = 2
 ADDR_W_HERALD = 3
+ADDR_W_RUN_N = 4
+ADDR_W_NSUCCESSES = 5
+ADDR_W_EDGE = 6
+ADDR_W_NEDGES = 7
 
 # Output channel addresses
 sequencer_422sigma = 0b1000 + 0
@@ -31,17 +40,392 @@ ADDR_R_STATUS = 0b10000
 ADDR_R_NCYCLES = 0b10000 + 1
 ADDR_R_TIMEREMAINING = 0b10000 + 2
 ADDR_R_NTRIGGERS = 0b10000 + 3
+ADDR_R_HERALD_WINDOW = 0b10000 + 4
+ADDR_R_TRACE_COUNT = 0b10000 + 5
+ADDR_R_SCAN_COUNT = 0b10000 + 6
 timestamp_apd0 = 0b11000 + 0
 timestamp_apd1 = 0b11000 + 1
 timestamp_apd2 = 0b11000 + 2
 timestamp_apd3 = 0b11000 + 3
 timestamp_422ps = 0b11000 + 4
 
+# Extended registers, as offsets from :attr:`Entangler.addr_ext`
+EXT_W_HERALD_TABLE = 0
+EXT_W_BURST_WINDOWS = 1
+EXT_W_HISTOGRAM_CONFIG = 2
+EXT_W_HISTOGRAM_ADDR = 3
+EXT_R_HISTOGRAM = 4
+EXT_W_TRACE_ADDR = 5
+EXT_R_TRACE = 6
+EXT_W_STATISTICS_SNAPSHOT = 7
+EXT_R_STATISTICS = 8
+EXT_W_READ_BLOCK = 9
+EXT_W_TELEMETRY_INTERVAL = 10
+EXT_W_ABORT = 11
+EXT_W_CONFIG_TARGET = 12
+EXT_W_CONFIG_SLOT = 13
+EXT_W_CONFIG_COMMIT = 14
+EXT_W_SCAN_CONFIG = 15
+EXT_W_SCAN_POINTS = 16
+EXT_W_SCAN_ADDR = 17
+EXT_R_SCAN = 18
+EXT_W_HISTOGRAM_CLEAR = 19
+
+# Run result (instead of 0x3fff for a timeout) if the run was aborted
+ABORT = 0x3FFE
+
+# Tags of the input events, in the top 2 bits above the 14-bit data.
+# Must match entangler.phy
+TAG_EVENT = 0
+TAG_READ = 1
+TAG_REPORT = 2
+TAG_TELEMETRY = 3
+
+# Number of core events / completion report words that can be set aside while
+# waiting for a read response
+MAX_PENDING_EVENTS = 32
+
+# Number of read requests to queue before draining their replies from the input FIFO
+READ_BATCH = 32
+
+
+def herald_table_words(patterns, num_inputs=4, care_masks=None):
+    """Build the herald lookup table words for :meth:`Entangler.set_herald_table`.
+
+    Args:
+        patterns: list of heralding click patterns (see :meth:`Entangler.set_heralds`).
+        num_inputs (int, optional): Number of APD inputs the gateware was built
+            with. Defaults to 4.
+        care_masks (optional): list of bitmasks of the inputs to check for each
+            pattern. Inputs not in the mask are "don't care", i.e. the pattern
+            matches whether or not they clicked. Defaults to checking all inputs.
+
+    Returns:
+        List of 32-bit table words, least significant first.
+    """
+    all_inputs = (1 << num_inputs) - 1
+    if care_masks is None:
+        care_masks = [all_inputs] * len(patterns)
+    assert len(care_masks) == len(patterns)
+    table = 0
+    for clicks in range(1 << num_inputs):
+        for pattern, care_mask in zip(patterns, care_masks):
+            if (clicks ^ pattern) & care_mask & all_inputs == 0:
+                table |= 1 << clicks
+                break
+    n_words = max(1, (1 << num_inputs) // 32)
+    return [(table >> (32 * i)) & 0xFFFFFFFF for i in range(n_words)]
+
+
+class EntanglerConfig:
+    """Complete ``Entangler`` configuration, prepared on the host.
+
+    The setters mirror those of :class:`Entangler`, but validate their arguments
+    (raising :class:`ValueError` instead of truncating them to the register
+    width) and compute the register words on the host. :meth:`to_array` then gives
+    all the writes, to be uploaded by :meth:`Entangler.upload_config` in a single
+    loop without any kernel arithmetic.
+
+    Setting a register again replaces its previous value. The config register
+    (:meth:`set_config`) is always written last, so the core is only enabled once
+    the other registers are loaded.
+    """
+
+    def __init__(
+        self,
+        is_master=True,
+        num_outputs=4,
+        num_inputs=4,
+        num_patterns=4,
+        edge_depth=0,
+        num_scan_points=0,
+        herald_lut=False,
+        coarse_period_mu=8,
+    ):
+        """Create an empty configuration for an ``Entangler`` gateware build.
+
+        Args:
+            is_master (bool, optional): Is the device the sequencer master or the
+                slave. Defaults to True.
+            num_outputs (int, optional): Number of sequencer outputs the gateware
+                was built with. Defaults to 4.
+            num_inputs (int, optional): Number of APD inputs the gateware was built
+                with. Defaults to 4.
+            num_patterns (int, optional): Number of herald patterns the gateware was
+                built with. Defaults to 4.
+            edge_depth (int, optional): Number of entries of the edge sequencer
+                table the gateware was built with, 0 if built without the edge
+                sequencer. Defaults to 0.
+            num_scan_points (int, optional): Maximum number of points of a parameter
+                scan the gateware was built with, 0 if built without parameter
+                scans. Defaults to 0.
+            herald_lut (bool, optional): Was the gateware built with the herald
+                lookup table. Defaults to False.
+            coarse_period_mu (int, optional): Coarse clock period, in mu. Defaults
+                to 8.
+        """
+        self.is_master = is_master
+        self.num_outputs = num_outputs
+        self.num_inputs = num_inputs
+        self.num_patterns = num_patterns
+        self.edge_depth = edge_depth
+        self.num_scan_points = num_scan_points
+        self.herald_lut = herald_lut
+        self.coarse_period_mu = coarse_period_mu
+
+        index_width = address_index_width(num_outputs, num_inputs)
+        self.addr_timing = 1 << index_width
+        self.addr_ext = 4 << index_width
+
+        # (address, word) writes of each register, in the order they were first set
+        self._writes = {}
+        self.set_config()
+
+    def sequencer_address(self, i):
+        """Address of the timing register of sequencer output ``i``."""
+        return self.addr_timing + i
+
+    def gate_address(self, i):
+        """Address of the gate timing register of APD input ``i``."""
+        return self.addr_timing + self.num_outputs + i
+
+    def _coarse(self, t_mu, name):
+        """Convert a time in mu to coarse clock cycles, which must be exact."""
+        if t_mu % self.coarse_period_mu:
+            raise ValueError(
+                "{} ({} mu) is not a multiple of the coarse clock period".format(
+                    name, t_mu
+                )
+            )
+        return t_mu // self.coarse_period_mu
+
+    @staticmethod
+    def _check_range(value, max_value, name):
+        if not 0 <= value <= max_value:
+            raise ValueError(
+                "{} must be in [0, {}], not {}".format(name, max_value, value)
+            )
+
+    def set_config(
+        self,
+        enable=False,
+        standalone=False,
+        pipelined=False,
+        early_exit=False,
+        edge_sequencer=False,
+        herald_lut=False,
+        trace=False,
+        report=False,
+        shadow=False,
+    ):
+        """Set the config register, see :meth:`Entangler.set_config`."""
+        if edge_sequencer and not self.edge_depth:
+            raise ValueError("The gateware was built without the edge sequencer")
+        if herald_lut and not self.herald_lut:
+            raise ValueError("The gateware was built without the herald table")
+        flags = [
+            enable,
+            self.is_master,
+            standalone,
+            pipelined,
+            early_exit,
+            edge_sequencer,
+            herald_lut,
+            trace,
+            report,
+            shadow,
+        ]
+        data = sum(1 << i for i, flag in enumerate(flags) if flag)
+        self._writes["config"] = [(ADDR_W_CONFIG, data)]
+
+    def set_timing_mu(self, channel, t_start_mu, t_stop_mu):
+        """Set output channel or gate times, see :meth:`Entangler.set_timing_mu`.
+
+        Output channel times must be multiples of the coarse clock period.
+        """
+        if (
+            not self.sequencer_address(0)
+            <= channel
+            < self.gate_address(self.num_inputs)
+        ):
+            raise ValueError("Invalid timing channel address {}".format(channel))
+        if channel < self.gate_address(0):
+            t_start_mu = self._coarse(t_start_mu, "t_start_mu")
+            t_stop_mu = self._coarse(t_stop_mu, "t_stop_mu")
+        self._check_range(t_start_mu + 1, 0x3FFF, "t_start_mu + 1")
+        self._check_range(t_stop_mu + 1, 0x3FFF, "t_stop_mu + 1")
+        self._writes[("timing", channel)] = [
+            (channel, ((t_stop_mu + 1) << 16) | (t_start_mu + 1))
+        ]
+
+    def set_cycle_length_mu(self, t_cycle_mu):
+        """Set the entanglement cycle length, see :meth:`Entangler.set_cycle_length_mu`.
+
+        The cycle length must be a multiple of the coarse clock period.
+        """
+        t_cycle = self._coarse(t_cycle_mu, "t_cycle_mu")
+        self._check_range(t_cycle, (1 << 10) - 1, "cycle length in coarse cycles")
+        self._writes["cycle_length"] = [(ADDR_W_TCYCLE, t_cycle)]
+
+    def set_heralds(self, heralds):
+        """Set the herald patterns, see :meth:`Entangler.set_heralds`."""
+        if len(heralds) > self.num_patterns:
+            raise ValueError(
+                "At most {} herald patterns, not {}".format(
+                    self.num_patterns, len(heralds)
+                )
+            )
+        for herald in heralds:
+            self._check_range(herald, (1 << self.num_inputs) - 1, "herald pattern")
+        patterns_per_word = 16 // self.num_inputs
+        n_words = -(-self.num_patterns // patterns_per_word)
+        writes = []
+        for word in range(n_words):
+            data = word << 24
+            for j in range(patterns_per_word):
+                i = word * patterns_per_word + j
+                if i < len(heralds):
+                    data |= heralds[i] << (self.num_inputs * j)
+                    data |= 1 << (16 + j)
+            writes.append((ADDR_W_HERALD, data))
+        self._writes["heralds"] = writes
+
+    def set_edges_mu(self, times_mu, channel_masks, levels):
+        """Set the edge sequencer program, see :meth:`Entangler.set_edges_mu`.
+
+        Edge times must be multiples of the coarse clock period.
+        """
+        if not self.edge_depth:
+            raise ValueError("The gateware was built without the edge sequencer")
+        if not len(times_mu) == len(channel_masks) == len(levels):
+            raise ValueError("times_mu, channel_masks & levels differ in length")
+        if len(times_mu) > self.edge_depth:
+            raise ValueError("At most {} edges".format(self.edge_depth))
+        writes = [(ADDR_W_NEDGES, len(times_mu))]
+        t_last = -1
+        for t_mu, mask, level in zip(times_mu, channel_masks, levels):
+            t = self._coarse(t_mu, "edge time")
+            if t <= t_last:
+                raise ValueError("Edge times must be strictly increasing")
+            t_last = t
+            self._check_range(t + 1, 0xFFFF, "edge time + 1")
+            self._check_range(mask, (1 << self.num_outputs) - 1, "channel mask")
+            data = (t + 1) | (mask << 16) | ((1 << 31) if level else 0)
+            writes.append((ADDR_W_EDGE, data))
+        self._writes["edges"] = writes
+
+    def set_herald_table(self, table_words):
+        """Set the herald lookup table, see :meth:`Entangler.set_herald_table`."""
+        if not self.herald_lut:
+            raise ValueError("The gateware was built without the herald table")
+        n_words = max(1, (1 << self.num_inputs) // 32)
+        if len(table_words) != n_words:
+            raise ValueError("The herald table has {} words".format(n_words))
+        for word in table_words:
+            self._check_range(word, 0xFFFFFFFF, "herald table word")
+        addr = self.addr_ext + EXT_W_HERALD_TABLE
+        self._writes["herald_table"] = [(addr, word) for word in table_words]
+
+    def set_burst_windows(self, n_windows):
+        """Set the windows per cycle, see :meth:`Entangler.set_burst_windows`."""
+        self._check_range(n_windows, 15, "n_windows")
+        addr = self.addr_ext + EXT_W_BURST_WINDOWS
+        self._writes["burst_windows"] = [(addr, n_windows)]
+
+    def set_telemetry_interval(self, n_cycles):
+        """Set the telemetry interval, see :meth:`Entangler.set_telemetry_interval`."""
+        self._check_range(n_cycles, 0x3FFF, "n_cycles")
+        addr = self.addr_ext + EXT_W_TELEMETRY_INTERVAL
+        self._writes["telemetry_interval"] = [(addr, n_cycles)]
+
+    def set_scan_mu(
+        self,
+        channel,
+        step_mu,
+        n_points,
+        cycles_per_point,
+        step_start=True,
+        step_stop=True,
+    ):
+        """Set up a parameter scan, see :meth:`Entangler.set_scan_mu`.
+
+        Output channel steps must be multiples of the coarse clock period.
+        """
+        if not self.num_scan_points:
+            raise ValueError("The gateware was built without parameter scans")
+        if (
+            not self.sequencer_address(0)
+            <= channel
+            < self.gate_address(self.num_inputs)
+        ):
+            raise ValueError("Invalid timing channel address {}".format(channel))
+        if channel < self.gate_address(0):
+            step_mu = self._coarse(step_mu, "step_mu")
+        if not -(1 << 15) <= step_mu < (1 << 15):
+            raise ValueError("step_mu out of range: {}".format(step_mu))
+        self._check_range(n_points, self.num_scan_points, "n_points")
+        self._check_range(cycles_per_point, 0x3FFF, "cycles_per_point")
+        if n_points and not cycles_per_point:
+            raise ValueError("cycles_per_point must be at least 1")
+        data = ((step_mu & 0xFFFF) << 16) | (channel - self.addr_timing)
+        data |= (int(step_start) << 8) | (int(step_stop) << 9)
+        self._writes["scan"] = [
+            (self.addr_ext + EXT_W_SCAN_CONFIG, data),
+            (self.addr_ext + EXT_W_SCAN_POINTS, (n_points << 16) | cycles_per_point),
+        ]
+
+    @staticmethod
+    def _pack(writes):
+        """Pack (address, word) writes as a flat ``int32`` array."""
+        return np.array(writes, dtype=np.int64).astype(np.uint32).view(np.int32).ravel()
+
+    def to_array(self):
+        """Get all the register writes of the configuration.
+
+        Returns:
+            flat :class:`numpy.ndarray` of ``int32`` (address, word) pairs, i.e.
+            ``[address_0, word_0, address_1, word_1, ...]``. Words are stored as
+            their 32-bit two's complement, as written by :meth:`Entangler.write`.
+        """
+        writes = [w for key, ws in self._writes.items() if key != "config" for w in ws]
+        writes += self._writes["config"]
+        return self._pack(writes)
+
+    def to_slot_array(self):
+        """Get the register writes of the configuration that config slots hold.
+
+        Config slots hold the timing registers, herald patterns and cycle length
+        (see :meth:`Entangler.store_config_slot`); the other registers are left out.
+
+        Returns:
+            flat :class:`numpy.ndarray` of ``int32`` (address, word) pairs, as
+            :meth:`to_array`.
+        """
+        writes = []
+        for key, ws in self._writes.items():
+            if key in ("heralds", "cycle_length") or key[0] == "timing":
+                writes += ws
+        return self._pack(writes)
+
 
 class Entangler:
     """Sequences remote entanglement experiments between a master and a slave."""
 
-    def __init__(self, dmgr, channel, is_master=True, core_device="core"):
+    def __init__(
+        self,
+        dmgr,
+        channel,
+        is_master=True,
+        core_device="core",
+        max_heralds=256,
+        num_outputs=4,
+        num_inputs=4,
+        num_patterns=4,
+        num_histogram_bins=0,
+        trace_depth=0,
+        num_config_slots=0,
+        num_scan_points=0,
+    ):
         """Fast sequencer for generating remote entanglement.
 
         Args:
@@ -50,12 +434,111 @@ class Entangler:
             is_master (bool, optional): Is this Kasli the sequencer master or the
                 slave. Defaults to True.
             core_device (str, optional): Core device name. Defaults to "core".
+            max_heralds (int, optional): Maximum number of heralds that can be
+                recorded by a single :meth:`run_n_mu` call. Defaults to 256.
+            num_outputs (int, optional): Number of sequencer outputs the gateware
+                was built with. Defaults to 4.
+            num_inputs (int, optional): Number of APD inputs the gateware was built
+                with. Defaults to 4.
+            num_patterns (int, optional): Number of herald patterns the gateware was
+                built with. Defaults to 4.
+            num_histogram_bins (int, optional): Number of arrival time histogram
+                bins per APD input the gateware was built with, 0 if built without
+                histograms. Defaults to 0.
+            trace_depth (int, optional): Number of cycles recorded by the cycle
+                trace of the gateware, 0 if built without the trace. Defaults to 0.
+            num_config_slots (int, optional): Number of config slots the gateware
+                was built with. Defaults to 0.
+            num_scan_points (int, optional): Maximum number of points of a parameter
+                scan the gateware was built with, 0 if built without parameter
+                scans. Defaults to 0.
         """
         self.core = dmgr.get(core_device)
         self.channel = channel
         self.is_master = is_master
         self.ref_period_mu = self.core.seconds_to_mu(self.core.coarse_ref_period)
 
+        self.num_outputs = num_outputs
+        self.num_inputs = num_inputs
+        self.num_patterns = num_patterns
+        self.num_histogram_bins = num_histogram_bins
+        self.histogram_counts = np.zeros(
+            num_inputs * num_histogram_bins, dtype=np.int32
+        )
+        self.histogram_words = np.zeros(2 * len(self.histogram_counts), dtype=np.int32)
+        # Trace records are [cycle, triggered, apd timestamps..., ref timestamp]
+        self.trace_depth = trace_depth
+        self.trace_words = np.zeros(trace_depth * (num_inputs + 3), dtype=np.int32)
+        # Statistics counters are [cycles, triggers, time remaining, clicks of each
+        # APD..., matches of each pattern...], read as 14-bit words
+        self.statistics_n_words = [4, 4, 3] + [3] * (num_inputs + num_patterns)
+        self.statistics_words = np.zeros(sum(self.statistics_n_words), dtype=np.int32)
+        self.statistics = np.zeros(len(self.statistics_n_words), dtype=np.int64)
+        self.num_config_slots = num_config_slots
+        # Scan records are [heralded cycles, clicks of each APD...] for each point
+        self.num_scan_points = num_scan_points
+        self.scan_words = np.zeros(num_scan_points * (num_inputs + 1), dtype=np.int32)
+        self.trace_dtype = np.dtype(
+            [
+                ("cycle", np.int32),
+                ("triggered", np.int32),
+                ("timestamps_mu", np.int32, (num_inputs,)),
+                ("ref_timestamp_mu", np.int32),
+            ]
+        )
+
+        index_width = address_index_width(num_outputs, num_inputs)
+        self.addr_timing = 1 << index_width
+        self.addr_r_status = 2 << index_width
+        self.addr_r_ncycles = self.addr_r_status + 1
+        self.addr_r_timeremaining = self.addr_r_status + 2
+        self.addr_r_ntriggers = self.addr_r_status + 3
+        self.addr_r_herald_window = self.addr_r_status + 4
+        self.addr_r_trace_count = self.addr_r_status + 5
+        self.addr_r_scan_count = self.addr_r_status + 6
+        self.addr_timestamp = 3 << index_width
+        self.addr_ext = 4 << index_width
+
+        self.max_heralds = max_heralds
+        self.herald_timestamps_mu = np.zeros(max_heralds, dtype=np.int64)
+        self.herald_patterns = np.zeros(max_heralds, dtype=np.int32)
+        # Core events & completion report words received while waiting for a read
+        # response, in a ring buffer
+        self.pending_timestamps_mu = np.zeros(MAX_PENDING_EVENTS, dtype=np.int64)
+        self.pending_data = np.zeros(MAX_PENDING_EVENTS, dtype=np.int32)
+        self.pending_start = 0
+        self.n_pending = 0
+
+        # Last telemetry record: [cycles, triggers, clicks of each APD...]
+        self.telemetry = np.zeros(num_inputs + 2, dtype=np.int32)
+        self.telemetry_words = np.zeros(num_inputs + 2, dtype=np.int32)
+        self.telemetry_idx = 0
+        self.telemetry_timestamp_mu = np.int64(0)
+        self.n_telemetry = 0
+
+        # Input timestamps: [apd0, apd1, ..., 422ps]
+        self.timestamps_mu = np.zeros(num_inputs + 1, dtype=np.int32)
+        # Completion report: [reason, ncycles, ntriggers, timestamps...]
+        self.report = np.zeros(num_inputs + 4, dtype=np.int32)
+
+    @portable
+    def sequencer_address(self, i):
+        """Address of the timing register of sequencer output ``i``."""
+        return self.addr_timing + i
+
+    @portable
+    def gate_address(self, i):
+        """Address of the gate timing register of APD input ``i``."""
+        return self.addr_timing + self.num_outputs + i
+
+    @portable
+    def timestamp_address(self, i):
+        """Address of the timestamp of APD input ``i``.
+
+        ``i = num_inputs`` is the timestamp of the reference (422ps) input.
+        """
+        return self.addr_timestamp + i
+
     @kernel
     def init(self):
         """Initialize the ``Entangler`` core gateware settings."""
@@ -74,6 +557,20 @@ class Entangler:
         rtio_output((self.channel << 8) | addr, value)
         delay_mu(self.ref_period_mu)
 
+    @kernel
+    def upload_config(self, pairs):
+        """Write all the registers of a configuration.
+
+        This method advances the timeline by one coarse RTIO cycle per register
+        write.
+
+        Args:
+            pairs: flat array of (address, word) pairs, from
+                :meth:`EntanglerConfig.to_array`.
+        """
+        for i in range(0, len(pairs), 2):
+            self.write(pairs[i], pairs[i + 1])
+
     @kernel
     def read(self, addr):
         """Read parameter.
@@ -88,10 +585,193 @@ class Entangler:
 
         """
         rtio_output((self.channel << 8) | addr, 0)
-        return rtio_input_data(self.channel)
+        return self.read_data()
 
     @kernel
-    def set_config(self, enable=False, standalone=False):
+    def receive(self, timeout_mu):
+        """Get the next input event, and dispatch it by its tag.
+
+        Telemetry words are collected into :attr:`telemetry`, core events and
+        completion report words are set aside for :meth:`next_event`.
+
+        Args:
+            timeout_mu: RTIO time until which to wait for an event, ``-1`` to wait
+                forever, ``0`` to not wait.
+
+        Returns:
+            The 14-bit data of a read response, -1 if the event was set aside, or
+            -2 if there was no event before ``timeout_mu``.
+        """
+        # pylint: disable=no-name-in-module
+        timestamp, data = rtio_input_timestamped_data(timeout_mu, self.channel)
+        if timestamp < 0:
+            return -2
+        tag = data >> 14
+        if tag == TAG_READ:
+            return data & 0x3FFF
+        if tag == TAG_TELEMETRY:
+            self.telemetry_words[self.telemetry_idx] = data & 0x3FFF
+            self.telemetry_idx += 1
+            if self.telemetry_idx == len(self.telemetry_words):
+                self.telemetry_idx = 0
+                for i in range(len(self.telemetry)):
+                    self.telemetry[i] = self.telemetry_words[i]
+                self.telemetry_timestamp_mu = timestamp
+                self.n_telemetry += 1
+            return -1
+        assert self.n_pending < MAX_PENDING_EVENTS
+        i = (self.pending_start + self.n_pending) % MAX_PENDING_EVENTS
+        self.pending_timestamps_mu[i] = timestamp
+        self.pending_data[i] = data
+        self.n_pending += 1
+        return -1
+
+    @kernel
+    def read_data(self):
+        """Get the next register read response from the input FIFO.
+
+        Other input events that arrive first are dispatched by :meth:`receive`, so
+        registers can be read while the core is running. Read responses arrive in
+        the order the reads were issued, also for reads issued while a
+        :meth:`read_block` burst is in progress: the gateware queues them until
+        the burst is done (so they read the registers as they are then).
+
+        This method does not advance the timeline but consumes all slack.
+        """
+        while True:
+            data = self.receive(np.int64(-1))
+            if data >= 0:
+                return data
+
+    @kernel
+    def next_event(self):
+        """Get the next core event or completion report word.
+
+        Events set aside by :meth:`receive` are returned first.
+
+        This method does not advance the timeline but consumes all slack.
+
+        Returns:
+            tuple of [timestamp, data]. The timestamp is the RTIO time of the event,
+            and the data its 14-bit payload (e.g. the herald matches, or 0x3fff on
+            timeout).
+        """
+        timestamp, _, data = self.next_tagged_event()
+        return timestamp, data
+
+    @kernel
+    def next_tagged_event(self):
+        """Get the next core event or completion report word, with its tag.
+
+        As :meth:`next_event`, but also returns the tag of the event, to tell core
+        events (:data:`TAG_EVENT`) from completion report words
+        (:data:`TAG_REPORT`).
+
+        This method does not advance the timeline but consumes all slack.
+
+        Returns:
+            tuple of [timestamp, tag, data].
+        """
+        while self.n_pending == 0:
+            self.receive(np.int64(-1))
+        timestamp = self.pending_timestamps_mu[self.pending_start]
+        data = self.pending_data[self.pending_start]
+        self.pending_start = (self.pending_start + 1) % MAX_PENDING_EVENTS
+        self.n_pending -= 1
+        return timestamp, data >> 14, data & 0x3FFF
+
+    @kernel
+    def poll_telemetry(self):
+        """Process the input events received so far, without blocking.
+
+        Telemetry is sent by the core every ``n_cycles`` set by
+        :meth:`set_telemetry_interval`. The last complete record is kept in
+        :attr:`telemetry` (see :meth:`set_telemetry_interval`), with its RTIO time
+        in :attr:`telemetry_timestamp_mu`.
+
+        This method does not advance the timeline.
+
+        Returns:
+            True if a new telemetry record was received.
+        """
+        n_telemetry = self.n_telemetry
+        self.receive_all()
+        return self.n_telemetry != n_telemetry
+
+    @kernel
+    def receive_all(self):
+        """Dispatch all the input events received so far (see :meth:`receive`).
+
+        This method does not advance the timeline, and does not block.
+        """
+        while self.receive(np.int64(0)) != -2:
+            pass
+
+    @kernel
+    def read_stream(self, addr, words, n):
+        """Read ``n`` consecutive words from an auto-incrementing read register.
+
+        The read requests are issued in batches of :data:`READ_BATCH`, so the
+        readout takes one round trip per batch instead of one per word.
+
+        This method advances the timeline by one coarse RTIO cycle per word, and
+        consumes all slack.
+
+        Args:
+            addr: address of the read register.
+            words: array to store the words in, at least ``n`` long.
+            n: number of words to read.
+        """
+        addr = (self.channel << 8) | addr
+        i = 0
+        while i < n:
+            n_batch = min(READ_BATCH, n - i)
+            for _ in range(n_batch):
+                rtio_output(addr, 0)
+                delay_mu(self.ref_period_mu)
+            for j in range(n_batch):
+                words[i + j] = self.read_data()
+            i += n_batch
+
+    @kernel
+    def read_block(self, addr, n, words):
+        """Read ``n`` consecutive registers, starting from ``addr``.
+
+        The gateware streams the registers back to back in response to a single
+        request, so this takes one round trip per :data:`READ_BATCH` registers
+        instead of one per register. Only the status & timestamp registers can be
+        read this way. Reads issued before the burst is done are answered after
+        it, in order (see :meth:`read_data`).
+
+        This method advances the timeline by one coarse RTIO cycle per batch, and
+        consumes all slack.
+
+        Args:
+            addr: address of the first register, e.g. ``timestamp_apd0``.
+            n: number of registers to read.
+            words: array to store the register values in, at least ``n`` long.
+        """
+        i = 0
+        while i < n:
+            n_batch = min(READ_BATCH, n - i)
+            self.write(self.addr_ext + EXT_W_READ_BLOCK, (n_batch << 16) | (addr + i))
+            for j in range(n_batch):
+                words[i + j] = self.read_data()
+            i += n_batch
+
+    @kernel
+    def set_config(
+        self,
+        enable=False,
+        standalone=False,
+        pipelined=False,
+        early_exit=False,
+        edge_sequencer=False,
+        herald_lut=False,
+        trace=False,
+        report=False,
+        shadow=False,
+    ):
         """Configure the core gateware.
 
         Args:
@@ -100,6 +780,30 @@ class Entangler:
                 parameters are not set.
             standalone: don't attempt synchronization with partner, just run when
                 ready. Used for testing and single-trap mode.
+            pipelined: run cycles back-to-back, without idle clock cycles between
+                them. The herald is then checked one coarse clock cycle before the
+                end of the cycle, so the gate windows must close before then.
+                Must be set identically on master and slave.
+            early_exit: finish the run as soon as a herald pattern is matched,
+                instead of waiting for the end of the cycle. This reduces the latency
+                between the herald and :meth:`run_mu` returning. Must be set
+                identically on master and slave.
+            edge_sequencer: drive the outputs from the edge table loaded with
+                :meth:`set_edges_mu`, instead of the start/stop times set with
+                :meth:`set_timing_mu`.
+            herald_lut: herald using the lookup table loaded with
+                :meth:`set_herald_table`, instead of the patterns set with
+                :meth:`set_heralds`. The run result is then the click pattern,
+                instead of the bitfield of matching patterns.
+            trace: record each cycle of a run in the cycle trace, see
+                :meth:`read_trace`.
+            report: follow the end-of-run input event with a completion report,
+                see :meth:`run_report_mu`. Do not read registers while a report
+                may be sent.
+            shadow: hold the writes of the timing, herald & cycle length registers
+                until :meth:`commit_config`, which applies them all at once at the
+                next cycle boundary. This allows changing them during a run without
+                tearing a cycle. Otherwise, they take effect immediately.
         """
         data = 0
         if enable:
@@ -108,6 +812,20 @@ class Entangler:
             data |= 1 << 1
         if standalone:
             data |= 1 << 2
+        if pipelined:
+            data |= 1 << 3
+        if early_exit:
+            data |= 1 << 4
+        if edge_sequencer:
+            data |= 1 << 5
+        if herald_lut:
+            data |= 1 << 6
+        if trace:
+            data |= 1 << 7
+        if report:
+            data |= 1 << 8
+        if shadow:
+            data |= 1 << 9
         self.write(ADDR_W_CONFIG, data)
 
     @kernel
@@ -126,7 +844,7 @@ class Entangler:
         length. If the stop is before the start, the pulse stops at the cycle
         length. If the start is after the cycle length there is no pulse.
         """
-        if channel < gate_apd0:
+        if channel < self.gate_address(0):
             t_start_mu = t_start_mu >> 3
             t_stop_mu = t_stop_mu >> 3
 
@@ -138,6 +856,39 @@ class Entangler:
         t_stop_mu &= 0x3FFF
         self.write(channel, (t_stop_mu << 16) | t_start_mu)
 
+    @kernel
+    def set_edges_mu(self, times_mu, channel_masks, levels):
+        """Load a whole program into the edge-list sequencer.
+
+        The edge-list sequencer is used instead of the per-channel start/stop times
+        (:meth:`set_timing_mu`) if ``edge_sequencer`` is set in :meth:`set_config`.
+        It allows any number of pulses per output channel.
+
+        Each edge sets the output channels selected by a bitmask (bit ``i`` is
+        output channel ``i``, e.g. ``sequencer_422sigma - 0b1000``) to a level, at a
+        time relative to the start of the entanglement cycle. Times are in machine
+        units, with coarse clock (8ns) resolution, and must be strictly increasing.
+        Simultaneous edges on different channels with the same level must be
+        combined into one edge.
+
+        This method advances the timeline by one coarse RTIO cycle per edge, plus
+        one.
+
+        Args:
+            times_mu: list of edge times, in machine units.
+            channel_masks: list of bitmasks of the output channels for each edge.
+            levels: list of output levels (0 or 1) for each edge.
+        """
+        n_edges = len(times_mu)
+        assert len(channel_masks) == n_edges and len(levels) == n_edges
+        self.write(ADDR_W_NEDGES, n_edges)
+        for i in range(n_edges):
+            t_mu = ((times_mu[i] >> 3) + 1) & 0xFFFF
+            data = t_mu | ((channel_masks[i] & 0x7FFF) << 16)
+            if levels[i]:
+                data |= 1 << 31
+            self.write(ADDR_W_EDGE, data)
+
     @kernel
     def set_timing(self, channel, t_start, t_stop):
         """Set the output channel timing and relative gate times.
@@ -171,25 +922,337 @@ class Entangler:
     def set_heralds(self, heralds):
         """Set the count patterns that cause the entangler loop to exit.
 
-        Up to 4 patterns can be set.
-        Each pattern is a 4 bit number, with the order (LSB first)
-        apd1_a, apd1_b, apd2_a, apd2_b.
+        Up to ``num_patterns`` (by default 4) patterns can be set.
+        Each pattern is a ``num_inputs`` bit number, by default with the order
+        (LSB first) apd1_a, apd1_b, apd2_a, apd2_b.
         E.g. to set a herald on apd1_a only: set_heralds(0b0001)
         to herald on apd1_b, apd2_b: set_heralds(0b1010)
         To herald on both: set_heralds(0b0001, 0b1010).
+
+        The patterns are written in as many words as needed to hold
+        ``num_patterns`` patterns (one word for the default build), advancing the
+        timeline by one coarse RTIO cycle per word.
         """
-        data = 0
-        assert len(heralds) <= 4
-        for i in range(len(heralds)):
-            data |= (heralds[i] & 0xF) << (4 * i)
-            data |= 1 << (16 + i)
-        self.write(ADDR_W_HERALD, data)
+        assert len(heralds) <= self.num_patterns
+        pattern_mask = (1 << self.num_inputs) - 1
+        patterns_per_word = 16 // self.num_inputs
+        n_words = (self.num_patterns + patterns_per_word - 1) // patterns_per_word
+        for word in range(n_words):
+            data = word << 24
+            for j in range(patterns_per_word):
+                i = word * patterns_per_word + j
+                if i < len(heralds):
+                    data |= (heralds[i] & pattern_mask) << (self.num_inputs * j)
+                    data |= 1 << (16 + j)
+            self.write(ADDR_W_HERALD, data)
+
+    @kernel
+    def set_herald_table(self, table_words):
+        """Set the lookup table of click patterns that cause the loop to exit.
+
+        The lookup table is used instead of the patterns set by :meth:`set_heralds`
+        if ``herald_lut`` is set in :meth:`set_config`. It has one bit for each of
+        the ``2 ** num_inputs`` possible click patterns, so any set of heralding
+        patterns can be enabled at once.
+
+        This method advances the timeline by one coarse RTIO cycle per word.
+
+        Args:
+            table_words: the table, as a list of 32-bit words, least significant
+                first. Use :func:`herald_table_words` to build it.
+        """
+        for i in range(len(table_words)):
+            self.write(self.addr_ext + EXT_W_HERALD_TABLE, table_words[i])
+
+    @kernel
+    def set_burst_windows(self, n_windows):
+        """Set the number of excitation/detection windows per entanglement cycle.
+
+        In each cycle, the first ``n_windows`` reference (422ps) pulses each start
+        their own detection window, with the gate times set by
+        :meth:`set_timing_mu`. The herald is checked separately for each window, at
+        the next reference pulse or at the end of the cycle, and the run succeeds
+        if any window heralds. This shares the per-cycle overhead (cooling, state
+        preparation) between several attempts.
+        Use :meth:`get_herald_window` to find which window heralded.
+
+        This method advances the timeline by one coarse RTIO cycle.
+
+        Args:
+            n_windows: number of windows per cycle, 1-15. 1 (or 0) gives the
+                default behaviour of one window per cycle.
+        """
+        self.write(self.addr_ext + EXT_W_BURST_WINDOWS, n_windows)
+
+    @kernel
+    def set_telemetry_interval(self, n_cycles):
+        """Set the number of cycles between telemetry records.
+
+        During a run, the core then sends a telemetry record every ``n_cycles``
+        cycles, which is collected by :meth:`poll_telemetry` (or whenever the
+        driver waits for input events). :attr:`telemetry` holds the last record:
+        the number of cycles completed (14 bits, rolls over), then the number of
+        422ps triggers and of gated clicks of each APD since the previous record
+        (saturating at 0x3fff). This allows e.g. ending a run early if the
+        trigger rate collapses.
+
+        The interval must be long enough for each record (``num_inputs + 2``
+        coarse clock cycles) to be sent before the next one.
+
+        This method advances the timeline by one coarse RTIO cycle.
+
+        Args:
+            n_cycles: number of cycles between records, 0 to disable telemetry.
+        """
+        self.write(self.addr_ext + EXT_W_TELEMETRY_INTERVAL, n_cycles)
+
+    @kernel
+    def set_scan_mu(
+        self,
+        channel,
+        step_mu,
+        n_points,
+        cycles_per_point,
+        step_start=True,
+        step_stop=True,
+    ):
+        """Set up a parameter scan, run by the gateware over the cycles of a run.
+
+        Each following run steps the start and/or stop time of a timing register (see
+        :meth:`set_timing_mu`) by ``step_mu`` every ``cycles_per_point`` cycles, for
+        ``n_points`` points, starting from the time set by :meth:`set_timing_mu`.
+        The number of heralded cycles and of gated clicks of each APD are recorded
+        for each point, and read by :meth:`read_scan`. Heralds do not finish a run
+        during a scan: the run is aborted once the scan is done (:meth:`run_mu` then
+        returns :data:`ABORT`), and the timing register is restored. Set
+        ``n_points`` to 0 to go back to normal runs.
+
+        On a master/slave pair, scan on the master, whose abort also stops the slave.
+
+        This method advances the timeline by two coarse RTIO cycles.
+
+        Args:
+            channel: timing register to step, e.g. ``gate_apd0``, as for
+                :meth:`set_timing_mu`.
+            step_mu: step between points, in mu (can be negative). Output channel
+                times have coarse clock resolution.
+            n_points: number of points, at most ``num_scan_points``, or 0 to disable
+                scans.
+            cycles_per_point: number of cycles of each point (1 to 0x3fff).
+            step_start: step the start time of the register.
+            step_stop: step the stop time of the register.
+        """
+        if channel < self.gate_address(0):
+            step_mu = step_mu >> 3
+        data = ((step_mu & 0xFFFF) << 16) | (channel - self.addr_timing)
+        if step_start:
+            data |= 1 << 8
+        if step_stop:
+            data |= 1 << 9
+        self.write(self.addr_ext + EXT_W_SCAN_CONFIG, data)
+        self.write(
+            self.addr_ext + EXT_W_SCAN_POINTS,
+            (n_points << 16) | (cycles_per_point & 0x3FFF),
+        )
+
+    @kernel
+    def set_histogram_mu(self, offset_mu, bin_width_log2):
+        """Configure the arrival time histograms of the APD inputs.
+
+        During each run, the gateware histograms the arrival times of all APD
+        clicks (whether or not they are in the gate window) relative to the
+        reference (422ps) pulse. The histograms accumulate over runs until
+        :meth:`clear_histogram`, and can be read out with :meth:`read_histogram`.
+
+        This method advances the timeline by one coarse RTIO cycle.
+
+        Args:
+            offset_mu: arrival time at the start of the first bin, in mu.
+            bin_width_log2: log2 of the bin width in mu, 0-15.
+        """
+        self.write(
+            self.addr_ext + EXT_W_HISTOGRAM_CONFIG,
+            (offset_mu & 0xFFFF) | ((bin_width_log2 & 0xF) << 16),
+        )
+
+    @kernel
+    def clear_histogram(self):
+        """Zero the arrival time histograms of all APD inputs.
+
+        Clearing takes one coarse clock cycle per bin, during which clicks are not
+        counted, so clear between runs.
+
+        This method advances the timeline by ``num_histogram_bins + 1`` coarse RTIO
+        cycles, so that a run started afterwards is histogrammed in full.
+        """
+        self.write(self.addr_ext + EXT_W_HISTOGRAM_CLEAR, 0)
+        delay_mu(self.num_histogram_bins * self.ref_period_mu)
+
+    @kernel
+    def read_histogram(self):
+        """Read the arrival time histograms of all APD inputs.
+
+        The counts are stored in :attr:`histogram_counts`, use
+        :meth:`get_histogram` on the host to get them per APD input.
+
+        This method advances the timeline by one coarse RTIO cycle per bin & APD
+        input (twice), and consumes all slack (see :meth:`read_stream`).
+        """
+        self.write(self.addr_ext + EXT_W_HISTOGRAM_ADDR, 0)
+        n_words = len(self.histogram_words)
+        self.read_stream(self.addr_ext + EXT_R_HISTOGRAM, self.histogram_words, n_words)
+        for i in range(len(self.histogram_counts)):
+            low = self.histogram_words[2 * i]
+            high = self.histogram_words[2 * i + 1]
+            self.histogram_counts[i] = low | (high << 14)
+
+    def get_histogram(self):
+        """Get the histograms read by :meth:`read_histogram`.
+
+        Returns:
+            :class:`numpy.ndarray` of shape ``(num_inputs, num_histogram_bins)``.
+        """
+        return self.histogram_counts.reshape((self.num_inputs, self.num_histogram_bins))
+
+    @kernel
+    def read_trace(self):
+        """Read the cycle trace of the last run.
+
+        If ``trace`` is set in :meth:`set_config`, the gateware records the index,
+        gater triggered flags & input timestamps of each cycle of a run, keeping the
+        last ``trace_depth`` cycles. The trace is cleared at the start of each run.
+        The records are stored in :attr:`trace_words`, oldest first; use
+        :meth:`get_trace` on the host to get them as a structured array.
+
+        This method advances the timeline by one coarse RTIO cycle per word, and
+        consumes all slack (see :meth:`read_stream`).
+
+        Returns:
+            The number of records read.
+        """
+        n_records = self.read(self.addr_r_trace_count)
+        self.write(self.addr_ext + EXT_W_TRACE_ADDR, 0)
+        self.read_stream(
+            self.addr_ext + EXT_R_TRACE,
+            self.trace_words,
+            n_records * (self.num_inputs + 3),
+        )
+        return n_records
+
+    def get_trace(self, n_records):
+        """Get the cycle trace read by :meth:`read_trace`.
+
+        Args:
+            n_records: number of records returned by :meth:`read_trace`.
+
+        Returns:
+            :class:`numpy.ndarray` of ``n_records`` records, oldest first, with
+            fields ``cycle`` (cycle index, 14 bits), ``triggered`` (bitfield of the
+            gaters that triggered), ``timestamps_mu`` (timestamp of each APD input,
+            only valid if it triggered) and ``ref_timestamp_mu`` (timestamp of the
+            reference input).
+        """
+        words = self.trace_words[: n_records * (self.num_inputs + 3)].reshape(
+            (n_records, self.num_inputs + 3)
+        )
+        trace = np.zeros(n_records, dtype=self.trace_dtype)
+        trace["cycle"] = words[:, 0]
+        trace["triggered"] = words[:, 1]
+        trace["timestamps_mu"] = words[:, 2:-1]
+        trace["ref_timestamp_mu"] = words[:, -1]
+        return trace
+
+    @kernel
+    def read_statistics(self):
+        """Read the statistics counters of the current or last run.
+
+        The counters (see :meth:`get_statistics`) are cleared at the start of each
+        run, and do not roll over in practice (48-bit cycle & trigger counters,
+        32-bit click & match counters). They are all sampled at the same time, so
+        they are consistent even if read during a run. The values are stored in
+        :attr:`statistics`; use :meth:`get_statistics` on the host to get them by
+        name.
+
+        This method advances the timeline by one coarse RTIO cycle per word, plus
+        one, and consumes all slack (see :meth:`read_stream`).
+        """
+        self.write(self.addr_ext + EXT_W_STATISTICS_SNAPSHOT, 0)
+        self.read_stream(
+            self.addr_ext + EXT_R_STATISTICS,
+            self.statistics_words,
+            len(self.statistics_words),
+        )
+        i = 0
+        for j in range(len(self.statistics_n_words)):
+            value = np.int64(0)
+            for k in range(self.statistics_n_words[j]):
+                value |= np.int64(self.statistics_words[i]) << (14 * k)
+                i += 1
+            self.statistics[j] = value
+
+    def get_statistics(self):
+        """Get the statistics counters read by :meth:`read_statistics`.
+
+        Returns:
+            dict with the number of completed ``cycles``, the number of cycles with
+            a 422ps ``triggers``, the ``time_remaining`` until timeout (in coarse
+            clock cycles), and arrays of the gated ``clicks`` of each APD input and
+            of the excitation windows that ``matches`` each herald pattern (0 for
+            disabled patterns).
+        """
+        return {
+            "cycles": int(self.statistics[0]),
+            "triggers": int(self.statistics[1]),
+            "time_remaining": int(self.statistics[2]),
+            "clicks": self.statistics[3 : 3 + self.num_inputs],  # noqa
+            "matches": self.statistics[3 + self.num_inputs :],  # noqa
+        }
+
+    @kernel
+    def read_scan(self):
+        """Read the records of the parameter scan of the last run.
+
+        See :meth:`set_scan_mu`. The records are stored in :attr:`scan_words`; use
+        :meth:`get_scan` on the host to get them by name.
+
+        This method advances the timeline by one coarse RTIO cycle per word, and
+        consumes all slack (see :meth:`read_stream`).
+
+        Returns:
+            The number of points recorded, less than ``n_points`` if the run timed
+            out before the end of the scan.
+        """
+        n_points = self.read(self.addr_r_scan_count)
+        self.write(self.addr_ext + EXT_W_SCAN_ADDR, 0)
+        self.read_stream(
+            self.addr_ext + EXT_R_SCAN,
+            self.scan_words,
+            n_points * (self.num_inputs + 1),
+        )
+        return n_points
+
+    def get_scan(self, n_points):
+        """Get the parameter scan records read by :meth:`read_scan`.
+
+        Args:
+            n_points: number of points returned by :meth:`read_scan`.
+
+        Returns:
+            dict with arrays of the number of ``heralds`` (heralded cycles) of each
+            point, and of the gated ``clicks`` of each point & APD input (shape
+            ``(n_points, num_inputs)``). The counts saturate at 0x3fff.
+        """
+        words = self.scan_words[: n_points * (self.num_inputs + 1)].reshape(
+            (n_points, self.num_inputs + 1)
+        )
+        return {"heralds": words[:, 0], "clicks": words[:, 1:]}
 
     @kernel
     def run_mu(self, duration_mu):
         """Run the entanglement sequence until success, or duration_mu has elapsed.
 
-        THIS IS A BLOCKING CALL.
+        THIS IS A BLOCKING CALL. See :meth:`start_mu` for a non-blocking
+        alternative.
 
         Args:
             duration_mu (int): Timeout duration of this entanglement cycle, in mu.
@@ -197,15 +1260,232 @@ class Entangler:
         Returns:
             tuple of [timestamp, reason].
             timestamp is the RTIO time at the end of the final cycle.
-            reason is 0x3fff if there was a timeout, or a bitfield giving the
-            herald matches if there was a success.
+            reason is 0x3fff if there was a timeout, :data:`ABORT` if the run was
+            aborted, or a bitfield giving the herald matches if there was a success.
+
+        """
+        self.start_mu(duration_mu)
+        return self.wait_mu()
+
+    @kernel
+    def start_mu(self, duration_mu):
+        """Start the entanglement sequence, without waiting for it to finish.
+
+        The run ends on success, or once duration_mu has elapsed. Use :meth:`poll`
+        to check whether it has finished, and :meth:`wait_mu` to get the result.
+        Meanwhile, the kernel can service other RTIO channels.
+
+        Core events & completion report words that are still set aside, e.g. the
+        result of a previous run that :meth:`wait_mu` gave up on, are discarded,
+        so they are not mistaken for the result of this run. If :meth:`wait_mu`
+        gave up on the previous run, :meth:`abort` it and wait for it to finish
+        before starting the next one: its result is otherwise only discarded if
+        it was received by then.
+
+        This method advances the timeline by one coarse RTIO cycle.
+
+        Args:
+            duration_mu (int): Timeout duration of this entanglement cycle, in mu.
+        """
+        self.discard_events()
+        self.write(ADDR_W_RUN, duration_mu >> 3)
+
+    @kernel
+    def discard_events(self):
+        """Discard the core events & completion report words received so far.
 
+        Telemetry received so far is still processed (see :meth:`receive`).
+
+        This method does not advance the timeline, and does not block.
         """
+        self.receive_all()
+        self.pending_start = 0
+        self.n_pending = 0
+
+    @kernel
+    def poll(self):
+        """Check whether the run started by :meth:`start_mu` has finished.
+
+        This method does not advance the timeline, and does not block.
+
+        Returns:
+            True if the run has finished, and :meth:`wait_mu` will return its
+            result immediately. Only events received since :meth:`start_mu` count.
+        """
+        self.receive_all()
+        return self.n_pending > 0
+
+    @kernel
+    def wait_mu(self, deadline_mu=np.int64(-1)):
+        """Wait for the run started by :meth:`start_mu` to finish.
+
+        This method does not advance the timeline but consumes all slack.
+
+        Args:
+            deadline_mu: RTIO time until which to wait, -1 to wait until the run
+                finishes. Defaults to -1.
+
+        Returns:
+            tuple of [timestamp, reason], as :meth:`run_mu`, or [-1, -1] if the run
+            did not finish before the deadline.
+        """
+        while self.n_pending == 0:
+            if self.receive(deadline_mu) == -2:
+                return np.int64(-1), -1
+        return self.next_event()
+
+    @kernel
+    def abort(self):
+        """Abort the run started by :meth:`start_mu`.
+
+        The core finishes the run at the end of the current cycle, and the result
+        is :data:`ABORT` instead of a timeout (unless the last cycle heralded). On
+        the master, the abort is forwarded to the slave, whose run result is
+        :data:`ABORT` too.
+        Continuous runs (:meth:`run_n_mu`) can not be aborted from the same
+        kernel, as that call is blocking.
+
+        This method advances the timeline by one coarse RTIO cycle.
+        """
+        self.write(self.addr_ext + EXT_W_ABORT, 0)
+
+    @kernel
+    def set_config_target(self, slot):
+        """Select where the timing, herald & cycle length setters write to.
+
+        By default, :meth:`set_timing_mu`, :meth:`set_heralds` and
+        :meth:`set_cycle_length_mu` write the live registers used by the core. After
+        selecting a config slot, they write into that slot instead, which can then be
+        loaded into the live registers with a single write by
+        :meth:`load_config_slot`. The other registers are always written directly.
+
+        This method advances the timeline by one coarse RTIO cycle.
+
+        Args:
+            slot: config slot to write to, 0 to ``num_config_slots - 1``, or -1 for
+                the live registers.
+        """
+        if not -1 <= slot < self.num_config_slots:
+            raise ValueError("Config slot out of range")
+        self.write(self.addr_ext + EXT_W_CONFIG_TARGET, slot + 1)
+
+    @kernel
+    def store_config_slot(self, slot, pairs):
+        """Write a configuration into a config slot, see :meth:`set_config_target`.
+
+        This method advances the timeline by one coarse RTIO cycle per register
+        write, plus two.
+
+        Args:
+            slot: config slot to write to, 0 to ``num_config_slots - 1``.
+            pairs: flat array of (address, word) pairs of the timing, herald &
+                cycle length registers, from :meth:`EntanglerConfig.to_slot_array`.
+        """
+        if not 0 <= slot < self.num_config_slots:
+            raise ValueError("Config slot out of range")
+        self.set_config_target(slot)
+        self.upload_config(pairs)
+        self.set_config_target(-1)
+
+    @kernel
+    def load_config_slot(self, slot):
+        """Load a config slot into the live timing, herald & cycle length registers.
+
+        All registers are loaded at once, at the current RTIO time. If ``shadow`` is
+        set in :meth:`set_config`, the slot is only applied by :meth:`commit_config`,
+        so that the configuration can be switched during a run. Otherwise, switch
+        configuration between runs: a switch during a run takes effect immediately,
+        even in the middle of a cycle.
+
+        This method advances the timeline by one coarse RTIO cycle.
+
+        Args:
+            slot: config slot to load, 0 to ``num_config_slots - 1``.
+        """
+        if not 0 <= slot < self.num_config_slots:
+            raise ValueError("Config slot out of range")
+        self.write(self.addr_ext + EXT_W_CONFIG_SLOT, slot)
+
+    @kernel
+    def commit_config(self):
+        """Apply the held configuration register writes at the next cycle boundary.
+
+        Used if ``shadow`` is set in :meth:`set_config`: the registers written (or
+        loaded from a config slot) since the last commit are then all updated
+        together, between two cycles. When the core is not running, this happens
+        straight away. Until then, the ``commit_pending`` bit of
+        :meth:`get_status` is set. Master and slave commit independently, so
+        commit on both at the same RTIO time to keep them consistent.
+
+        This method advances the timeline by one coarse RTIO cycle.
+        """
+        self.write(self.addr_ext + EXT_W_CONFIG_COMMIT, 0)
+
+    @kernel
+    def run_n_mu(self, n, duration_mu):
+        """Run the entanglement sequence until n successes, or duration_mu has elapsed.
+
+        THIS IS A BLOCKING CALL.
+
+        The core re-arms itself after each success, without any kernel interaction,
+        and generates one timestamped input event per herald. These are drained into
+        :attr:`herald_timestamps_mu` (RTIO time at the end of the successful cycle)
+        and :attr:`herald_patterns` (bitfield of the herald matches). The run also
+        finishes if it is aborted, e.g. at the end of a parameter scan (see
+        :meth:`set_scan_mu`). If ``report`` is set in :meth:`set_config`, the
+        completion report is left for :meth:`next_event`.
+
+        Args:
+            n (int): Number of successes to run for. At most ``max_heralds``.
+            duration_mu (int): Timeout duration of the whole run, in mu.
+
+        Returns:
+            The number of heralds recorded. This is ``n``, unless the run timed out
+            or was aborted.
+
+        """
+        assert 0 < n <= self.max_heralds
+        self.discard_events()
+        self.write(ADDR_W_NSUCCESSES, n)
         duration_mu = duration_mu >> 3
-        self.write(ADDR_W_RUN, duration_mu)
-        # Following func is only in ARTIQ >= 5, don't have in dev environment
-        # pylint: disable=no-name-in-module
-        return rtio_input_timestamped_data(np.int64(-1), self.channel)
+        self.write(ADDR_W_RUN_N, duration_mu)
+        n_heralds = 0
+        while n_heralds < n:
+            timestamp, tag, pattern = self.next_tagged_event()
+            if tag != TAG_EVENT:
+                continue
+            if pattern == 0x3FFF or pattern == ABORT:
+                break
+            self.herald_timestamps_mu[n_heralds] = timestamp
+            self.herald_patterns[n_heralds] = pattern
+            n_heralds += 1
+        return n_heralds
+
+    @kernel
+    def run_report_mu(self, duration_mu):
+        """Run the entanglement sequence, and receive the completion report.
+
+        THIS IS A BLOCKING CALL.
+
+        As :meth:`run_mu`, but the outcome of the run is stored in :attr:`report`
+        without any register reads: the reason (as returned by :meth:`run_mu`), the
+        number of cycles completed, the number of 422ps triggers received, then the
+        input timestamps of each APD & of the 422ps pulse (see
+        :meth:`get_timestamp_mu`). Requires ``report`` to be set in
+        :meth:`set_config`.
+
+        Args:
+            duration_mu (int): Timeout duration of this entanglement cycle, in mu.
+
+        Returns:
+            The RTIO time at the end of the final cycle.
+        """
+        timestamp, reason = self.run_mu(duration_mu)
+        self.report[0] = reason
+        for i in range(1, len(self.report)):
+            _, data = self.next_event()
+            self.report[i] = data
+        return timestamp
 
     @kernel
     def run(self, duration):
@@ -219,8 +1499,13 @@ class Entangler:
 
     @kernel
     def get_status(self):
-        """Get status of the entangler gateware."""
-        return self.read(ADDR_R_STATUS)
+        """Get status of the entangler gateware.
+
+        Returns:
+            bitfield of [ready, success, timeout, aborted, commit_pending], from the
+            LSB. ``aborted`` is also set when a parameter scan finishes the run.
+        """
+        return self.read(self.addr_r_status)
 
     @kernel
     def get_ncycles(self):
@@ -229,7 +1514,7 @@ class Entangler:
         This value is reset every :meth:`run` call, so this is the number since the
         last :meth:`run` call.
         """
-        return self.read(ADDR_R_NCYCLES)
+        return self.read(self.addr_r_ncycles)
 
     @kernel
     def get_ntriggers(self):
@@ -238,12 +1523,34 @@ class Entangler:
         This value is reset every :meth:`run` call, so this is the number since the
         last :meth:`run` call.
         """
-        return self.read(ADDR_R_NTRIGGERS)
+        return self.read(self.addr_r_ntriggers)
+
+    @kernel
+    def get_herald_window(self):
+        """Get the index of the excitation window that heralded in the last cycle.
+
+        See :meth:`set_burst_windows`. Windows are numbered from 0.
+        """
+        return self.read(self.addr_r_herald_window)
 
     @kernel
     def get_time_remaining(self):
         """Return the remaining number of clock cycles until the core times out."""
-        return self.read(ADDR_R_TIMEREMAINING)
+        return self.read(self.addr_r_timeremaining)
+
+    @kernel
+    def read_timestamps_mu(self):
+        """Read the input timestamps of all APDs & of the 422ps pulse at once.
+
+        The timestamps (see :meth:`get_timestamp_mu`) are stored in
+        :attr:`timestamps_mu`, in the order [apd0, apd1, ..., 422ps].
+
+        This method advances the timeline by one coarse RTIO cycle, and consumes
+        all slack.
+        """
+        self.read_block(
+            self.addr_timestamp, len(self.timestamps_mu), self.timestamps_mu
+        )
 
     @kernel
     def get_timestamp_mu(self, channel):
@@ -251,5 +1558,9 @@ class Entangler:
 
         The timestamp is the time offset, in mu, from the start of the cycle to
         the detected rising edge.
+
+        Args:
+            channel: address of the timestamp register, e.g. ``timestamp_apd0`` or
+                :meth:`timestamp_address`.
         """
         return self.read(channel)
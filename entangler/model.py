@@ -0,0 +1,448 @@
+"""Vectorized behavioral model of the entangler core, for Monte Carlo studies.
+
+:class:`CoreModel` reproduces, clock cycle for clock cycle, what a standalone
+:class:`entangler.core.EntanglerCore` does with given reference & APD input edges:
+the gating of the inputs (:class:`~entangler.core.TriggeredInputGater`), the herald
+pattern matching (:class:`~entangler.core.PatternMatcher`), the cycle & run timing
+of the :class:`~entangler.core.MainStateMachine`, and the sequencer outputs
+(:class:`~entangler.core.ChannelSequencer`). It processes whole arrays of cycles at
+once with NumPy, so it runs many orders of magnitude faster than a gateware
+simulation.
+
+Input edge times are given per cycle, in mu (coarse clock cycles of 8 mu, plus the
+fine timestamp), relative to the start of the cycle (``m == 0``). Edges are only
+modelled while the cycle counter runs: edges at or after ``m_end`` coarse clock
+cycles (or after the end of a cycle that exits early) are discarded.
+
+Not modelled: master/slave operation (the model behaves as a standalone device,
+or a master whose slave is always ready), burst windows, the herald lookup table,
+the edge sequencer and parameter scans.
+"""
+import numpy as np
+
+from entangler.address import address_index_width
+
+# Timestamps are 14 bits wide: 11-bit coarse counter + 3-bit fine timestamp
+TIMESTAMP_MASK = 0x3FFF
+
+# Clock cycles between the end of a cycle and the start of the next (IDLE and two
+# slave trigger states), and between a run start and the start of its first cycle
+CYCLE_GAP = 3
+RUN_START_DELAY = 4
+
+# Run result on timeout
+TIMEOUT = 0x3FFF
+
+_NEVER = np.iinfo(np.int64).max
+
+
+def _fill_forward(values, mask, initial):
+    """Value of a register updated with ``values`` where ``mask``, along axis 0.
+
+    Returns the value of the register after each step, starting from ``initial``.
+    """
+    steps = np.arange(len(mask)).reshape((-1,) + (1,) * (mask.ndim - 1))
+    last = np.maximum.accumulate(np.where(mask, steps, -1), axis=0)
+    filled = np.take_along_axis(values, np.maximum(last, 0), axis=0)
+    return np.where(last >= 0, filled, initial)
+
+
+def _previous(after, initial):
+    """Value of a register before each step, from its value after each step."""
+    initial = np.broadcast_to(initial, after.shape[1:])
+    return np.concatenate([initial[None], after[:-1]])
+
+
+class CoreModel:
+    """Behavioral model of a standalone ``EntanglerCore``.
+
+    The configuration attributes hold the raw gateware register values, as written
+    by :meth:`write` (or e.g. ``m_start[i] = t_start_mu // 8 + 1`` for the values
+    :meth:`entangler.driver.Entangler.set_timing_mu` writes). The model also keeps
+    the gateware state that carries over from one cycle (and run) to the next: the
+    last reference timestamp and gate window, and the last signal timestamps.
+
+    Attributes:
+        m_end: cycle length, in coarse clock cycles.
+        m_start, m_stop: start & stop times of each sequencer output, in coarse
+            clock cycles.
+        gate_start, gate_stop: gate window of each APD input, in mu after the
+            reference edge.
+        patterns: herald patterns.
+        pattern_ens: bitfield of the enabled herald patterns.
+        pipelined, early_exit: as the config flags of
+            :meth:`entangler.driver.Entangler.set_config`.
+    """
+
+    def __init__(self, num_outputs=4, num_inputs=4, num_patterns=4):
+        """Create a model with all registers at their reset values.
+
+        Args:
+            num_outputs (int, optional): Number of sequencer outputs. Defaults to 4.
+            num_inputs (int, optional): Number of gated APD inputs. Defaults to 4.
+            num_patterns (int, optional): Number of herald patterns. Defaults to 4.
+        """
+        self.num_outputs = num_outputs
+        self.num_inputs = num_inputs
+        self.num_patterns = num_patterns
+        self._index_width = address_index_width(num_outputs, num_inputs)
+
+        self.m_end = 0
+        self.m_start = np.zeros(num_outputs, dtype=np.int64)
+        self.m_stop = np.zeros(num_outputs, dtype=np.int64)
+        self.gate_start = np.zeros(num_inputs, dtype=np.int64)
+        self.gate_stop = np.zeros(num_inputs, dtype=np.int64)
+        self.patterns = np.zeros(num_patterns, dtype=np.int64)
+        self.pattern_ens = 0
+        self.pipelined = False
+        self.early_exit = False
+
+        self.reset_state()
+
+    def reset_state(self):
+        """Reset the state carried over between cycles, as on power up."""
+        self.ref_ts = 0
+        self.abs_gate_start = np.zeros(self.num_inputs, dtype=np.int64)
+        self.abs_gate_stop = np.zeros(self.num_inputs, dtype=np.int64)
+        self.sig_ts = np.zeros(self.num_inputs, dtype=np.int64)
+
+    def write(self, addr, data):
+        """Write a register, as the RTIO PHY :class:`entangler.phy.Entangler` does.
+
+        Only the config, cycle length, herald & timing registers are modelled. Runs
+        are started by :meth:`run` instead.
+
+        Args:
+            addr: register address, as used by :mod:`entangler.driver`.
+            data: 32-bit register value.
+
+        Raises:
+            ValueError: if the register is not modelled (including the extended
+                registers), or the config enables the edge sequencer, the herald
+                lookup table or shadow registers, which are not modelled.
+        """
+        addr = int(addr)
+        data = int(data) & 0xFFFFFFFF
+        bank = (addr >> self._index_width) & 0b11
+        index = addr & ((1 << self._index_width) - 1)
+        if addr >> (self._index_width + 2):
+            raise ValueError("Extended register {:#x} not modelled".format(addr))
+        if bank == 0 and index == 0:
+            if data & ((0b11 << 5) | (1 << 9)):
+                raise ValueError(
+                    "Edge sequencer, herald lookup table & shadow registers not "
+                    "modelled"
+                )
+            self.pipelined = bool(data & (1 << 3))
+            self.early_exit = bool(data & (1 << 4))
+        elif bank == 0 and index == 2:
+            self.m_end = data & 0x3FF
+        elif bank == 0 and index == 3:
+            patterns_per_word = 16 // self.num_inputs
+            pattern_mask = (1 << self.num_inputs) - 1
+            for j in range(patterns_per_word):
+                i = (data >> 24) * patterns_per_word + j
+                if i < self.num_patterns:
+                    self.patterns[i] = (data >> (self.num_inputs * j)) & pattern_mask
+                    enable = (data >> (16 + j)) & 1
+                    self.pattern_ens = (self.pattern_ens & ~(1 << i)) | (enable << i)
+        elif bank == 1 and index < self.num_outputs:
+            self.m_start[index] = data & 0x7FF
+            self.m_stop[index] = (data >> 16) & 0x7FF
+        elif bank == 1 and index < self.num_outputs + self.num_inputs:
+            self.gate_start[index - self.num_outputs] = data & TIMESTAMP_MASK
+            self.gate_stop[index - self.num_outputs] = (data >> 16) & TIMESTAMP_MASK
+        else:
+            raise ValueError("Register {:#x} not modelled".format(addr))
+
+    def cycle_length(self, restarted=False):
+        """Count the clock cycles from the start of a cycle to the start of the next.
+
+        Args:
+            restarted (bool, optional): if the next cycle follows straight on in
+                pipelined mode (no herald, early exit or timeout). Defaults to False.
+        """
+        if restarted:
+            return self.m_end + 1
+        return self.m_end + 1 + CYCLE_GAP
+
+    def outputs(self, restarted=False):
+        """Level of each sequencer output on each clock cycle of a cycle.
+
+        Args:
+            restarted (bool, optional): if the cycle follows straight on from the
+                previous one in pipelined mode. Otherwise, the counter is held at 0
+                for two clock cycles before the cycle starts. Defaults to False.
+
+        Returns:
+            :class:`numpy.ndarray` of shape ``(num_outputs, m_end + 1)``: the level
+            of each output at ``m = 0, ..., m_end``.
+        """
+        levels = np.zeros((self.num_outputs, self.m_end + 1), dtype=bool)
+        # Cleared before the cycle. Unless restarted, the counter then stays at 0
+        # for the two clock cycles that trigger the slave.
+        level = np.zeros(self.num_outputs, dtype=bool)
+        if not restarted:
+            level = self.m_start == 0
+        for m in range(self.m_end + 1):
+            levels[:, m] = level
+            level = np.where(
+                self.m_start == m, True, np.where(self.m_stop == m, False, level)
+            )
+        return levels
+
+    def _is_match(self, state):
+        """Whether click patterns ``state`` herald."""
+        herald = np.zeros(state.shape, dtype=bool)
+        for i, pattern in enumerate(self.patterns):
+            if self.pattern_ens & (1 << i):
+                herald |= state == pattern
+        return herald
+
+    def _matches(self, state):
+        """Bitfield of the herald patterns matching click patterns ``state``."""
+        matches = np.zeros(state.shape, dtype=np.int64)
+        for i, pattern in enumerate(self.patterns):
+            matches |= (state == pattern).astype(np.int64) << i
+        return matches
+
+    def cycles(self, ref_times_mu, apd_times_mu, update_state=True):
+        """Model a sequence of back-to-back cycles of a run.
+
+        All cycles are modelled as if the run continued through them: heralds do
+        not finish the run. See :meth:`run` to model a whole run.
+
+        Args:
+            ref_times_mu: reference edge time of each cycle (shape ``(n,)``), in mu
+                since the start of the cycle, or -1 for no edge.
+            apd_times_mu: APD edge times of each cycle (shape ``(n, num_inputs)``),
+                or several edges per input and cycle (shape ``(n, num_inputs,
+                n_edges)``), in mu since the start of the cycle, or -1 for no edge.
+                Edges of an input must be at least one coarse clock cycle apart.
+            update_state (bool, optional): keep the state at the end of the last
+                cycle for the next call. Defaults to True.
+
+        Returns:
+            dict of arrays, with one entry per cycle:
+
+            * ``herald``: whether the cycle heralded.
+            * ``end_m``: value of ``m`` on the last clock cycle of the cycle
+              (``m_end``, or earlier for an early exit).
+            * ``clicks``: click pattern (bit ``i`` set if input ``i`` triggered)
+              at the end of the cycle, as recorded by the cycle trace.
+            * ``matches``: bitfield of the patterns matching ``clicks``.
+            * ``result``: the run result if the run finishes after the cycle: the
+              herald pattern matches, including edges on the last clock cycle.
+            * ``triggered``: whether each input triggered during the cycle (shape
+              ``(n, num_inputs)``).
+            * ``sig_ts``: signal timestamp of each input at the end of the cycle
+              (shape ``(n, num_inputs)``), as recorded by the cycle trace. It is
+              stale (from an earlier cycle) if the input did not trigger.
+            * ``ref_ts``: reference timestamp at the end of the cycle, stale if
+              there was no reference edge.
+            * ``got_ref``: whether the cycle had a reference edge.
+        """
+        ref = np.asarray(ref_times_mu, dtype=np.int64)
+        apd = np.asarray(apd_times_mu, dtype=np.int64)
+        if apd.ndim == 2:
+            apd = apd[:, :, None]
+        n = len(ref)
+        assert apd.shape[:2] == (n, self.num_inputs)
+
+        def in_cycle(t):
+            return (t >= 0) & ((t >> 3) < self.m_end)
+
+        has_ref = in_cycle(ref)
+        ref_coarse = np.where(has_ref, ref >> 3, _NEVER)
+
+        # Absolute gate windows: set on each reference edge, and used by the signal
+        # edges from the next clock cycle on (including in later cycles).
+        new_start = (self.gate_start + ref[:, None]) & TIMESTAMP_MASK
+        new_stop = (self.gate_stop + ref[:, None]) & TIMESTAMP_MASK
+        after_ref = (apd >> 3) > ref_coarse[:, None, None]
+        weights = 1 << np.arange(self.num_inputs)
+
+        # A reference edge after an early exit is not seen, so the following cycles
+        # keep the gate windows of an earlier one. As the exit depends on these gate
+        # windows, iterate until the cycles are consistent: each iteration fixes at
+        # least the first inconsistent cycle (in practice, one or two iterations).
+        got_ref = has_ref
+        while True:
+            prev_start = _previous(
+                _fill_forward(new_start, got_ref[:, None], self.abs_gate_start),
+                self.abs_gate_start,
+            )
+            prev_stop = _previous(
+                _fill_forward(new_stop, got_ref[:, None], self.abs_gate_stop),
+                self.abs_gate_stop,
+            )
+            start = np.where(after_ref, new_start[:, :, None], prev_start[:, :, None])
+            stop = np.where(after_ref, new_stop[:, :, None], prev_stop[:, :, None])
+            triggering = in_cycle(apd) & (apd >= start) & (apd <= stop)
+            # Each input triggers on its first edge in the gate window
+            t_trig = np.where(triggering, apd, _NEVER).min(axis=2)
+            trig_coarse = np.where(t_trig != _NEVER, t_trig >> 3, _NEVER)
+
+            def clicks_before(m):
+                """Click patterns of edges before clock cycle ``m`` of each cycle."""
+                return ((trig_coarse < m[:, None]) * weights).sum(axis=1)
+
+            if self.early_exit:
+                # The herald is checked on every clock cycle, and can only change
+                # the clock cycle after an input triggers.
+                candidates = np.concatenate(
+                    [
+                        np.zeros((n, 1), dtype=np.int64),
+                        np.where(trig_coarse < self.m_end, trig_coarse + 1, _NEVER),
+                    ],
+                    axis=1,
+                )
+                heralding = np.stack(
+                    [self._is_match(clicks_before(c)) for c in candidates.T], axis=1
+                ) & (candidates != _NEVER)
+                exit_m = np.where(heralding, candidates, _NEVER).min(axis=1)
+                herald = exit_m != _NEVER
+                end_m = np.where(herald, exit_m, self.m_end)
+            else:
+                herald_m = self.m_end - 1 if self.pipelined else self.m_end
+                herald = self._is_match(clicks_before(np.full(n, herald_m)))
+                end_m = np.full(n, self.m_end)
+
+            # Edges after the last clock cycle of a cycle are not seen
+            seen_ref = ref_coarse <= end_m
+            if np.array_equal(seen_ref, got_ref):
+                break
+            got_ref = seen_ref
+        triggered = trig_coarse <= end_m[:, None]
+        clicks = clicks_before(end_m)
+
+        sig_ts_after = _fill_forward(t_trig, triggered, self.sig_ts)
+        sig_ts = np.where(
+            trig_coarse < end_m[:, None], t_trig, _previous(sig_ts_after, self.sig_ts)
+        )
+        ref_ts_after = _fill_forward(ref, got_ref, self.ref_ts)
+        ref_ts = np.where(ref_coarse < end_m, ref, _previous(ref_ts_after, self.ref_ts))
+        if update_state and n:
+            self.sig_ts = sig_ts_after[-1]
+            self.ref_ts = ref_ts_after[-1]
+            self.abs_gate_start = _fill_forward(
+                new_start, got_ref[:, None], self.abs_gate_start
+            )[-1]
+            self.abs_gate_stop = _fill_forward(
+                new_stop, got_ref[:, None], self.abs_gate_stop
+            )[-1]
+
+        return {
+            "herald": herald,
+            "end_m": end_m,
+            "clicks": clicks,
+            "matches": self._matches(clicks),
+            "result": self._matches(clicks_before(end_m + 1)),
+            "triggered": triggered,
+            "sig_ts": sig_ts,
+            "ref_ts": ref_ts,
+            "got_ref": ref_coarse < end_m,
+        }
+
+    def run(self, ref_times_mu, apd_times_mu, time_remaining, n_successes=1):
+        """Model a run, as started by :meth:`entangler.driver.Entangler.run_mu`.
+
+        The run finishes after ``n_successes`` heralds, or on timeout. Cycles of the
+        input arrays after the end of the run are not used.
+
+        Args:
+            ref_times_mu: reference edge time of each cycle, see :meth:`cycles`.
+            apd_times_mu: APD edge times of each cycle, see :meth:`cycles`.
+            time_remaining: timeout, in coarse clock cycles (the value written to
+                the run register).
+            n_successes (int, optional): number of heralds to run for, as
+                :meth:`entangler.driver.Entangler.run_n_mu`. Defaults to 1.
+
+        Returns:
+            dict with:
+
+            * ``finished``: whether the run finished within the given cycles.
+            * ``done``: clock cycle on which the run finished (the timestamp of
+              the run result input event, in coarse clock cycles after the run
+              register write), or -1 if not finished.
+            * ``result``: the run result, herald pattern matches or
+              :data:`TIMEOUT`.
+            * ``n_cycles``: number of cycles completed.
+            * ``cycle_starts``: clock cycle on which each cycle started.
+            * ``herald_times`` & ``herald_results``: clock cycle & herald pattern
+              matches of each herald during the run (including the last one).
+            * ``n_triggers``, ``n_clicks`` & ``n_matches``: the statistics
+              counters of :meth:`entangler.driver.Entangler.get_statistics`.
+            * ``cycles``: the per-cycle results of :meth:`cycles`, for the
+              completed cycles.
+        """
+        ref = np.asarray(ref_times_mu, dtype=np.int64)
+        apd = np.asarray(apd_times_mu, dtype=np.int64)
+        cycles = self.cycles(ref, apd, update_state=False)
+        herald = cycles["herald"]
+        end_m = cycles["end_m"]
+
+        # Cycles follow straight on in pipelined mode, unless the cycle heralded or
+        # exited early (or the run timed out).
+        if self.pipelined:
+            restart = ~herald & (end_m == self.m_end)
+        else:
+            restart = np.zeros(len(ref), dtype=bool)
+        length = np.where(restart, self.m_end + 1, end_m + 1 + CYCLE_GAP)
+        starts = RUN_START_DELAY + np.concatenate([[0], np.cumsum(length)[:-1]])
+        # The run finishes in the idle clock cycle after a cycle, once timed out.
+        # Cycles that restart decide whether to carry on one clock cycle before
+        # their end.
+        idle = starts + end_m + 1
+        decision = np.where(restart, starts + self.m_end - 1, idle)
+        timeout_at = time_remaining + 1
+
+        if timeout_at <= 1:
+            last = -1
+        else:
+            timed_out = np.flatnonzero(decision >= timeout_at)
+            successes = np.flatnonzero(herald)
+            ends = []
+            if len(timed_out):
+                ends.append(timed_out[0])
+            if len(successes) >= max(n_successes, 1):
+                ends.append(successes[max(n_successes, 1) - 1])
+            last = min(ends) if ends else None
+        finished = last is not None
+        if last is None:
+            last = len(ref) - 1
+        n_cycles = last + 1
+
+        # Keep the state of the cycles that actually ran
+        self.cycles(ref[:n_cycles], apd[:n_cycles])
+
+        ran = {key: value[:n_cycles] for key, value in cycles.items()}
+        heralded = np.flatnonzero(ran["herald"])
+        if not finished:
+            done, result = -1, TIMEOUT
+        elif n_cycles == 0:
+            done, result = 1, TIMEOUT
+        else:
+            done = int(idle[last])
+            result = int(ran["result"][-1]) if herald[last] else TIMEOUT
+        clicks = ran["triggered"].sum(axis=0)
+        return {
+            "finished": finished,
+            "done": done,
+            "result": result,
+            "n_cycles": n_cycles,
+            "cycle_starts": starts[:n_cycles],
+            "herald_times": idle[heralded],
+            "herald_results": ran["result"][heralded],
+            "n_triggers": int(ran["got_ref"].sum()),
+            "n_clicks": clicks,
+            "n_matches": np.array(
+                [
+                    ((ran["matches"] >> i) & 1).sum()
+                    if self.pattern_ens & (1 << i)
+                    else 0
+                    for i in range(self.num_patterns)
+                ]
+            ),
+            "cycles": ran,
+        }
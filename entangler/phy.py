@@ -1,14 +1,29 @@
 """Gateware-side ARTIQ RTIO interface to the entangler core."""
 from artiq.gateware.rtio import rtlink
+from migen import Array
 from migen import Case
 from migen import Cat
 from migen import ClockDomainsRenamer
+from migen import Constant
 from migen import If
 from migen import Module
 from migen import Mux
 from migen import Signal
+from migen import bits_for
+from migen.genlib.fifo import SyncFIFO
 
+from entangler.address import address_index_width
 from entangler.core import EntanglerCore
+from entangler.core import SEQUENCER_IDX_422ps
+
+# Tags of the input events, in the top 2 bits above the 14-bit data
+TAG_EVENT = 0  # Core finished or re-armed: herald matches, or 0x3fff on timeout
+TAG_READ = 1  # Response to a register read
+TAG_REPORT = 2  # Completion report word
+TAG_TELEMETRY = 3  # Telemetry word
+
+# Core event data of a run that was aborted (instead of 0x3fff for a timeout)
+ABORT_CODE = 0x3FFE
 
 
 class Entangler(Module):
@@ -19,21 +34,75 @@ class Entangler(Module):
     """
 
     def __init__(
-        self, core_link_pads, output_pads, passthrough_sigs, input_phys, simulate=False
+        self,
+        core_link_pads,
+        output_pads,
+        passthrough_sigs,
+        input_phys,
+        simulate=False,
+        num_outputs=4,
+        num_inputs=4,
+        num_patterns=4,
+        sequencer_idx_422ps=SEQUENCER_IDX_422ps,
+        num_histogram_bins=None,
+        trace_depth=None,
+        read_queue_depth=32,
+        num_config_slots=0,
+        num_scan_points=None,
+        edge_depth=None,
+        herald_lut=False,
     ):
         """
         Define the interface between an ARTIQ RTIO bus and low-level gateware.
 
         Args:
             core_link_pads: EEM pads for inter-Kasli link
-            output_pads: pads for 4 output signals (422sigma, 1092, 422 ps trigger, aux)
+            output_pads: pads for ``num_outputs`` output signals (by default
+                422sigma, 1092, 422 ps trigger, aux), followed by the "running" output
             passthrough_sigs: signals from output phys, connected to output_pads when
                 core not running
-            input_phys: serdes phys for 5 inputs – APD0-3 and 422ps trigger in
+            input_phys: serdes phys for ``num_inputs + 1`` inputs – by default
+                APD0-3 and 422ps trigger in
+            num_outputs: number of sequencer outputs
+            num_inputs: number of gated APD inputs (at most 13, as the click
+                pattern is reported in the 14-bit input data in herald lookup table
+                mode, with 0x3FFF reserved for timeouts)
+            num_patterns: number of herald patterns (at most 13, as the herald
+                matches are reported in the 14-bit input data)
+            sequencer_idx_422ps: index of the output triggering the 422ps laser
+            num_histogram_bins: number of arrival time histogram bins per APD input
+                (None for no histograms)
+            trace_depth: number of cycles recorded by the cycle trace (a power of 2,
+                at most 8192, or None for no trace)
+            read_queue_depth: number of read responses that can be queued while
+                core events & completion reports are sent, and of read requests that
+                can be queued during a burst read
+            num_config_slots: number of stored configurations (timing registers,
+                herald patterns & cycle length) that can be switched to with a
+                single write (0 for none)
+            num_scan_points: maximum number of points of a parameter scan (a power
+                of 2, at most 8192, or None for no parameter scans)
+            edge_depth: number of entries of the edge sequencer table (None for no
+                edge sequencer)
+            herald_lut: build the herald lookup table
+
+        The optional blocks (histograms, trace, config slots, parameter scans, edge
+        sequencer & herald lookup table) are left out by default, together with the
+        decoding of their registers, to keep the gateware (and its simulation) small.
         """
+        assert num_outputs <= 15
+        assert num_inputs <= 13
+        assert num_patterns <= 13
+        assert trace_depth is None or trace_depth <= 8192
+        assert num_config_slots <= 255
+        assert num_scan_points is None or num_scan_points <= 8192
+        index_width = address_index_width(num_outputs, num_inputs)
+        address_width = index_width + 3
         self.rtlink = rtlink.Interface(
-            rtlink.OInterface(data_width=32, address_width=5, enable_replace=False),
-            rtlink.IInterface(data_width=14, timestamped=True),
+            rtlink.OInterface(
+                data_width=32, address_width=address_width, enable_replace=False
+            ),
+            rtlink.IInterface(data_width=16, timestamped=True),
         )
 
         # # #
@@ -45,62 +114,432 @@ class Entangler(Module):
                 passthrough_sigs,
                 input_phys,
                 simulate=simulate,
+                num_outputs=num_outputs,
+                num_inputs=num_inputs,
+                num_patterns=num_patterns,
+                sequencer_idx_422ps=sequencer_idx_422ps,
+                num_histogram_bins=num_histogram_bins,
+                trace_depth=trace_depth,
+                num_scan_points=num_scan_points,
+                edge_depth=edge_depth,
+                herald_lut=herald_lut,
             )
         )
 
-        read_en = self.rtlink.o.address[4]
+        extended = self.rtlink.o.address[-1]
+        register_bank = self.rtlink.o.address[index_width : index_width + 2]  # noqa
+        register_index = self.rtlink.o.address[:index_width]
+        read_en = ~extended & register_bank[1]
         write_timings = Signal()
         self.comb += [
             self.rtlink.o.busy.eq(0),
-            write_timings.eq(self.rtlink.o.address[3:5] == 1),
+            write_timings.eq(~extended & (register_bank == 1)),
+        ]
+
+        def ext_stb(i):
+            """Strobe for an RTIO output event on extended register ``i``."""
+            return (self.rtlink.o.address == (1 << (address_width - 1)) + i) & (
+                self.rtlink.o.stb
+            )
+
+        # Read requests are executed in order: register reads, the readout registers
+        # (pointer writes & streamed readout reads) and burst reads. While a burst
+        # read is in progress, requests are queued (up to ``read_queue_depth`` of
+        # them), and executed once it is done, one per clock cycle. They then read
+        # the registers as they are when executed.
+        readout_registers = [7, 8, 9]
+        if self.core.histograms:
+            readout_registers += [3, 4]
+        if self.core.trace is not None:
+            readout_registers += [5, 6]
+        if self.core.scan is not None:
+            readout_registers += [17, 18]
+        request_stb = read_en & self.rtlink.o.stb
+        for i in readout_registers:
+            request_stb = request_stb | ext_stb(i)
+        burst_count = Signal(8)  # Registers left to read in the burst
+        request_queue = ClockDomainsRenamer("rio")(
+            SyncFIFO(address_width + 24, read_queue_depth)
+        )
+        self.submodules.request_queue = request_queue
+        queueing = Signal()
+        request = Signal()  # Strobe to execute the request below
+        request_address = Signal(address_width)
+        request_data = Signal(24)
+        self.comb += [
+            queueing.eq((burst_count != 0) | request_queue.readable),
+            request_queue.din.eq(Cat(self.rtlink.o.address, self.rtlink.o.data[:24])),
+            request_queue.we.eq(request_stb & queueing),
+            request_queue.re.eq(burst_count == 0),
+            If(
+                queueing,
+                request.eq(request_queue.readable & (burst_count == 0)),
+                Cat(request_address, request_data).eq(request_queue.dout),
+            ).Else(
+                request.eq(request_stb),
+                request_address.eq(self.rtlink.o.address),
+                request_data.eq(self.rtlink.o.data[:24]),
+            ),
         ]
 
+        def request_stb_ext(i):
+            """Strobe to execute a request on extended register ``i``."""
+            return request & (request_address == (1 << (address_width - 1)) + i)
+
+        # Experiment configuration registers, as (register, write strobe, value):
+        # the timing registers, herald patterns & enables, and the cycle length.
+        config_registers = []
         output_t_starts = [seq.m_start for seq in self.core.sequencers]
         output_t_ends = [seq.m_stop for seq in self.core.sequencers]
         output_t_starts += [gater.gate_start for gater in self.core.apd_gaters]
         output_t_ends += [gater.gate_stop for gater in self.core.apd_gaters]
-        cases = {}
         for i in range(len(output_t_starts)):
-            cases[i] = [
-                output_t_starts[i].eq(self.rtlink.o.data[:16]),
-                output_t_ends[i].eq(self.rtlink.o.data[16:]),
+            timing_stb = write_timings & (register_index == i) & self.rtlink.o.stb
+            config_registers += [
+                (output_t_starts[i], timing_stb, self.rtlink.o.data[:16]),
+                (output_t_ends[i], timing_stb, self.rtlink.o.data[16:]),
+            ]
+
+        # Herald patterns are written in words of as many patterns as fit in the low
+        # 16 bits, followed by their enable flags from bit 16. The index of the word
+        # is given by the top 8 bits.
+        patterns_per_word = 16 // num_inputs
+        for i in range(num_patterns):
+            word, j = divmod(i, patterns_per_word)
+            herald_stb = (
+                (self.rtlink.o.address == 3)
+                & (self.rtlink.o.data[24:] == word)
+                & self.rtlink.o.stb
+            )
+            config_registers += [
+                (
+                    self.core.heralder.patterns[i],
+                    herald_stb,
+                    self.rtlink.o.data[num_inputs * j : num_inputs * (j + 1)],  # noqa
+                ),
+                (
+                    self.core.heralder.pattern_ens[i],
+                    herald_stb,
+                    self.rtlink.o.data[16 + j],
+                ),
             ]
 
-        # Write timeout counter and start core running
+        config_registers.append(
+            (
+                self.core.msm.m_end,
+                (self.rtlink.o.address == 2) & self.rtlink.o.stb,
+                self.rtlink.o.data[:10],
+            )
+        )
+
+        # Each configuration register is double-buffered: writes go to its shadow
+        # register, which is copied to the live register (used by the core) either
+        # straight away, or, if the shadow config bit is set, at the first cycle
+        # boundary after a commit (extended register 14). This updates all registers
+        # between two cycles, so that parameters can be changed while running.
+        shadow_enable = Signal()
+        commit_pending = Signal()
+        commit = Signal()
+        self.comb += commit.eq(commit_pending & self.core.msm.cycle_clear)
+        self.sync.rio += [
+            If(commit, commit_pending.eq(0)),
+            If(ext_stb(14), commit_pending.eq(1)),
+        ]
+
+        # Config slots hold ``num_config_slots`` copies of the configuration
+        # registers. Extended register 12 selects where configuration register writes
+        # go: 0 for the (shadow) registers, k + 1 for slot k. Writing k to extended
+        # register 13 then loads slot k into the (shadow) registers, in a single clock
+        # cycle.
+        config_live = Signal(reset=1)  # Writes go to the (shadow) registers
+        if num_config_slots:
+            config_target = Signal(max=num_config_slots + 1)
+            self.sync.rio += If(ext_stb(12), config_target.eq(self.rtlink.o.data))
+            self.comb += config_live.eq(config_target == 0)
+        shadows = []
+        for register, write_stb, value in config_registers:
+            shadow = Signal.like(register)
+            shadows.append(shadow)
+            self.sync.rio += [
+                If(commit, register.eq(shadow)),
+                If(
+                    write_stb & config_live,
+                    shadow.eq(value),
+                    If(~shadow_enable, register.eq(value)),
+                ),
+            ]
+            slots = [Signal.like(register) for _ in range(num_config_slots)]
+            for k, slot in enumerate(slots):
+                self.sync.rio += If(
+                    write_stb & (config_target == k + 1), slot.eq(value)
+                )
+            if slots:
+                slot_value = Array(slots)[
+                    self.rtlink.o.data[: bits_for(len(slots) - 1)]
+                ]
+                self.sync.rio += If(
+                    ext_stb(13),
+                    shadow.eq(slot_value),
+                    If(~shadow_enable, register.eq(slot_value)),
+                )
+
+        # Parameter scan: extended register 15 selects the timing register to step
+        # (index in the timing bank, bits [7:0]), whether its start and/or stop time
+        # is stepped (bits 8 & 9) and the step (bits [31:16], two's complement, in
+        # the units of the register). Extended register 16 sets the number of cycles
+        # per point (bits [13:0]) and the number of points (bits [31:16], 0 to
+        # disable scans). Each run then scans, and the stepped register is restored
+        # to its written value when the scan ends.
+        if self.core.scan is not None:
+            scan_register = Signal(8)
+            scan_step_enables = Signal(2)
+            scan_step = Signal(16)
+            self.sync.rio += [
+                If(
+                    ext_stb(15),
+                    scan_register.eq(self.rtlink.o.data[:8]),
+                    scan_step_enables.eq(self.rtlink.o.data[8:10]),
+                    scan_step.eq(self.rtlink.o.data[16:]),
+                ),
+                If(
+                    ext_stb(16),
+                    self.core.scan.cycles_per_point.eq(self.rtlink.o.data[:14]),
+                    self.core.scan.n_points.eq(self.rtlink.o.data[16:]),
+                ),
+            ]
+            for i in range(len(output_t_starts)):
+                for j in range(2):
+                    register = config_registers[2 * i + j][0]
+                    self.sync.rio += If(
+                        (scan_register == i) & scan_step_enables[j],
+                        If(self.core.scan.step_stb, register.eq(register + scan_step)),
+                        If(self.core.scan.end_stb, register.eq(shadows[2 * i + j])),
+                    )
+
+        # Write timeout counter and start core running. Address 1 runs until the
+        # first success, address 4 until the number of successes set at address 5.
+        n_successes = Signal(16)
+        run_continuous = Signal()
         self.comb += [
+            run_continuous.eq(self.rtlink.o.address == 4),
             self.core.msm.time_remaining_buf.eq(self.rtlink.o.data),
-            self.core.msm.run_stb.eq((self.rtlink.o.address == 1) & self.rtlink.o.stb),
+            self.core.msm.n_successes_buf.eq(Mux(run_continuous, n_successes, 1)),
+            self.core.msm.run_stb.eq(
+                ((self.rtlink.o.address == 1) | run_continuous) & self.rtlink.o.stb
+            ),
+        ]
+
+        # Send a completion report after the core-done event
+        report_enable = Signal()
+
+        # Config bits of the optional blocks are only decoded if they are built
+        config_writes = [
+            self.core.enable.eq(self.rtlink.o.data[0]),
+            self.core.msm.standalone.eq(self.rtlink.o.data[2]),
+            self.core.msm.pipelined.eq(self.rtlink.o.data[3]),
+            self.core.msm.early_exit.eq(self.rtlink.o.data[4]),
+            report_enable.eq(self.rtlink.o.data[8]),
+            shadow_enable.eq(self.rtlink.o.data[9]),
         ]
+        if self.core.edge_sequencer is not None:
+            config_writes.append(self.core.use_edge_sequencer.eq(self.rtlink.o.data[5]))
+        if self.core.herald_lut is not None:
+            config_writes.append(self.core.use_herald_lut.eq(self.rtlink.o.data[6]))
+        if self.core.trace is not None:
+            config_writes.append(self.core.trace_enable.eq(self.rtlink.o.data[7]))
 
         self.sync.rio += [
-            If(
-                write_timings & self.rtlink.o.stb,
-                Case(self.rtlink.o.address[:3], cases),
-            ),
             If(
                 (self.rtlink.o.address == 0) & self.rtlink.o.stb,
                 # Write config
-                self.core.enable.eq(self.rtlink.o.data[0]),
-                self.core.msm.standalone.eq(self.rtlink.o.data[2]),
-            ),
-            If(
-                (self.rtlink.o.address == 2) & self.rtlink.o.stb,
-                # Write cycle length
-                self.core.msm.m_end.eq(self.rtlink.o.data[:10]),
+                *config_writes,
             ),
             If(
-                (self.rtlink.o.address == 3) & self.rtlink.o.stb,
-                # Write herald patterns and enables
-                *[
-                    self.core.heralder.patterns[i].eq(
-                        self.rtlink.o.data[4 * i : 4 * (i + 1)]  # noqa
-                    )
-                    for i in range(4)
-                ],
-                self.core.heralder.pattern_ens.eq(self.rtlink.o.data[16:20])
+                (self.rtlink.o.address == 5) & self.rtlink.o.stb,
+                # Write number of successes for continuous runs
+                n_successes.eq(self.rtlink.o.data[:16]),
             ),
         ]
 
+        # Edge sequencer table: address 7 (edge count) sets the number of edges &
+        # rewinds the write pointer, subsequent writes to address 6 fill consecutive
+        # table entries. Entries are written as [time (16 bits), channel mask
+        # (15 bits), level].
+        if self.core.edge_sequencer is not None:
+            edge_time = self.rtlink.o.data[: len(self.core.msm.m)]
+            edge_mask = self.rtlink.o.data[
+                16 : 16 + len(self.core.edge_sequencer.output)  # noqa
+            ]
+            self.sync.rio += If(
+                (self.rtlink.o.address == 7) & self.rtlink.o.stb,
+                self.core.edge_sequencer.n_edges.eq(self.rtlink.o.data),
+            )
+            self.comb += [
+                self.core.edge_sequencer.write_data.eq(
+                    Cat(edge_time, edge_mask, self.rtlink.o.data[31])
+                ),
+                self.core.edge_sequencer.write_stb.eq(
+                    (self.rtlink.o.address == 6) & self.rtlink.o.stb
+                ),
+                self.core.edge_sequencer.write_reset.eq(
+                    (self.rtlink.o.address == 7) & self.rtlink.o.stb
+                ),
+            ]
+
+        # Extended register 0: shift the next 32-bit word into the herald lookup table
+        if self.core.herald_lut is not None:
+            self.comb += [
+                self.core.herald_lut.write_data.eq(self.rtlink.o.data),
+                self.core.herald_lut.write_stb.eq(ext_stb(0)),
+            ]
+
+        # Extended register 1: number of excitation windows per cycle
+        self.sync.rio += If(ext_stb(1), self.core.burst_windows.eq(self.rtlink.o.data))
+
+        # Readouts streamed one 14-bit word per read of an extended register, as
+        # (extended register, data)
+        stream_reads = []
+
+        # Extended register 2: arrival time histogram configuration
+        if self.core.histograms:
+            self.sync.rio += If(
+                ext_stb(2),
+                self.core.histogram_offset.eq(self.rtlink.o.data[:16]),
+                self.core.histogram_shift.eq(self.rtlink.o.data[16:20]),
+            )
+
+            # Extended register 3 sets the histogram readout pointer, and each read
+            # of extended register 4 returns the word at the pointer & advances it.
+            # Bin counts are read as two 14-bit words, low word first, for all bins
+            # of APD 0, then APD 1, etc. The pointer is written as [apd][bin][word]
+            # bit fields, but advances linearly: after the last bin of an APD, it
+            # moves to bin 0 of the next APD, so any number of bins is read out
+            # contiguously.
+            histogram_bin_bits = len(self.core.histograms[0].readout_adr)
+            ptr_word = Signal()
+            ptr_bin = Signal.like(self.core.histograms[0].readout_adr)
+            ptr_apd = Signal(max=max(2, num_inputs))
+            histogram_word = Signal()
+            histogram_apd = Signal.like(ptr_apd)
+            self.comb += [
+                histogram.readout_adr.eq(ptr_bin) for histogram in self.core.histograms
+            ]
+            self.sync.rio += [
+                If(
+                    request_stb_ext(3),
+                    ptr_word.eq(request_data[0]),
+                    ptr_bin.eq(request_data[1 : 1 + histogram_bin_bits]),  # noqa
+                    ptr_apd.eq(request_data[1 + histogram_bin_bits :]),  # noqa
+                ),
+                If(
+                    request_stb_ext(4),
+                    ptr_word.eq(~ptr_word),
+                    If(
+                        ptr_word,
+                        If(
+                            ptr_bin == num_histogram_bins - 1,
+                            ptr_bin.eq(0),
+                            ptr_apd.eq(ptr_apd + 1),
+                        ).Else(ptr_bin.eq(ptr_bin + 1)),
+                    ),
+                    histogram_word.eq(ptr_word),
+                    histogram_apd.eq(ptr_apd),
+                ),
+            ]
+            # Extended register 19 zeroes the histograms
+            self.comb += self.core.histogram_clear.eq(ext_stb(19))
+            histogram_counts = Array(h.readout_data for h in self.core.histograms)
+            histogram_data = Signal(14)
+            self.comb += histogram_data.eq(
+                Mux(
+                    histogram_word,
+                    histogram_counts[histogram_apd][14:],
+                    histogram_counts[histogram_apd][:14],
+                )
+            )
+            stream_reads.append((4, histogram_data))
+
+        # Extended register 5 sets the trace readout pointer to a record (counting
+        # from the oldest), and each read of extended register 6 returns the next word
+        # of the trace, record after record.
+        if self.core.trace is not None:
+            trace_record = Signal.like(self.core.trace.readout_record)
+            trace_word = Signal.like(self.core.trace.readout_word)
+            self.comb += [
+                self.core.trace.readout_record.eq(trace_record),
+                self.core.trace.readout_word.eq(trace_word),
+            ]
+            self.sync.rio += [
+                If(request_stb_ext(5), trace_record.eq(request_data), trace_word.eq(0)),
+                If(
+                    request_stb_ext(6),
+                    trace_word.eq(trace_word + 1),
+                    If(
+                        trace_word == self.core.trace.n_words - 1,
+                        trace_word.eq(0),
+                        trace_record.eq(trace_record + 1),
+                    ),
+                ),
+            ]
+            stream_reads.append((6, self.core.trace.readout_data))
+
+        # Extended register 7 takes a snapshot of the run statistics counters, and each
+        # read of extended register 8 returns the next 14-bit word of the snapshot.
+        # Counters are read least significant word first, in the order: cycles,
+        # triggers, time remaining, clicks of each APD, matches of each pattern.
+        statistics_words = []
+        for counter in (
+            [self.core.n_cycles, self.core.n_triggers, self.core.msm.time_remaining]
+            + self.core.n_clicks
+            + self.core.n_matches
+        ):
+            snapshot = Signal.like(counter)
+            self.sync.rio += If(request_stb_ext(7), snapshot.eq(counter))
+            statistics_words += [
+                snapshot[i : i + 14] for i in range(0, len(counter), 14)  # noqa
+            ]
+        statistics_ptr = Signal(max=len(statistics_words))
+        self.sync.rio += [
+            If(request_stb_ext(7), statistics_ptr.eq(0)),
+            If(request_stb_ext(8), statistics_ptr.eq(statistics_ptr + 1)),
+        ]
+        statistics_data = Signal(14)
+        self.sync.rio += statistics_data.eq(Array(statistics_words)[statistics_ptr])
+        stream_reads.append((8, statistics_data))
+
+        # Extended register 10: telemetry interval, in cycles (0 to disable)
+        self.sync.rio += If(
+            ext_stb(10), self.core.telemetry_interval.eq(self.rtlink.o.data)
+        )
+
+        # Extended register 11: abort the run at the next cycle boundary
+        self.comb += self.core.abort_stb.eq(ext_stb(11))
+
+        # Extended register 17 sets the scan readout pointer to a point, and each read
+        # of extended register 18 returns the next word of the scan records, point
+        # after point: [heralded cycles, clicks of each APD...].
+        if self.core.scan is not None:
+            scan_records = self.core.scan.records
+            scan_point = Signal.like(scan_records.readout_record)
+            scan_word = Signal.like(scan_records.readout_word)
+            self.comb += [
+                scan_records.readout_record.eq(scan_point),
+                scan_records.readout_word.eq(scan_word),
+            ]
+            self.sync.rio += [
+                If(request_stb_ext(17), scan_point.eq(request_data), scan_word.eq(0)),
+                If(
+                    request_stb_ext(18),
+                    scan_word.eq(scan_word + 1),
+                    If(
+                        scan_word == scan_records.n_words - 1,
+                        scan_word.eq(0),
+                        scan_point.eq(scan_point + 1),
+                    ),
+                ),
+            ]
+            stream_reads.append((18, scan_records.readout_data))
+
         # Write is_master bit in rio_phy reset domain to not break 422ps trigger
         # forwarding on core.reset().
         self.sync.rio_phy += If(
@@ -110,9 +549,10 @@ class Entangler(Module):
 
         read = Signal()
         read_timings = Signal()
-        read_addr = Signal(3)
+        read_streams = [Signal() for _ in stream_reads]
+        read_addr = Signal(index_width)
 
-        # Input timestamps are [apd0, apd1, apd2, apd3, ref]
+        # Input timestamps are [apd0, apd1, ..., ref]
         input_timestamps = [gater.sig_ts for gater in self.core.apd_gaters]
         input_timestamps.append(self.core.apd_gaters[0].ref_ts)
         cases = {}
@@ -121,19 +561,57 @@ class Entangler(Module):
             cases[i] = [timing_data.eq(ts)]
         self.comb += Case(read_addr, cases)
 
+        # Extended register 9 starts a burst read of data[16:24] consecutive
+        # registers from address data[:16]: one input event is generated per clock
+        # cycle, for each address. Other read requests wait until the burst is done.
+        burst_addr = Signal(address_width)
+        self.sync.rio += If(
+            request_stb_ext(9),
+            burst_addr.eq(request_data),
+            burst_count.eq(request_data[16:24]),
+        ).Elif(
+            burst_count != 0,
+            burst_addr.eq(burst_addr + 1),
+            burst_count.eq(burst_count - 1),
+        )
+
+        # Register & streamed readout reads
+        request_bank = request_address[index_width : index_width + 2]  # noqa
+        read_stb = ~request_address[-1] & request_bank[1]
+        for i, _ in stream_reads:
+            read_stb = read_stb | request_stb_ext(i)
         self.sync.rio += [
             If(read, read.eq(0)),
             If(
-                self.rtlink.o.stb,
-                read.eq(read_en),
-                read_timings.eq(self.rtlink.o.address[3:5] == 0b11),
-                read_addr.eq(self.rtlink.o.address[:3]),
+                request,
+                read.eq(read_stb),
+                read_timings.eq(request_bank == 0b11),
+                *(
+                    read_stream.eq(request_stb_ext(i))
+                    for read_stream, (i, _) in zip(read_streams, stream_reads)
+                ),
+                read_addr.eq(request_address[:index_width]),
+            ),
+            If(
+                burst_count != 0,
+                read.eq(1),
+                read_timings.eq(
+                    burst_addr[index_width : index_width + 2] == 0b11  # noqa
+                ),
+                *(read_stream.eq(0) for read_stream in read_streams),
+                read_addr.eq(burst_addr[:index_width]),
             ),
         ]
 
-        status = Signal(3)
+        status = Signal(5)
         self.comb += status.eq(
-            Cat(self.core.msm.ready, self.core.msm.success, self.core.msm.timeout)
+            Cat(
+                self.core.msm.ready,
+                self.core.msm.success,
+                self.core.msm.timeout,
+                self.core.msm.aborted,
+                commit_pending,
+            )
         )
 
         reg_read = Signal(14)
@@ -142,21 +620,104 @@ class Entangler(Module):
         cases[1] = [reg_read.eq(self.core.msm.cycles_completed)]
         cases[2] = [reg_read.eq(self.core.msm.time_remaining)]
         cases[3] = [reg_read.eq(self.core.triggers_received)]
+        cases[4] = [reg_read.eq(self.core.herald_window)]
+        if self.core.trace is not None:
+            cases[5] = [reg_read.eq(self.core.trace.count)]
+        if self.core.scan is not None:
+            cases[6] = [reg_read.eq(scan_records.count)]
         self.comb += Case(read_addr, cases)
 
-        # Generate an input event if we have a read request RTIO Output event, or if the
-        # core has finished. If the core is finished output the herald match, or 0x3fff
-        # on timeout.
+        read_data = Signal(14)
+        read_value = Mux(read_timings, timing_data, reg_read)
+        for read_stream, (_, data) in zip(read_streams, stream_reads):
+            read_value = Mux(read_stream, data, read_value)
+        self.comb += read_data.eq(read_value)
+
+        # Completion report: if enabled, the core-done event is followed by one input
+        # event per clock cycle with the cycle count, the trigger count and the input
+        # timestamps [apd0, apd1, ..., ref].
+        report_words = [self.core.msm.cycles_completed, self.core.triggers_received]
+        report_words += input_timestamps
+        report_idx = Signal(max=len(report_words) + 1)  # 0 when not reporting
+        report_data = Signal(14)
+        self.comb += report_data.eq(Array([0] + report_words)[report_idx])
+
+        # Telemetry: one input event per clock cycle with the words latched by the core
+        # every telemetry_interval cycles: [cycles, triggers, clicks of each APD...].
+        telemetry_idx = Signal(max=len(self.core.telemetry) + 1)  # 0 when idle
+        telemetry_data = Signal(14)
+        self.comb += telemetry_data.eq(Array([0] + self.core.telemetry)[telemetry_idx])
+
+        # Generate an input event if the core has finished (or re-armed after a
+        # success in a continuous run), for each completion report & telemetry word,
+        # and for each read request RTIO Output event. If the core is finished output
+        # the herald match (or the click pattern in herald lookup table mode), 0x3fff
+        # on timeout, or ABORT_CODE if aborted. The top two data bits tag the source
+        # of the event.
         #
-        # Simultaneous read requests and core-done events are not currently handled, but
-        # are easy to avoid in the client code.
+        # Core events have priority, as their timestamp marks the end of the run. The
+        # completion report is stalled by core events, telemetry by both, and read
+        # responses are queued until none of them is being sent, so simultaneous
+        # events are never dropped as long as at most ``read_queue_depth`` read
+        # responses are pending. The telemetry interval must be long enough for each
+        # telemetry record to be sent before the next one is latched.
+        core_event = Signal()
+        self.comb += core_event.eq(
+            self.core.enable & (self.core.msm.done_stb | self.core.msm.herald_stb)
+        )
+        reporting = Signal()
+        self.comb += reporting.eq((report_idx != 0) & ~core_event)
+        self.sync.rio += If(
+            self.core.enable & self.core.msm.done_stb & report_enable, report_idx.eq(1)
+        ).Elif(
+            reporting,
+            report_idx.eq(report_idx + 1),
+            If(report_idx == len(report_words), report_idx.eq(0)),
+        )
+        sending_telemetry = Signal()
+        self.comb += sending_telemetry.eq(
+            (telemetry_idx != 0) & ~core_event & ~reporting
+        )
+        self.sync.rio += If(
+            self.core.enable & self.core.telemetry_stb, telemetry_idx.eq(1)
+        ).Elif(
+            sending_telemetry,
+            telemetry_idx.eq(telemetry_idx + 1),
+            If(telemetry_idx == len(self.core.telemetry), telemetry_idx.eq(0)),
+        )
+
+        read_queue = ClockDomainsRenamer("rio")(SyncFIFO(14, read_queue_depth))
+        self.submodules.read_queue = read_queue
         self.comb += [
-            self.rtlink.i.stb.eq(read | self.core.enable & self.core.msm.done_stb),
-            self.rtlink.i.data.eq(
-                Mux(
-                    self.core.enable & self.core.msm.done_stb,
-                    Mux(self.core.msm.success, self.core.heralder.matches, 0x3FFF),
-                    Mux(read_timings, timing_data, reg_read),
-                )
+            read_queue.din.eq(read_data),
+            read_queue.we.eq(read),
+            read_queue.re.eq(~core_event & ~reporting & ~sending_telemetry),
+        ]
+
+        self.comb += [
+            self.rtlink.i.stb.eq(
+                core_event | reporting | sending_telemetry | read_queue.readable
             ),
+            If(
+                core_event,
+                self.rtlink.i.data.eq(
+                    Cat(
+                        Mux(
+                            self.core.msm.success,
+                            self.core.herald_result,
+                            Mux(self.core.msm.aborted, ABORT_CODE, 0x3FFF),
+                        ),
+                        Constant(TAG_EVENT, 2),
+                    )
+                ),
+            )
+            .Elif(
+                reporting,
+                self.rtlink.i.data.eq(Cat(report_data, Constant(TAG_REPORT, 2))),
+            )
+            .Elif(
+                sending_telemetry,
+                self.rtlink.i.data.eq(Cat(telemetry_data, Constant(TAG_TELEMETRY, 2))),
+            )
+            .Else(self.rtlink.i.data.eq(Cat(read_queue.dout, Constant(TAG_READ, 2)))),
         ]
@@ -0,0 +1,310 @@
+"""Entanglement rate estimates, and optimization of the gate windows.
+
+:class:`RateEstimator` predicts how often the ``Entangler`` heralds, and how many of
+those heralds are false (caused by dark counts, or a click pattern the photons did
+not produce), from the photon arrival time distribution, detection efficiency and
+dark count rate of each APD input. The rates are per second of wall time, and
+include the idle clock cycles the main state machine spends between cycles and
+runs (see :mod:`entangler.model`).
+
+:meth:`RateEstimator.optimize` then searches the gate windows, and the shortest
+cycle length that fits them, for the highest rate of true heralds. The resulting
+:class:`GateSettings` are applied to an :class:`entangler.driver.EntanglerConfig`,
+ready for :meth:`entangler.driver.Entangler.upload_config`.
+
+The estimate assumes a single excitation per cycle, with a reference edge at a
+fixed time in the cycle, and independent detectors: each photon a detector should
+see is detected with its efficiency, and dark counts are Poissonian. Runs are
+assumed to end on a herald (not on timeout).
+"""
+import numpy as np
+
+from entangler.model import CYCLE_GAP
+from entangler.model import RUN_START_DELAY
+
+
+class GateSettings:
+    """Gate windows & cycle length chosen by :meth:`RateEstimator.optimize`.
+
+    Attributes:
+        gate_starts_mu, gate_stops_mu: gate window of each APD input, in mu after
+            the reference edge, as passed to ``set_timing_mu``.
+        cycle_length_mu: cycle length, as passed to ``set_cycle_length_mu``.
+        heralds: herald patterns, as passed to ``set_heralds``.
+        estimate: the :meth:`RateEstimator.estimate` for these settings.
+    """
+
+    def __init__(
+        self, gate_starts_mu, gate_stops_mu, cycle_length_mu, heralds, estimate
+    ):
+        """Hold the settings, with times converted to Python ints.
+
+        Args:
+            gate_starts_mu, gate_stops_mu: gate window of each APD input, in mu
+                after the reference edge.
+            cycle_length_mu: cycle length, in mu.
+            heralds: herald patterns.
+            estimate (dict): the :meth:`RateEstimator.estimate` for these settings.
+        """
+        self.gate_starts_mu = [int(t) for t in gate_starts_mu]
+        self.gate_stops_mu = [int(t) for t in gate_stops_mu]
+        self.cycle_length_mu = int(cycle_length_mu)
+        self.heralds = list(heralds)
+        self.estimate = estimate
+
+    def apply(self, config):
+        """Set the gate windows, cycle length & heralds of a configuration.
+
+        Args:
+            config (:class:`entangler.driver.EntanglerConfig`): the configuration
+                to update. Its other registers (config flags, sequencer timings...)
+                are left as they are.
+        """
+        for i, (start, stop) in enumerate(zip(self.gate_starts_mu, self.gate_stops_mu)):
+            config.set_timing_mu(config.gate_address(i), start, stop)
+        config.set_cycle_length_mu(self.cycle_length_mu)
+        config.set_heralds(self.heralds)
+
+
+class RateEstimator:
+    """Predict the entanglement rate of the ``Entangler`` for given gate windows."""
+
+    def __init__(
+        self,
+        arrival,
+        photon_patterns,
+        heralds,
+        num_inputs=4,
+        efficiencies=1.0,
+        dark_rates=0.0,
+        t_ref_mu=0,
+        min_cycle_length_mu=0,
+        pipelined=False,
+        run_overhead=0.0,
+        mu=1e-9,
+        coarse_period_mu=8,
+    ):
+        """Describe the experiment & gateware settings the estimate is for.
+
+        Args:
+            arrival: photon arrival time distribution of each APD input (shape
+                ``(num_inputs, n)``), or of all of them (shape ``(n,)``): element
+                ``t`` is the (relative) probability that a photon is timestamped
+                ``t`` mu after the reference edge, e.g. an arrival time histogram of
+                :meth:`entangler.driver.Entangler.get_histogram`. Each distribution
+                is normalized.
+            photon_patterns (dict): probability, per cycle, of each pattern of
+                inputs that photons are sent to (bit ``i`` set if input ``i``
+                receives a photon), before detection losses. E.g. ``{0b0101: p / 2,
+                0b1010: p / 2}`` for photon pairs.
+            heralds (list[int]): herald patterns, as passed to ``set_heralds``.
+            num_inputs (int, optional): Number of APD inputs the gateware was built
+                with. Defaults to 4.
+            efficiencies (optional): detection efficiency of each input, or of all
+                of them. Defaults to 1.
+            dark_rates (optional): dark count rate of each input, or of all of
+                them, in counts per second. Defaults to 0.
+            t_ref_mu (int, optional): time of the reference edge after the start
+                of the cycle, in mu. Defaults to 0.
+            min_cycle_length_mu (int, optional): shortest cycle length, e.g. to fit
+                the sequencer outputs, in mu. Defaults to 0.
+            pipelined (bool, optional): if the cycles are pipelined (see
+                ``set_config``). Defaults to False.
+            run_overhead (float, optional): time between the end of a run and the
+                start of the next, in seconds (e.g. kernel latency). Defaults to 0.
+            mu (float, optional): duration of a machine unit, in seconds. Defaults
+                to 1 ns.
+            coarse_period_mu (int, optional): coarse clock period, in mu. Defaults
+                to 8.
+        """
+        self.num_inputs = num_inputs
+        arrival = np.array(arrival, dtype=float)
+        arrival = np.broadcast_to(arrival, (num_inputs, arrival.shape[-1]))
+        self.arrival = arrival / arrival.sum(axis=1, keepdims=True)
+        # Cumulative distribution, for the probability of arriving in a window
+        self._cdf = np.concatenate(
+            [np.zeros((self.num_inputs, 1)), np.cumsum(self.arrival, axis=1)], axis=1
+        )
+        self.photon_patterns = dict(photon_patterns)
+        self.heralds = list(heralds)
+        self.efficiencies = np.broadcast_to(
+            np.array(efficiencies, dtype=float), self.num_inputs
+        )
+        self.dark_rates = np.broadcast_to(
+            np.array(dark_rates, dtype=float), self.num_inputs
+        )
+        self.t_ref_mu = t_ref_mu
+        self.min_cycle_length_mu = min_cycle_length_mu
+        self.pipelined = pipelined
+        self.run_overhead = run_overhead
+        self.mu = mu
+        self.coarse_period_mu = coarse_period_mu
+
+    def cycle_length_mu(self, gate_stop_mu):
+        """Shortest cycle length that sees the edges up to the end of the gates.
+
+        Edges are only heralded on if they are seen before the herald is checked,
+        on the last (or, if pipelined, the second last) clock cycle of the cycle.
+
+        Args:
+            gate_stop_mu: latest end of the gate windows, in mu after the reference
+                edge. Can be an array.
+        """
+        # The gateware offsets the gate windows by 1 mu, see set_timing_mu
+        t_last = self.t_ref_mu + np.asarray(gate_stop_mu) + 1
+        m_end = t_last // self.coarse_period_mu + 1 + int(self.pipelined)
+        m_min = -(-self.min_cycle_length_mu // self.coarse_period_mu)
+        return np.maximum(m_end, m_min) * self.coarse_period_mu
+
+    def _herald_probabilities(self, detected, dark):
+        """Probability of a true herald & of any herald in a cycle.
+
+        Args:
+            detected: probability that each input detects its photon in the gate
+                window (shape ``(num_inputs, ...)``).
+            dark: probability of a dark count in the gate window of each input.
+        """
+        click = 1 - (1 - detected) * (1 - dark)
+        p_true = np.zeros(detected.shape[1:])
+        p_herald = np.zeros(detected.shape[1:])
+        no_photon = 1 - sum(self.photon_patterns.values())
+        for pattern, probability in list(self.photon_patterns.items()) + [
+            (0, no_photon)
+        ]:
+            for herald in set(self.heralds):
+                p = probability
+                true = probability if herald == pattern else 0
+                for i in range(self.num_inputs):
+                    sent = pattern >> i & 1
+                    if herald >> i & 1:
+                        p = p * (click[i] if sent else dark[i])
+                        true = true * detected[i]
+                    else:
+                        p = p * (1 - (click[i] if sent else dark[i]))
+                        true = true * (1 - dark[i])
+                p_herald = p_herald + p
+                p_true = p_true + true
+        return p_true, p_herald
+
+    def estimate(self, gate_starts_mu, gate_stops_mu, cycle_length_mu=None):
+        """Estimate the herald rates for given gate windows.
+
+        Args:
+            gate_starts_mu, gate_stops_mu: gate window of each APD input, in mu
+                after the reference edge (inclusive). Can be arrays, with the input
+                along the first axis.
+            cycle_length_mu (optional): cycle length, in mu. Defaults to the
+                shortest that fits the gate windows, see :meth:`cycle_length_mu`.
+
+        Returns:
+            dict with:
+
+            * ``success_rate``: true heralds per second.
+            * ``herald_rate``: heralds per second.
+            * ``false_fraction``: fraction of the heralds that are false.
+            * ``p_herald`` & ``p_true``: probabilities of a herald & of a true
+              herald in a cycle.
+            * ``cycle_length_mu``: the cycle length.
+        """
+        starts = np.asarray(gate_starts_mu)
+        stops = np.asarray(gate_stops_mu)
+        if cycle_length_mu is None:
+            cycle_length_mu = self.cycle_length_mu(stops.max(axis=0))
+        n_bins = self.arrival.shape[1]
+        inputs = np.arange(self.num_inputs).reshape((-1,) + (1,) * (starts.ndim - 1))
+        # The gateware offsets the gate windows by 1 mu, see set_timing_mu
+        detected = self.efficiencies.reshape(inputs.shape) * (
+            self._cdf[inputs, np.clip(stops + 2, 0, n_bins)]
+            - self._cdf[inputs, np.clip(starts + 1, 0, n_bins)]
+        )
+        width_s = np.maximum(stops - starts + 1, 0) * self.mu
+        dark = 1 - np.exp(-self.dark_rates.reshape(inputs.shape) * width_s)
+        p_true, p_herald = self._herald_probabilities(detected, dark)
+
+        # A run of k cycles lasts k cycles, plus the clock cycles to start the
+        # run and to finish it after the last cycle
+        m_end = np.asarray(cycle_length_mu) // self.coarse_period_mu
+        cycle_clocks = m_end + 1 + (0 if self.pipelined else CYCLE_GAP)
+        run_clocks = RUN_START_DELAY - (0 if self.pipelined else CYCLE_GAP)
+        clock = self.coarse_period_mu * self.mu
+        cycle_time = cycle_clocks * clock
+        run_time = run_clocks * clock + self.run_overhead
+        # Expected time per herald is cycle_time / p_herald + run_time, so the
+        # wall time per cycle is cycle_time + p_herald * run_time
+        time_per_cycle = cycle_time + p_herald * run_time
+        return {
+            "success_rate": p_true / time_per_cycle,
+            "herald_rate": p_herald / time_per_cycle,
+            "false_fraction": (p_herald - p_true)
+            / np.maximum(p_herald, np.finfo(float).tiny),
+            "p_herald": p_herald,
+            "p_true": p_true,
+            "cycle_length_mu": cycle_length_mu,
+        }
+
+    def optimize(
+        self, max_false_fraction=1.0, min_gate_start_mu=8, step_mu=1, max_rounds=20
+    ):
+        """Find the gate windows & cycle length with the highest success rate.
+
+        The gate window of each input is optimized in turn, over all the windows in
+        the arrival time distribution, until none improves.
+
+        Args:
+            max_false_fraction (float, optional): largest acceptable fraction of
+                false heralds. Defaults to 1 (no limit).
+            min_gate_start_mu (int, optional): earliest gate start. The gateware
+                only applies the gate windows of a reference edge from the next
+                coarse clock cycle. Defaults to 8.
+            step_mu (int, optional): resolution of the search, in mu. Defaults to 1.
+            max_rounds (int, optional): maximum number of passes over the inputs.
+                Defaults to 20.
+
+        Returns:
+            :class:`GateSettings`: the best settings. If no gate windows meet
+            ``max_false_fraction``, the gates are closed (never herald).
+        """
+        n_bins = self.arrival.shape[1]
+        times = np.arange(min_gate_start_mu, n_bins - 1, step_mu)
+        if len(times) == 0:
+            raise ValueError("No arrival times after min_gate_start_mu")
+        grid_starts, grid_stops = np.meshgrid(times, times, indexing="ij")
+        valid = grid_stops >= grid_starts
+        grid_starts, grid_stops = grid_starts[valid], grid_stops[valid]
+
+        def score(starts, stops):
+            estimate = self.estimate(starts, stops)
+            ok = estimate["false_fraction"] <= max_false_fraction
+            return np.where(ok, estimate["success_rate"], -1.0)
+
+        # Start from gates covering the whole distribution
+        starts = np.full(self.num_inputs, times[0])
+        stops = np.full(self.num_inputs, times[-1])
+        best = score(starts, stops)
+        for _ in range(max_rounds):
+            improved = False
+            for i in range(self.num_inputs):
+                candidate_starts = np.repeat(starts[:, None], len(grid_starts), axis=1)
+                candidate_stops = np.repeat(stops[:, None], len(grid_stops), axis=1)
+                candidate_starts[i] = grid_starts
+                candidate_stops[i] = grid_stops
+                scores = score(candidate_starts, candidate_stops)
+                j = np.argmax(scores)
+                if scores[j] > best:
+                    best = scores[j]
+                    starts, stops = candidate_starts[:, j], candidate_stops[:, j]
+                    improved = True
+            if not improved:
+                break
+
+        if best < 0:
+            # Closed gate: starts after it stops
+            starts = np.full(self.num_inputs, times[0] + 1)
+            stops = np.full(self.num_inputs, times[0])
+        return GateSettings(
+            starts,
+            stops,
+            self.cycle_length_mu(stops.max()),
+            self.heralds,
+            self.estimate(starts, stops),
+        )
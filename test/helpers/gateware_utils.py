@@ -32,3 +32,25 @@ class MockPhy(Module):
                 self.fine_ts.eq(self.t_event[:3]),
             ),
         ]
+
+
+class ReplayPhy(Module):
+    """Replay input edges at given times of each cycle of an ``EntanglerCore``.
+
+    Unlike :class:`MockPhy`, the edge is seen on the clock cycle the counter reaches
+    its time (not the next one), and only while the counter runs through a cycle,
+    so edge times are relative to the start of the current cycle.
+    """
+
+    def __init__(self, counter, counting):
+        """Define the logic to replay an edge at time ``t_event`` if ``valid``."""
+        self.fine_ts = Signal(3)
+        self.stb_rising = Signal()
+        self.t_event = Signal(14)
+        self.valid = Signal()
+
+        # # #
+        self.comb += [
+            self.stb_rising.eq(self.valid & counting & (counter == self.t_event[3:])),
+            self.fine_ts.eq(self.t_event[:3]),
+        ]
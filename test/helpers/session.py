@@ -0,0 +1,99 @@
+"""Simulate many testbenches on a harness elaborated only once.
+
+:func:`migen.run_simulation` elaborates its module on every call: it collects the
+fragments of all submodules, lowers memories to registers, and inserts resets.
+For short testbenches, e.g. the points of a sweep, that costs as much as the
+simulation itself. A :class:`SimSession` elaborates its harness once, and puts
+every signal (and memory word) back to its reset value before each run, so each
+run behaves exactly as on a freshly instantiated harness.
+"""
+import collections
+import collections.abc
+import inspect
+import operator
+
+from migen.fhdl.structure import _Fragment
+from migen.fhdl.tools import list_signals
+from migen.sim.core import Simulator
+from migen.sim.core import TimeManager
+
+
+class SimSession:
+    """Simulation of a harness running many testbenches, each from the reset state.
+
+    Wraps a :class:`migen.sim.Simulator`, whose state is reset between runs.
+
+    Example:
+        >>> session = SimSession(PhyHarness(), clocks)
+        >>> for timeout in range(1, 20):
+        ...     session.run(timeout_point(session.dut, timeout))
+    """
+
+    def __init__(self, dut, clocks=None, special_overrides=None):
+        """Elaborate the harness.
+
+        Args:
+            dut: the harness :class:`migen.Module` (or fragment) to simulate.
+            clocks (dict, optional): clock domains & periods of the simulation, as
+                for :func:`migen.run_simulation`. Defaults to a single ``sys``
+                clock.
+            special_overrides (dict, optional): as for :func:`migen.run_simulation`.
+        """
+        self.dut = dut
+        self.clocks = clocks or {"sys": 8}
+        self.n_runs = 0
+        fragment = dut if isinstance(dut, _Fragment) else dut.get_fragment()
+        # Elaboration creates more signals, in no particular order
+        self._harness_signals = sorted(
+            list_signals(fragment), key=lambda signal: signal.duid
+        )
+        self.simulator = Simulator(
+            fragment, [], clocks=self.clocks, special_overrides=special_overrides or {}
+        )
+
+    def reset(self):
+        """Put every signal back to its reset value, and the clocks to time 0."""
+        simulator = self.simulator
+        simulator.evaluator.signal_values.clear()
+        simulator.evaluator.modifications.clear()
+        simulator.time = TimeManager(
+            collections.OrderedDict(
+                sorted(self.clocks.items(), key=operator.itemgetter(0))
+            )
+        )
+        simulator.generators = dict()
+        simulator.passive_generators = set()
+
+    def run(self, generators):
+        """Reset the harness, and simulate it until the generators finish.
+
+        Args:
+            generators: testbench generator(s), as for :func:`migen.run_simulation`:
+                a generator or list of generators for the ``sys`` clock domain,
+                or a dict of them by clock domain.
+        """
+        self.reset()
+        self.n_runs += 1
+        if not isinstance(generators, dict):
+            generators = {"sys": generators}
+        for k, v in generators.items():
+            if isinstance(v, collections.abc.Iterable) and not inspect.isgenerator(v):
+                self.simulator.generators[k] = list(v)
+            else:
+                self.simulator.generators[k] = [v]
+        self.simulator.run()
+
+    def state(self):
+        """Return the current value of every signal & memory word of the harness.
+
+        Returns:
+            list: the values, in the order the signals & memories were created in,
+            so states of separately instantiated harnesses can be compared. Signals
+            only created by elaboration (e.g. of memory ports) are left out.
+        """
+        signals = list(self._harness_signals)
+        evaluator = self.simulator.evaluator
+        memories = evaluator.replaced_memories
+        for memory in sorted(memories, key=lambda memory: memory.duid):
+            signals.extend(memories[memory])
+        return [evaluator.eval(signal) for signal in signals]
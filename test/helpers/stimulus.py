@@ -0,0 +1,257 @@
+"""Random input stimulus for ``Entangler`` testbenches, and checking its results.
+
+:func:`random_edges` draws the reference & APD edges of many cycles at once with
+NumPy: photons with arrival time jitter and detection losses, and dark counts. The
+edges are in the format of :meth:`entangler.model.CoreModel.cycles`, so the model
+predicts what the gateware should do with them.
+
+:class:`EdgeReplay` replays them from memory into :class:`ReplayPhy` inputs, cycle
+after cycle, without any testbench code running on each clock cycle.
+:class:`Scoreboard` records the RTIO input events of an
+:class:`entangler.phy.Entangler`, and checks them against the heralds the model
+expects.
+"""
+import numpy as np
+from migen import Array
+from migen import C
+from migen import Cat
+from migen import Module
+from migen import Mux
+from migen import passive
+from migen import Signal
+
+from entangler.phy import TAG_EVENT
+from gateware_utils import ReplayPhy  # ./helpers/gateware_utils
+
+
+def random_edges(
+    rng,
+    n_cycles,
+    m_end,
+    num_inputs=4,
+    t_ref_mu=16,
+    ref_jitter_mu=0.0,
+    p_ref=1.0,
+    photon_patterns=None,
+    arrival_mu=(20, 40),
+    jitter_mu=0.0,
+    efficiency=1.0,
+    dark_rate=0.0,
+    max_edges=4,
+):
+    """Draw random reference & APD edges for ``n_cycles`` cycles.
+
+    Args:
+        rng (:class:`numpy.random.Generator`): random number generator, e.g.
+            ``numpy.random.default_rng(seed)`` for reproducible stimulus.
+        n_cycles (int): number of cycles.
+        m_end (int): cycle length, in coarse clock cycles. Edges after the end of
+            the cycle are dropped.
+        num_inputs (int, optional): number of APD inputs. Defaults to 4.
+        t_ref_mu (int, optional): time of the reference edge after the start of
+            the cycle, in mu. Defaults to 16.
+        ref_jitter_mu (float, optional): standard deviation of the reference edge
+            time, in mu. Defaults to 0.
+        p_ref (float, optional): probability of a reference edge in a cycle.
+            Defaults to 1.
+        photon_patterns (dict, optional): probability of each pattern of inputs
+            photons are sent to in a cycle, see
+            :class:`entangler.rate.RateEstimator`. Defaults to none.
+        arrival_mu (tuple, optional): range of photon arrival times after the
+            reference edge, in mu: photons arrive uniformly in ``[start, stop)``.
+            Defaults to ``(20, 40)``.
+        jitter_mu (float, optional): standard deviation of the photon arrival
+            times, in mu. Defaults to 0.
+        efficiency (float, optional): probability of detecting a photon. Defaults
+            to 1.
+        dark_rate (float, optional): dark count rate of each input, in counts per
+            mu. Defaults to 0.
+        max_edges (int, optional): maximum number of edges of an input in a cycle.
+            Later edges are dropped. Defaults to 4.
+
+    Returns:
+        tuple: reference edge times (shape ``(n_cycles,)``) & APD edge times (shape
+        ``(n_cycles, num_inputs, max_edges)``), in mu after the start of the cycle,
+        or -1 for no edge. As for the TTL input PHYs, an input has at most one edge
+        per coarse clock cycle: the first one.
+    """
+    t_end = 8 * m_end
+    t_ref = np.rint(t_ref_mu + ref_jitter_mu * rng.standard_normal(n_cycles))
+    has_ref = (rng.random(n_cycles) < p_ref) & (t_ref >= 0) & (t_ref < t_end)
+    ref = np.where(has_ref, t_ref, -1).astype(np.int64)
+
+    # Photons: without a reference edge, there is no excitation either
+    sent = np.zeros(n_cycles, dtype=np.int64)
+    if photon_patterns:
+        patterns = list(photon_patterns) + [0]
+        probabilities = list(photon_patterns.values())
+        probabilities.append(1 - sum(probabilities))
+        sent = rng.choice(patterns, size=n_cycles, p=probabilities)
+    sent = ((sent[:, None] >> np.arange(num_inputs)) & 1).astype(bool)
+    detected = sent & has_ref[:, None] & (rng.random(sent.shape) < efficiency)
+    t_photon = (
+        t_ref[:, None]
+        + rng.uniform(arrival_mu[0], arrival_mu[1], sent.shape)
+        + jitter_mu * rng.standard_normal(sent.shape)
+    )
+    photons = np.where(detected, np.floor(t_photon), -1)
+
+    # Dark counts: Poissonian, uniform over the cycle
+    n_dark = np.minimum(rng.poisson(dark_rate * t_end, sent.shape), max_edges)
+    t_dark = rng.integers(0, t_end, sent.shape + (max_edges,))
+    t_dark[n_dark[:, :, None] <= np.arange(max_edges)] = -1
+
+    edges = np.concatenate([photons[:, :, None], t_dark], axis=2).astype(np.int64)
+    edges[(edges < 0) | (edges >= t_end)] = -1
+    # Keep the first edge of each coarse clock cycle, in time order
+    edges = np.where(edges >= 0, edges, np.iinfo(np.int64).max)
+    edges.sort(axis=2)
+    coarse = edges >> 3
+    edges[:, :, 1:][coarse[:, :, 1:] == coarse[:, :, :-1]] = np.iinfo(np.int64).max
+    edges.sort(axis=2)
+    edges = np.where(edges == np.iinfo(np.int64).max, -1, edges)
+    return ref, edges[:, :, :max_edges]
+
+
+class EdgeReplay(Module):
+    """Replay per-cycle edges from memory into :class:`ReplayPhy` inputs.
+
+    The edges of cycle ``j`` are replayed in the ``j``-th cycle since the start of
+    the simulation, as counted by ``cycle_stb``. Edges after the end of a cycle
+    (e.g. on early exit) are skipped. Once all cycles are replayed, there are no
+    more edges.
+    """
+
+    def __init__(self, counter, counting, cycle_stb, ref, apd):
+        """Load edges into memory, and create the replay PHYs.
+
+        Args:
+            counter: cycle counter (``m``) of the core.
+            counting: asserted while the counter runs through a cycle.
+            cycle_stb: pulsed on the last clock cycle of each cycle.
+            ref: reference edge times of each cycle, as from :func:`random_edges`.
+            apd: APD edge times of each cycle, as from :func:`random_edges`.
+        """
+        ref = np.asarray(ref)
+        apd = np.asarray(apd)
+        if apd.ndim == 2:
+            apd = apd[:, :, None]
+        n_cycles, num_inputs, n_edges = apd.shape
+        # Edge slots per cycle, a power of 2 to index memory with Cat(slot, cycle)
+        slot_width = max(1, (n_edges - 1).bit_length())
+        n_slots = 1 << slot_width
+        self.n_cycles = n_cycles
+
+        # Cycle n_cycles has no edges, and replays once all cycles are replayed
+        self.cycle = Signal(max=n_cycles + 1)
+        self._next_cycle = Mux(
+            cycle_stb & (self.cycle < n_cycles), self.cycle + 1, self.cycle
+        )[: len(self.cycle)]
+        self.sync += self.cycle.eq(self._next_cycle)
+
+        self.phy_apds = []
+        for i in range(num_inputs):
+            phy = self._replay(
+                counter, counting, cycle_stb, apd[:, i], n_slots, slot_width
+            )
+            setattr(self.submodules, "phy_apd{}".format(i), phy)
+            self.phy_apds.append(phy)
+        self.submodules.phy_ref = self._replay(
+            counter, counting, cycle_stb, ref[:, None], n_slots, slot_width
+        )
+
+    def _replay(self, counter, counting, cycle_stb, times, n_slots, slot_width):
+        """Replay PHY reading its edges from memory."""
+        phy = ReplayPhy(counter, counting)
+        words = np.zeros((len(times) + 1, n_slots), dtype=np.int64)
+        words[:-1, : times.shape[1]] = np.where(
+            times >= 0, (1 << 14) | (times & 0x3FFF), 0
+        )
+        memory = Array(C(int(word), 15) for word in words.ravel())
+
+        # The edge of the next slot is read on each clock edge, so that the replayed
+        # edges are registers: the simulator then settles the logic they drive in
+        # its first pass over the combinatorial statements
+        slot = Signal(slot_width + 1)
+        next_slot = Mux(cycle_stb, 0, slot + phy.stb_rising)[: len(slot)]
+        valid = Signal()
+        self.comb += phy.valid.eq(valid & (slot < n_slots))
+        self.sync += [
+            slot.eq(next_slot),
+            Cat(phy.t_event, valid).eq(
+                memory[Cat(next_slot[:slot_width], self._next_cycle)]
+            ),
+        ]
+        return phy
+
+
+class Scoreboard:
+    """Record the RTIO input events of an ``Entangler``, and check them.
+
+    Run :meth:`monitor` alongside the testbench. It records each input event with
+    the index of the run it happened in, and its time in clock cycles since the
+    start of that run (the write to the run register).
+    """
+
+    def __init__(self, rtlink, run_addresses=(1, 4)):
+        """Monitor an ``Entangler`` RTIO link.
+
+        Args:
+            rtlink: the ``rtlink`` of the :class:`entangler.phy.Entangler`.
+            run_addresses (tuple, optional): register addresses that start a run.
+                Defaults to the run & continuous run registers.
+        """
+        self.rtlink = rtlink
+        self.run_addresses = run_addresses
+        self.n_runs = 0
+        # (run, clock cycles since the run started, data) of each input event
+        self.events = []
+
+    @passive
+    def monitor(self):
+        """Testbench generator recording the input events."""
+        clock = 0
+        t_run = 0
+        while True:
+            if (yield self.rtlink.o.stb):
+                if (yield self.rtlink.o.address) in self.run_addresses:
+                    self.n_runs += 1
+                    t_run = clock
+            if (yield self.rtlink.i.stb):
+                data = yield self.rtlink.i.data
+                self.events.append((self.n_runs - 1, clock - t_run, data))
+            clock += 1
+            yield
+
+    @staticmethod
+    def expected_events(run):
+        """List the herald & run result events a run of the model gives.
+
+        Args:
+            run (dict): the result of :meth:`entangler.model.CoreModel.run`.
+
+        Returns:
+            list of (clock cycles since the start of the run, data) tuples.
+        """
+        events = [
+            (int(t), int(result) | (TAG_EVENT << 14))
+            for t, result in zip(run["herald_times"], run["herald_results"])
+        ]
+        if not events or events[-1][0] != run["done"]:
+            events.append((int(run["done"]), int(run["result"]) | (TAG_EVENT << 14)))
+        return events
+
+    def check(self, index, run):
+        """Check the herald & result events of a run are as the model expects.
+
+        Args:
+            index (int): index of the run, from 0 for the first run monitored.
+            run (dict): the result of :meth:`entangler.model.CoreModel.run`.
+        """
+        events = [
+            (t, data)
+            for i, t, data in self.events
+            if i == index and data >> 14 == TAG_EVENT
+        ]
+        expected = self.expected_events(run)
+        assert events == expected, "run {}: {} != {}".format(index, events, expected)
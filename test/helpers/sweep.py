@@ -0,0 +1,175 @@
+"""Run independent gateware simulations of a parameter sweep in parallel.
+
+Each point of a sweep is a separate simulation of a harness from
+``harness_factory``, driven by the generator ``stimulus(dut, **params)``. Points
+are fanned out across a process pool, and the value each stimulus generator
+returns is collected, with any failure, in a :class:`SweepResult`.
+
+Each worker elaborates its harness only once, and simulates all its points in a
+:class:`SimSession`, which resets the harness between points.
+
+The harness factory & stimulus must be picklable (module-level functions or
+classes, or :func:`functools.partial` of them), and so must the parameters and
+returned values.
+"""
+import concurrent.futures
+import os
+import traceback
+
+from migen import run_simulation
+
+from session import SimSession  # ./helpers/session
+
+
+class SweepResult:
+    """Outcome of one point of a sweep.
+
+    Attributes:
+        params (dict): the stimulus parameters of the point.
+        value: the value returned by the stimulus generator, or None if it failed.
+        error (str): the traceback of the failure, or None if it succeeded.
+    """
+
+    def __init__(self, params, value=None, error=None):
+        """Record the outcome of a point.
+
+        Args:
+            params (dict): the stimulus parameters of the point.
+            value (optional): the value returned by the stimulus generator.
+            error (str, optional): the traceback of the failure, if it failed.
+        """
+        self.params = params
+        self.value = value
+        self.error = error
+
+    @property
+    def ok(self):
+        """Whether the point ran without failing."""
+        return self.error is None
+
+    def __repr__(self):
+        """Show the parameters, and the value or the last line of the failure."""
+        if self.ok:
+            return "SweepResult({!r}, {!r})".format(self.params, self.value)
+        return "SweepResult({!r}, error={!r})".format(
+            self.params, self.error.strip().splitlines()[-1]
+        )
+
+
+def _collect(stimulus, dut, params, values):
+    """Drive the simulation with the stimulus, and keep the value it returns."""
+    values.append((yield from stimulus(dut, **params)))
+
+
+def run_point(harness_factory, stimulus, params, clocks=None):
+    """Simulate one point of a sweep, in the current process.
+
+    Returns:
+        :class:`SweepResult`: the value returned by the stimulus, or the failure.
+    """
+    values = []
+    # Any failure of the point is reported in its result, instead of stopping the
+    # whole sweep
+    try:
+        dut = harness_factory()
+        run_simulation(
+            dut, _collect(stimulus, dut, params, values), clocks=clocks or {"sys": 8}
+        )
+    except Exception:  # pylint: disable=broad-except
+        return SweepResult(params, error=traceback.format_exc())
+    return SweepResult(params, values[0])
+
+
+def run_points(harness_factory, stimulus, points, clocks=None):
+    """Simulate points of a sweep in the current process, on one harness.
+
+    The harness is elaborated once, and reset before each point.
+
+    Returns:
+        list[:class:`SweepResult`]: the result of each point, in order.
+    """
+    # Failures are reported in the results, instead of stopping the whole sweep
+    try:
+        session = SimSession(harness_factory(), clocks)
+    except Exception:  # pylint: disable=broad-except
+        error = traceback.format_exc()
+        return [SweepResult(params, error=error) for params in points]
+
+    results = []
+    for params in points:
+        values = []
+        try:
+            session.run(_collect(stimulus, session.dut, params, values))
+        except Exception:  # pylint: disable=broad-except
+            results.append(SweepResult(params, error=traceback.format_exc()))
+        else:
+            results.append(SweepResult(params, values[0]))
+    return results
+
+
+def run_sweep(
+    harness_factory, stimulus, points, processes=None, clocks=None, reuse=True
+):
+    """Simulate all the points of a sweep, in parallel.
+
+    Args:
+        harness_factory: callable creating the harness (the ``dut``) of a point.
+        stimulus: generator function ``stimulus(dut, **params)`` driving the
+            simulation of a point. Its return value is the result of the point.
+        points (list[dict]): the parameters of each point.
+        processes (int, optional): number of worker processes. Defaults to the
+            number of CPUs. With 1, the points are simulated in this process.
+        clocks (dict, optional): clock domains & periods of the simulation, as for
+            :func:`migen.run_simulation`. Defaults to a single ``sys`` clock.
+        reuse (bool, optional): elaborate one harness per worker process, and
+            reset it between points (see :func:`run_points`). Otherwise, each
+            point has a freshly instantiated harness. Defaults to True.
+
+    Returns:
+        list[:class:`SweepResult`]: the result of each point, in order.
+    """
+    points = list(points)
+    if processes == 1:
+        if reuse:
+            return run_points(harness_factory, stimulus, points, clocks)
+        return [run_point(harness_factory, stimulus, p, clocks) for p in points]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as pool:
+        if not reuse:
+            futures = [
+                pool.submit(run_point, harness_factory, stimulus, p, clocks)
+                for p in points
+            ]
+            return [future.result() for future in futures]
+
+        # Interleave the points over the workers, to balance slow & fast points
+        n_workers = max(1, min(len(points), processes or os.cpu_count() or 1))
+        futures = [
+            pool.submit(
+                run_points, harness_factory, stimulus, points[i::n_workers], clocks
+            )
+            for i in range(n_workers)
+        ]
+        results = [None] * len(points)
+        for i, future in enumerate(futures):
+            results[i::n_workers] = future.result()
+        return results
+
+
+def check_sweep(results):
+    """Raise an :class:`AssertionError` listing every failed point, if any.
+
+    Returns:
+        list: the value of each point, if none failed.
+    """
+    failed = [result for result in results if not result.ok]
+    if failed:
+        raise AssertionError(
+            "{} of {} sweep points failed:\n{}".format(
+                len(failed),
+                len(results),
+                "\n".join(
+                    "{}:\n{}".format(result.params, result.error) for result in failed
+                ),
+            )
+        )
+    return [result.value for result in results]
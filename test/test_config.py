@@ -0,0 +1,191 @@
+"""Test the host-side configuration :class:`entangler.driver.EntanglerConfig`."""
+import numpy as np
+
+import entangler.driver
+from entangler.driver import ADDR_W_CONFIG
+from entangler.driver import ADDR_W_TCYCLE
+from entangler.driver import Entangler
+from entangler.driver import EntanglerConfig
+from entangler.driver import herald_table_words
+
+
+class FakeCore:
+    """Runs kernels on the host, as plain Python functions."""
+
+    coarse_ref_period = 8e-9
+
+    def seconds_to_mu(self, seconds):
+        return round(seconds * 1e9)
+
+    def run(self, function, args, kwargs):
+        return function.artiq_embedded.function(*args, **kwargs)
+
+
+class FakeDeviceManager:
+    """Device manager giving a :class:`FakeCore` for any device."""
+
+    def get(self, _name):
+        return FakeCore()
+
+
+class RecordWrites:
+    """Record the register writes of the driver, instead of sending them."""
+
+    def __init__(self):
+        self.writes = []
+        self._rtio_output = None
+
+    def __enter__(self):
+        self._rtio_output = entangler.driver.rtio_output
+        entangler.driver.rtio_output = self.rtio_output
+        return self
+
+    def __exit__(self, *exc):
+        entangler.driver.rtio_output = self._rtio_output
+
+    def rtio_output(self, target, data):
+        self.writes.append((int(target) & 0xFF, int(data) & 0xFFFFFFFF))
+
+
+def as_pairs(config):
+    return [(a, w & 0xFFFFFFFF) for a, w in config.to_array().reshape(-1, 2).tolist()]
+
+
+def matches_driver_test(**kwargs):
+    """Check the configuration gives the same writes as the driver setters."""
+    device = Entangler(FakeDeviceManager(), 0, **kwargs)
+    config = EntanglerConfig(
+        edge_depth=64, num_scan_points=64, herald_lut=True, **kwargs
+    )
+    herald_table = herald_table_words([0b0101, 0b1010], kwargs.get("num_inputs", 4))
+    with RecordWrites() as driver:
+        device.set_cycle_length_mu(1200)
+        device.set_timing_mu(device.sequencer_address(0), 80, 400)
+        device.set_timing_mu(device.sequencer_address(1), 0, 8)
+        device.set_timing_mu(device.gate_address(2), 13, 27)
+        device.set_heralds([0b0101, 0b1010, 0b0110])
+        device.set_edges_mu([16, 200, 1192], [0b0011, 0b0001, 0b0010], [1, 0, 0])
+        device.set_herald_table(herald_table)
+        device.set_burst_windows(3)
+        device.set_telemetry_interval(100)
+        device.set_scan_mu(device.sequencer_address(1), -16, 10, 100, step_stop=False)
+        device.set_config(enable=True, pipelined=True, trace=True, shadow=True)
+
+    config.set_config(enable=True, pipelined=True, trace=True, shadow=True)
+    config.set_cycle_length_mu(1200)
+    config.set_timing_mu(config.sequencer_address(0), 80, 400)
+    config.set_timing_mu(config.sequencer_address(1), 0, 8)
+    config.set_timing_mu(config.gate_address(2), 13, 27)
+    config.set_heralds([0b0101, 0b1010, 0b0110])
+    config.set_edges_mu([16, 200, 1192], [0b0011, 0b0001, 0b0010], [1, 0, 0])
+    config.set_herald_table(herald_table)
+    config.set_burst_windows(3)
+    config.set_telemetry_interval(100)
+    config.set_scan_mu(config.sequencer_address(1), -16, 10, 100, step_stop=False)
+    # config is written last, whatever the order it was set in
+    assert as_pairs(config) == driver.writes
+
+    with RecordWrites() as upload:
+        device.upload_config(config.to_array())
+    assert upload.writes == driver.writes
+
+
+def overwrite_test():
+    """Check setting a register again replaces its previous writes."""
+    config = EntanglerConfig()
+    config.set_heralds([0b0101, 0b1010])
+    config.set_cycle_length_mu(800)
+    config.set_heralds([0b0011])
+    config.set_config(enable=True, standalone=True)
+    assert as_pairs(config) == [
+        (entangler.driver.ADDR_W_HERALD, (1 << 16) | 0b0011),
+        (ADDR_W_TCYCLE, 100),
+        (ADDR_W_CONFIG, 0b111),
+    ]
+    assert config.to_array().dtype == np.int32
+
+
+def validation_test():
+    """Check out of range values & blocks the gateware lacks are rejected."""
+    config = EntanglerConfig(edge_depth=64, num_scan_points=64, herald_lut=True)
+    bare = EntanglerConfig()
+    invalid = [
+        lambda: config.set_cycle_length_mu(1204),
+        lambda: config.set_cycle_length_mu(1024 * 8),
+        lambda: config.set_timing_mu(config.sequencer_address(0), 4, 16),
+        lambda: config.set_timing_mu(config.gate_address(0), 0, 0x3FFF),
+        lambda: config.set_timing_mu(config.gate_address(4), 0, 8),
+        lambda: config.set_heralds([1, 2, 4, 8, 3]),
+        lambda: config.set_heralds([0b10000]),
+        lambda: config.set_edges_mu([16, 16], [1, 2], [1, 1]),
+        lambda: config.set_edges_mu([16], [0b10000], [1]),
+        lambda: config.set_edges_mu([16, 24], [1], [1]),
+        lambda: config.set_herald_table([0, 0]),
+        lambda: config.set_burst_windows(16),
+        lambda: config.set_telemetry_interval(0x4000),
+        lambda: config.set_scan_mu(config.gate_address(0), 8, 65, 10),
+        lambda: config.set_scan_mu(config.sequencer_address(0), 4, 10, 10),
+        lambda: config.set_scan_mu(config.gate_address(0), 1 << 15, 10, 10),
+        lambda: config.set_scan_mu(config.gate_address(0), 8, 10, 0),
+        lambda: bare.set_config(edge_sequencer=True),
+        lambda: bare.set_config(herald_lut=True),
+        lambda: bare.set_edges_mu([16], [1], [1]),
+        lambda: bare.set_herald_table([0]),
+        lambda: bare.set_scan_mu(bare.gate_address(0), 8, 1, 10),
+    ]
+    for set_invalid in invalid:
+        try:
+            set_invalid()
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("no ValueError raised")
+    assert as_pairs(config) == [(ADDR_W_CONFIG, 0b10)]
+
+
+def config_slot_test():
+    """Check only the registers config slots hold are stored, in valid slots only."""
+    device = Entangler(FakeDeviceManager(), 0, num_config_slots=4)
+    config = EntanglerConfig()
+    config.set_config(enable=True)
+    config.set_timing_mu(config.gate_address(0), 10, 30)
+    config.set_burst_windows(2)
+    config.set_cycle_length_mu(800)
+    with RecordWrites() as upload:
+        device.store_config_slot(2, config.to_slot_array())
+    target = device.addr_ext + entangler.driver.EXT_W_CONFIG_TARGET
+    assert upload.writes == [
+        (target, 3),
+        (config.gate_address(0), (31 << 16) | 11),
+        (ADDR_W_TCYCLE, 100),
+        (target, 0),
+    ]
+    bare = Entangler(FakeDeviceManager(), 0)
+    invalid = [
+        lambda: device.set_config_target(4),
+        lambda: device.set_config_target(-2),
+        lambda: device.store_config_slot(-1, config.to_slot_array()),
+        lambda: device.load_config_slot(4),
+        lambda: bare.set_config_target(0),
+        lambda: bare.load_config_slot(0),
+    ]
+    for use_invalid in invalid:
+        with RecordWrites() as upload:
+            try:
+                use_invalid()
+            except ValueError:
+                pass
+            else:
+                raise AssertionError("no ValueError raised")
+        assert upload.writes == []
+    with RecordWrites() as upload:
+        bare.set_config_target(-1)
+    assert upload.writes == [(target, 0)]
+
+
+if __name__ == "__main__":
+    matches_driver_test()
+    matches_driver_test(is_master=False, num_outputs=6, num_inputs=8, num_patterns=6)
+    overwrite_test()
+    validation_test()
+    config_slot_test()
@@ -0,0 +1,188 @@
+"""Test the input event handling of the :class:`entangler.driver.Entangler` driver.
+
+The kernels run on the host (see ``test_config.py``), with the RTIO input FIFO of
+the channel faked by :class:`FakeInputs`.
+"""
+import collections
+import os
+import sys
+
+import entangler.driver
+from entangler.driver import ABORT
+from entangler.driver import ADDR_W_RUN
+from entangler.driver import ADDR_W_RUN_N
+from entangler.driver import Entangler
+from entangler.driver import MAX_PENDING_EVENTS
+from entangler.driver import TAG_EVENT
+from entangler.driver import TAG_READ
+from entangler.driver import TAG_REPORT
+from entangler.driver import TAG_TELEMETRY
+
+sys.path.append(os.path.dirname(__file__))
+
+from test_config import FakeDeviceManager  # noqa: E402
+from test_config import RecordWrites  # noqa: E402
+
+
+class FakeInputs:
+    """Replace the RTIO input FIFO of the driver with a queue of input events."""
+
+    def __init__(self):
+        """Start with no input events."""
+        self.events = collections.deque()
+        self._rtio_input = None
+
+    def __enter__(self):
+        self._rtio_input = entangler.driver.rtio_input_timestamped_data
+        entangler.driver.rtio_input_timestamped_data = self.rtio_input
+        return self
+
+    def __exit__(self, *exc):
+        entangler.driver.rtio_input_timestamped_data = self._rtio_input
+
+    def push(self, timestamp, tag, data):
+        """Queue an input event with the given tag & 14-bit data."""
+        self.events.append((timestamp, (tag << 14) | data))
+
+    def rtio_input(self, timeout_mu, _channel):
+        """Pop the next event, as :func:`rtio_input_timestamped_data`.
+
+        Events are taken to have arrived as soon as they are queued, so an empty
+        queue times out, whatever the timeout.
+        """
+        if self.events:
+            return self.events.popleft()
+        assert timeout_mu != -1, "waiting forever for an input event"
+        return -1, 0
+
+
+class RunEvents(RecordWrites):
+    """Record the register writes, and queue input events once a run starts."""
+
+    def __init__(self, inputs, events):
+        """Queue ``events``, as (timestamp, tag, data), on ``inputs``."""
+        super().__init__()
+        self.inputs = inputs
+        self.events = events
+
+    def rtio_output(self, target, data):
+        super().rtio_output(target, data)
+        if int(target) & 0xFF in (ADDR_W_RUN, ADDR_W_RUN_N):
+            for event in self.events:
+                self.inputs.push(*event)
+
+
+def demultiplex_test():
+    """Check read responses are returned, and other events set aside in order."""
+    device = Entangler(FakeDeviceManager(), 0, num_inputs=2)
+    with FakeInputs() as inputs, RecordWrites():
+        inputs.push(100, TAG_EVENT, 0b01)
+        inputs.push(110, TAG_TELEMETRY, 7)
+        inputs.push(120, TAG_REPORT, 42)
+        inputs.push(130, TAG_READ, 0x1234)
+        inputs.push(140, TAG_READ, 5)
+        assert device.read(entangler.driver.ADDR_R_STATUS) == 0x1234
+        assert device.read_data() == 5
+        assert device.n_pending == 2
+
+        # Telemetry records are [cycles, triggers, clicks of each APD]
+        for word in [8, 9, 10]:
+            inputs.push(150 + word, TAG_TELEMETRY, word)
+        assert device.poll_telemetry()
+        assert device.telemetry.tolist() == [7, 8, 9, 10]
+        assert device.telemetry_timestamp_mu == 160
+        assert not device.poll_telemetry()
+
+        assert device.next_event() == (100, 0b01)
+        inputs.push(170, TAG_EVENT, 0x3FFF)
+        assert device.next_event() == (120, 42)
+        assert device.next_event() == (170, 0x3FFF)
+        assert device.n_pending == 0
+
+
+def ring_buffer_test():
+    """Check events set aside wrap around the pending ring buffer, in order."""
+    device = Entangler(FakeDeviceManager(), 0)
+    n_events = MAX_PENDING_EVENTS - 4
+    with FakeInputs() as inputs:
+        timestamp = 0
+        for _ in range(3):
+            for i in range(n_events):
+                inputs.push(timestamp + i, TAG_EVENT, i)
+            inputs.push(timestamp + n_events, TAG_READ, 1)
+            assert device.read_data() == 1
+            assert device.n_pending == n_events
+            for i in range(n_events):
+                assert device.next_event() == (timestamp + i, i)
+            timestamp += n_events + 1
+        assert device.pending_start == 3 * n_events % MAX_PENDING_EVENTS
+
+
+def overflow_test():
+    """Check more events than can be set aside fail, instead of being lost."""
+    device = Entangler(FakeDeviceManager(), 0)
+    with FakeInputs() as inputs:
+        for i in range(MAX_PENDING_EVENTS + 1):
+            inputs.push(i, TAG_REPORT, i)
+        inputs.push(MAX_PENDING_EVENTS + 1, TAG_READ, 1)
+        try:
+            device.read_data()
+        except AssertionError:
+            pass
+        else:
+            raise AssertionError("pending events overflowed silently")
+        assert device.n_pending == MAX_PENDING_EVENTS
+
+
+def stale_result_test():
+    """Check the result of a run given up on is not taken for that of the next."""
+    device = Entangler(FakeDeviceManager(), 0)
+    with FakeInputs() as inputs, RecordWrites():
+        device.start_mu(800)
+        assert not device.poll()
+        assert device.wait_mu(1000) == (-1, -1)
+        # The first run finishes after all
+        inputs.push(1200, TAG_EVENT, 0x3FFF)
+        device.start_mu(800)
+        assert not device.poll()
+        inputs.push(2400, TAG_EVENT, 0b0101)
+        assert device.poll()
+        assert device.wait_mu() == (2400, 0b0101)
+
+
+def run_n_abort_test():
+    """Check an aborted continuous run returns the heralds so far."""
+    device = Entangler(FakeDeviceManager(), 0)
+    with FakeInputs() as inputs:
+        events = [(100, TAG_EVENT, 0b0001), (200, TAG_EVENT, ABORT)]
+        with RunEvents(inputs, events):
+            assert device.run_n_mu(3, 8000) == 1
+        assert device.herald_patterns[0] == 0b0001
+        assert device.n_pending == 0
+
+
+def run_n_report_test():
+    """Check completion report words are not taken for heralds."""
+    device = Entangler(FakeDeviceManager(), 0)
+    with FakeInputs() as inputs:
+        events = [
+            (100, TAG_EVENT, 0b0001),
+            (101, TAG_REPORT, 7),
+            (200, TAG_EVENT, 0b0010),
+            (201, TAG_REPORT, 9),
+        ]
+        with RunEvents(inputs, events):
+            assert device.run_n_mu(2, 8000) == 2
+        assert device.herald_timestamps_mu[:2].tolist() == [100, 200]
+        assert device.herald_patterns[:2].tolist() == [0b0001, 0b0010]
+        # The completion report of the run is left for next_event()
+        assert device.next_event() == (201, 9)
+
+
+if __name__ == "__main__":
+    demultiplex_test()
+    ring_buffer_test()
+    overflow_test()
+    stale_result_test()
+    run_n_abort_test()
+    run_n_report_test()
@@ -6,6 +6,8 @@ import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), "helpers"))
 
 
+from migen import C  # noqa: E402
+from migen import Cat  # noqa: E402
 from migen import Module  # noqa: E402
 from migen import run_simulation  # noqa: E402
 from migen import Signal  # noqa: E402
@@ -17,28 +19,31 @@ from gateware_utils import MockPhy  # noqa: E402 ./helpers/gateware_utils
 class StandaloneHarness(Module):
     """Test harness for the ``EntanglerCore``."""
 
-    def __init__(self):
+    def __init__(self, num_outputs=4, num_inputs=4, num_patterns=4, **kwargs):
         """Pass through signals to an ``EntanglerCore`` instance."""
         self.counter = Signal(32)
 
-        self.submodules.phy_apd0 = MockPhy(self.counter)
-        self.submodules.phy_apd1 = MockPhy(self.counter)
-        self.submodules.phy_apd2 = MockPhy(self.counter)
-        self.submodules.phy_apd3 = MockPhy(self.counter)
+        input_phys = []
+        for i in range(num_inputs):
+            phy = MockPhy(self.counter)
+            setattr(self.submodules, "phy_apd{}".format(i), phy)
+            input_phys.append(phy)
         self.submodules.phy_ref = MockPhy(self.counter)
-        input_phys = [
-            self.phy_apd0,
-            self.phy_apd1,
-            self.phy_apd2,
-            self.phy_apd3,
-            self.phy_ref,
-        ]
+        input_phys.append(self.phy_ref)
 
         core_link_pads = None
         output_pads = None
         passthrough_sigs = None
         self.submodules.core = EntanglerCore(
-            core_link_pads, output_pads, passthrough_sigs, input_phys, simulate=True
+            core_link_pads,
+            output_pads,
+            passthrough_sigs,
+            input_phys,
+            simulate=True,
+            num_outputs=num_outputs,
+            num_inputs=num_inputs,
+            num_patterns=num_patterns,
+            **kwargs,
         )
 
         self.comb += self.counter.eq(self.core.msm.m)
@@ -93,8 +98,238 @@ def standalone_test(dut):
         yield
 
 
+def wide_core_test(dut):
+    """Test an 8-APD, 8-pattern :class:``EntanglerCore`` heralds on the last APDs."""
+    assert len(dut.core.sequencers) == 6
+    assert len(dut.core.apd_gaters) == 8
+    assert len(dut.core.heralder.patterns) == 8
+
+    yield dut.core.msm.m_end.eq(20)
+    yield dut.core.msm.is_master.eq(1)
+    yield dut.core.msm.standalone.eq(1)
+    yield dut.core.msm.time_remaining_buf.eq(200)
+
+    for gater in dut.core.apd_gaters:
+        yield gater.gate_start.eq(18)
+        yield gater.gate_stop.eq(30)
+    for i in range(8):
+        yield getattr(dut, "phy_apd{}".format(i)).t_event.eq(1000)
+    yield dut.phy_ref.t_event.eq(8 * 10 + 3)
+    yield dut.phy_apd6.t_event.eq(8 * 10 + 3 + 20)
+    yield dut.phy_apd7.t_event.eq(8 * 10 + 3 + 25)
+
+    yield dut.core.heralder.patterns[7].eq(0b1100_0000)
+    yield dut.core.heralder.pattern_ens.eq(1 << 7)
+
+    yield
+    yield dut.core.msm.run_stb.eq(1)
+    yield
+    yield dut.core.msm.run_stb.eq(0)
+
+    matches = None
+    for _ in range(100):
+        if (yield dut.core.msm.done_stb):
+            assert (yield dut.core.msm.success)
+            matches = yield dut.core.heralder.matches
+        yield
+    assert matches == 1 << 7
+
+
+def burst_test(dut):
+    """Test the :class:``EntanglerCore`` heralds on the 2nd of 3 windows per cycle."""
+    yield dut.core.msm.m_end.eq(60)
+    yield dut.core.msm.is_master.eq(1)
+    yield dut.core.msm.standalone.eq(1)
+    yield dut.core.msm.time_remaining_buf.eq(500)
+    yield dut.core.burst_windows.eq(3)
+
+    for gater in dut.core.apd_gaters:
+        yield gater.gate_start.eq(8)
+        yield gater.gate_stop.eq(30)
+    for i in range(4):
+        yield getattr(dut, "phy_apd{}".format(i)).t_event.eq(1000)
+    yield dut.phy_ref.t_event.eq(1000)
+    yield dut.phy_apd0.t_event.eq(8 * 22 + 2)
+
+    yield dut.core.heralder.patterns[0].eq(0b0001)
+    yield dut.core.heralder.pattern_ens.eq(0b0001)
+
+    yield
+    yield dut.core.msm.run_stb.eq(1)
+    yield
+    yield dut.core.msm.run_stb.eq(0)
+
+    # Reference edges at m = 5, 20, 35, 50 (the last one is not a new window)
+    ref_times = {1: 5, 6: 20, 21: 35, 36: 50}
+    done = False
+    for _ in range(200):
+        m = yield dut.counter
+        if m in ref_times:
+            yield dut.phy_ref.t_event.eq(8 * ref_times[m])
+        if m == 52:
+            assert (yield dut.core.window) == 2
+        if (yield dut.core.msm.done_stb):
+            done = True
+            assert (yield dut.core.msm.success)
+            assert (yield dut.core.herald_window) == 1
+            assert (yield dut.core.herald_result) == 0b0001
+        yield
+    assert done
+
+
+def edge_depth_test(dut):
+    """Test an :class:``EntanglerCore`` edge table deeper than the default plays."""
+    n_edges = 100
+    yield dut.core.msm.m_end.eq(n_edges + 10)
+    yield dut.core.msm.is_master.eq(1)
+    yield dut.core.msm.standalone.eq(1)
+    yield dut.core.msm.time_remaining_buf.eq(n_edges + 10)
+    yield dut.core.use_edge_sequencer.eq(1)
+    for i in range(4):
+        yield getattr(dut, "phy_apd{}".format(i)).t_event.eq(1000)
+    yield dut.phy_ref.t_event.eq(1000)
+
+    # Toggle output 0 on every clock cycle from m = 1
+    sequencer = dut.core.edge_sequencer
+    yield sequencer.write_reset.eq(1)
+    yield
+    yield sequencer.write_reset.eq(0)
+    for i in range(n_edges):
+        t = i + 1
+        level = (i + 1) % 2
+        yield sequencer.write_data.eq(Cat(C(t, len(dut.core.msm.m)), C(1, 4), level))
+        yield sequencer.write_stb.eq(1)
+        yield
+    yield sequencer.write_stb.eq(0)
+    yield sequencer.n_edges.eq(n_edges)
+
+    yield dut.core.msm.run_stb.eq(1)
+    yield
+    yield dut.core.msm.run_stb.eq(0)
+
+    toggles = 0
+    last = 0
+    for _ in range(n_edges + 20):
+        output = yield dut.core.outputs[0]
+        toggles += output != last
+        last = output
+        yield
+    assert toggles == n_edges
+
+
+def trace_test(dut):
+    """Test the :class:``EntanglerCore`` trace keeps the last cycles of a run."""
+    yield dut.core.msm.m_end.eq(20)
+    yield dut.core.msm.is_master.eq(1)
+    yield dut.core.msm.standalone.eq(1)
+    yield dut.core.msm.time_remaining_buf.eq(200)
+    yield dut.core.trace_enable.eq(1)
+
+    for gater in dut.core.apd_gaters:
+        yield gater.gate_start.eq(18)
+        yield gater.gate_stop.eq(30)
+    for i in range(4):
+        yield getattr(dut, "phy_apd{}".format(i)).t_event.eq(1000)
+    # APD 2 clicks in the gate window of every cycle
+    yield dut.phy_ref.t_event.eq(8 * 10 + 3)
+    yield dut.phy_apd2.t_event.eq(8 * 10 + 3 + 20)
+
+    yield
+    yield dut.core.msm.run_stb.eq(1)
+    yield
+    yield dut.core.msm.run_stb.eq(0)
+
+    while not (yield dut.core.msm.done_stb):
+        yield
+    yield
+    assert not (yield dut.core.msm.success)
+
+    n_cycles = yield dut.core.msm.cycles_completed
+    depth = 4
+    assert n_cycles > depth
+    assert (yield dut.core.trace.count) == depth
+    apd2_ts = yield dut.core.apd_gaters[2].sig_ts
+    ref_ts = yield dut.core.apd_gaters[0].ref_ts
+    for record in range(depth):
+        words = []
+        for word in range(dut.core.trace.n_words):
+            yield dut.core.trace.readout_record.eq(record)
+            yield dut.core.trace.readout_word.eq(word)
+            yield
+            yield
+            words.append((yield dut.core.trace.readout_data))
+        assert words[0] == n_cycles - depth + record
+        assert words[1] == 0b0100
+        assert words[4] == apd2_ts
+        assert words[6] == ref_ts
+
+
+def statistics_test(dut):
+    """Test the :class:``EntanglerCore`` statistics counters over a 3-herald run."""
+    yield dut.core.msm.m_end.eq(20)
+    yield dut.core.msm.is_master.eq(1)
+    yield dut.core.msm.standalone.eq(1)
+    yield dut.core.msm.time_remaining_buf.eq(1000)
+    yield dut.core.msm.n_successes_buf.eq(3)
+
+    for gater in dut.core.apd_gaters:
+        yield gater.gate_start.eq(18)
+        yield gater.gate_stop.eq(30)
+    for i in range(4):
+        yield getattr(dut, "phy_apd{}".format(i)).t_event.eq(1000)
+    yield dut.phy_ref.t_event.eq(8 * 10 + 3)
+    yield dut.phy_apd2.t_event.eq(8 * 10 + 3 + 20)
+
+    yield dut.core.heralder.patterns[1].eq(0b0100)
+    yield dut.core.heralder.patterns[2].eq(0b0001)
+    # Pattern 3 matches too, but is disabled
+    yield dut.core.heralder.patterns[3].eq(0b0100)
+    yield dut.core.heralder.pattern_ens.eq(0b0110)
+
+    yield
+    yield dut.core.msm.run_stb.eq(1)
+    yield
+    yield dut.core.msm.run_stb.eq(0)
+    yield
+    # Preload the counters just below 14 bits, which they must count past
+    preload = (1 << 14) - 2
+    counters = [dut.core.n_cycles, dut.core.n_triggers, dut.core.n_clicks[2]]
+    counters.append(dut.core.n_matches[1])
+    for counter in counters:
+        yield counter.eq(preload)
+
+    while not (yield dut.core.msm.done_stb):
+        yield
+    yield
+    assert (yield dut.core.msm.success)
+
+    assert (yield dut.core.n_cycles) == preload + 3
+    assert (yield dut.core.n_triggers) == preload + 3
+    for i, expected in enumerate([0, 0, preload + 3, 0]):
+        assert (yield dut.core.n_clicks[i]) == expected
+    for i, expected in enumerate([0, preload + 3, 0, 0]):
+        assert (yield dut.core.n_matches[i]) == expected
+
+
 if __name__ == "__main__":
     dut = StandaloneHarness()
     run_simulation(
         dut, standalone_test(dut), vcd_name="core_standalone.vcd", clocks={"sys": 8}
     )
+
+    dut = StandaloneHarness(num_outputs=6, num_inputs=8, num_patterns=8)
+    run_simulation(
+        dut, wide_core_test(dut), vcd_name="core_wide.vcd", clocks={"sys": 8}
+    )
+
+    dut = StandaloneHarness()
+    run_simulation(dut, burst_test(dut), vcd_name="core_burst.vcd", clocks={"sys": 8})
+
+    dut = StandaloneHarness(edge_depth=128)
+    run_simulation(dut, edge_depth_test(dut), clocks={"sys": 8})
+
+    dut = StandaloneHarness(trace_depth=4)
+    run_simulation(dut, trace_test(dut), vcd_name="core_trace.vcd", clocks={"sys": 8})
+
+    dut = StandaloneHarness()
+    run_simulation(dut, statistics_test(dut), clocks={"sys": 8})
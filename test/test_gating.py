@@ -11,6 +11,7 @@ from migen import Module  # noqa: E402
 from migen import Signal  # noqa: E402
 from migen import run_simulation  # noqa: E402
 
+from entangler.core import ArrivalHistogram  # noqa: E402
 from entangler.core import TriggeredInputGater  # noqa: E402
 from gateware_utils import MockPhy  # noqa: E402 pylint: disable=import-error
 
@@ -32,6 +33,65 @@ class TriggeredGaterHarness(Module):
         self.comb += core.clear.eq(self.rst)
 
 
+class HistogramHarness(TriggeredGaterHarness):
+    """Test harness to add an ``ArrivalHistogram`` to a ``TriggeredInputGater``."""
+
+    def __init__(self, num_bins=8):
+        """Create a test harness for the :class:`ArrivalHistogram`."""
+        super().__init__()
+        self.submodules.histogram = ArrivalHistogram(
+            self.core, self.phy_sig, num_bins=num_bins
+        )
+
+
+def histogram_test(dut, offset, shift, t_ref, t_sigs, num_bins=8):
+    """Test an ``ArrivalHistogram`` bins each signal edge after the reference."""
+    yield dut.histogram.offset.eq(offset)
+    yield dut.histogram.shift.eq(shift)
+    yield dut.histogram.enable.eq(1)
+    yield dut.phy_ref.t_event.eq(t_ref)
+    yield dut.phy_sig.t_event.eq(1000)
+    yield dut.histogram.clear.eq(1)
+    yield dut.rst.eq(1)
+    yield
+    yield dut.histogram.clear.eq(0)
+    yield dut.rst.eq(0)
+
+    # Fire each signal edge on its clock cycle, one per cycle at most
+    events = {t >> 3: t for t in t_sigs}
+    assert len(events) == len(t_sigs)
+    for _ in range((max(t_sigs) >> 3) + 5):
+        m = yield dut.m
+        yield dut.phy_sig.t_event.eq(events.get(m + 1, 1000))
+        yield
+
+    expected = [0] * num_bins
+    for t in t_sigs:
+        dt = t - t_ref - offset
+        if dt >= 0 and (dt >> shift) < num_bins:
+            expected[dt >> shift] += 1
+
+    counts = []
+    for i in range(num_bins):
+        yield dut.histogram.readout_adr.eq(i)
+        yield
+        yield
+        counts.append((yield dut.histogram.readout_data))
+    assert counts == expected
+
+    # Clearing zeroes all bins
+    yield dut.histogram.clear.eq(1)
+    yield
+    yield dut.histogram.clear.eq(0)
+    for _ in range(num_bins + 2):
+        yield
+    for i in range(num_bins):
+        yield dut.histogram.readout_adr.eq(i)
+        yield
+        yield
+        assert (yield dut.histogram.readout_data) == 0
+
+
 def gater_test(dut, gate_start=None, gate_stop=None, t_ref=None, t_sig=None):
     """Test a ``TriggeredInputGater`` correctly registers inputs."""
     yield dut.core.gate_start.eq(gate_start)
@@ -86,3 +146,10 @@ if __name__ == "__main__":
     run_simulation(
         dut, gater_test(dut, gate_start, gate_stop, t_ref, t_ref + gate_stop + 1)
     )
+
+    # Edges on consecutive clock cycles in the same bin, and ones outside the range.
+    # Leave time for the histogram to be cleared before the reference edge.
+    t_ref = 160
+    dut = HistogramHarness()
+    t_sigs = [t_ref + dt for dt in [-9, 12, 21, 29, 38, 46, 54, 70, 200]]
+    run_simulation(dut, histogram_test(dut, 2, 4, t_ref, t_sigs))
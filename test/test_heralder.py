@@ -1,6 +1,9 @@
 """Test the :class:`entangler.core.PatternMatcher` properly pattern matches."""
+import random
+
 from migen import run_simulation
 
+from entangler.core import PatternLUT
 from entangler.core import PatternMatcher
 
 patterns = [0b1001, 0b0110, 0b1010, 0b0101]
@@ -24,6 +27,28 @@ def pattern_match_test(dut):
             )
 
 
+def pattern_lut_test(dut, num_inputs, seed=0):
+    """Test arbitrary sets of heralds in the :class:`PatternLUT`."""
+    rng = random.Random(seed)
+    for _ in range(3):
+        table = rng.getrandbits(2 ** num_inputs)
+        for i in range(max(1, 2 ** num_inputs // 32)):
+            yield dut.write_data.eq((table >> (32 * i)) & 0xFFFFFFFF)
+            yield dut.write_stb.eq(1)
+            yield
+        yield dut.write_stb.eq(0)
+        yield
+
+        for i in range(2 ** num_inputs):
+            yield dut.sig.eq(i)
+            yield
+            assert (yield dut.is_match) == (table >> i) & 1
+
+
 if __name__ == "__main__":
     dut = PatternMatcher(num_inputs=n_sig, num_patterns=len(patterns))
     run_simulation(dut, pattern_match_test(dut), vcd_name="heralder.vcd")
+
+    for num_inputs in (4, 7):
+        dut = PatternLUT(num_inputs=num_inputs)
+        run_simulation(dut, pattern_lut_test(dut, num_inputs), vcd_name="lut.vcd")
@@ -42,7 +42,7 @@ class MsmPair(Module):
             self.master.slave_ready_raw.eq(self.slave.ready),
             self.slave.trigger_in_raw.eq(self.master.trigger_out),
             self.slave.success_in_raw.eq(self.master.success),
-            self.slave.timeout_in_raw.eq(self.master.timeout),
+            self.slave.timeout_in_raw.eq(self.master.timeout_out),
         ]
 
 
@@ -85,6 +85,50 @@ def msm_standalone_test(dut):
     yield from run(False)
 
 
+def msm_continuous_test(dut):
+    """Test the state machine re-arms after each success in a continuous run."""
+    yield dut.m_end.eq(10)
+    yield dut.is_master.eq(1)
+    yield dut.standalone.eq(1)
+
+    def run(n_successes, t_heralds, timeout=300):
+        yield dut.time_remaining_buf.eq(timeout)
+        yield dut.n_successes_buf.eq(n_successes)
+        yield
+        yield dut.run_stb.eq(1)
+        yield
+        yield dut.run_stb.eq(0)
+        n_rearms = 0
+        n_done = 0
+        success = False
+        for i in range(timeout + 50):
+            yield dut.herald.eq(i in t_heralds)
+            if (yield dut.herald_stb):
+                assert (yield dut.success)
+                assert (yield dut.running)
+                n_rearms += 1
+            if (yield dut.done_stb):
+                n_done += 1
+                success = yield dut.success
+            yield
+        yield dut.herald.eq(0)
+        return n_rearms, n_done, success
+
+    # Every herald is reported, and the run only finishes on the last one. Heralds
+    # last a full cycle (14 clock cycles), so each is seen at exactly one cycle end.
+    t_heralds = set(range(40, 54)) | set(range(100, 114)) | set(range(160, 174))
+    n_rearms, n_done, success = yield from run(3, t_heralds)
+    assert (n_rearms, n_done, success) == (2, 1, True)
+
+    # Time out before enough successes
+    n_rearms, n_done, success = yield from run(5, t_heralds)
+    assert (n_rearms, n_done, success) == (3, 1, False)
+
+    # Single-success runs are unaffected
+    n_rearms, n_done, success = yield from run(1, t_heralds)
+    assert (n_rearms, n_done, success) == (0, 1, True)
+
+
 def msm_pair_test(dut):
     """Test the master/slave state machines working together."""
     yield dut.master.m_end.eq(10)
@@ -152,9 +196,213 @@ def msm_pair_test(dut):
     yield from run(t_start_master=10, t_start_slave=60, t_herald=None)
 
 
+def msm_pipelined_pair_test(dut):
+    """Test the master/slave state machines stay in lockstep when pipelined."""
+    m_end = 10
+    for msm in (dut.master, dut.slave):
+        yield msm.m_end.eq(m_end)
+        yield msm.time_remaining_buf.eq(200)
+        yield msm.pipelined.eq(1)
+
+    def run(t_herald=None):
+        yield dut.master.herald.eq(0)
+        for _ in range(5):
+            yield
+        t_master_done = None
+        t_slave_done = None
+        success_master = False
+        success_slave = False
+        restarts = 0
+        for i in range(300):
+            # Slave starts after the master, so it doesn't see a stale master timeout
+            if i == 10:
+                yield dut.master.run_stb.eq(1)
+            elif i == 11:
+                yield dut.master.run_stb.eq(0)
+            if i == 20:
+                yield dut.slave.run_stb.eq(1)
+            elif i == 21:
+                yield dut.slave.run_stb.eq(0)
+            if t_herald and i == t_herald:
+                yield dut.master.herald.eq(1)
+
+            if (yield dut.master.done_stb):
+                t_master_done = i
+                success_master = yield dut.master.success
+            if (yield dut.slave.done_stb):
+                t_slave_done = i
+                success_slave = yield dut.slave.success
+            if (yield dut.master.cycle_restart):
+                restarts += 1
+                assert (yield dut.slave.cycle_restart)
+
+            # The counters wrap together, without any idle cycles
+            m_master = yield dut.master.m
+            if 0 < m_master <= m_end:
+                assert m_master == (yield dut.slave.m)
+            yield
+
+        assert restarts > 0
+        assert success_master == success_slave == (t_herald is not None)
+        assert t_master_done == t_slave_done - 2
+        assert (yield dut.master.cycles_completed) == (yield dut.slave.cycles_completed)
+
+    # Herald in the middle of a run
+    yield from run(t_herald=80)
+
+    # Time out without success
+    yield from run()
+
+
+def msm_early_exit_test(dut):
+    """Test master & slave finish right after a herald in early-exit mode."""
+    m_end = 30
+    for msm in (dut.master, dut.slave):
+        yield msm.m_end.eq(m_end)
+        yield msm.time_remaining_buf.eq(200)
+        yield msm.early_exit.eq(1)
+
+    t_herald = 70
+    t_master_done = None
+    t_slave_done = None
+    for i in range(200):
+        if i == 10:
+            yield dut.master.run_stb.eq(1)
+        elif i == 11:
+            yield dut.master.run_stb.eq(0)
+        if i == 20:
+            yield dut.slave.run_stb.eq(1)
+        elif i == 21:
+            yield dut.slave.run_stb.eq(0)
+        if i == t_herald:
+            # Herald in the middle of a cycle
+            assert 0 < (yield dut.master.m) < m_end - 5
+            yield dut.master.herald.eq(1)
+        elif i == t_herald + 1:
+            yield dut.master.herald.eq(0)
+
+        if (yield dut.master.done_stb):
+            t_master_done = i
+            assert (yield dut.master.success)
+        if (yield dut.slave.done_stb):
+            t_slave_done = i
+            assert (yield dut.slave.success)
+        yield
+
+    # The herald written at t_herald is seen by the core on the following clock
+    # cycle, and the master finishes on the clock cycle after that.
+    assert t_master_done == t_herald + 2
+    assert t_slave_done == t_master_done + 2
+    assert (yield dut.master.cycles_completed) == (yield dut.slave.cycles_completed)
+
+
+def msm_abort_test(dut):
+    """Test an abort on the master finishes both master & slave at a cycle end."""
+    m_end = 30
+    for msm in (dut.master, dut.slave):
+        yield msm.m_end.eq(m_end)
+        yield msm.time_remaining_buf.eq(1000)
+
+    t_abort = 70
+    m_abort = None
+    t_master_done = None
+    t_slave_done = None
+    for i in range(200):
+        if i == 10:
+            yield dut.master.run_stb.eq(1)
+        elif i == 11:
+            yield dut.master.run_stb.eq(0)
+        if i == 20:
+            yield dut.slave.run_stb.eq(1)
+        elif i == 21:
+            yield dut.slave.run_stb.eq(0)
+        if i == t_abort:
+            assert 0 < (yield dut.master.m) < m_end - 5
+            m_abort = yield dut.master.m
+            yield dut.master.abort_stb.eq(1)
+        elif i == t_abort + 1:
+            yield dut.master.abort_stb.eq(0)
+
+        if (yield dut.master.done_stb):
+            t_master_done = i
+            assert (yield dut.master.aborted)
+            assert not (yield dut.master.success)
+            assert not (yield dut.master.timeout)
+        if (yield dut.slave.done_stb):
+            t_slave_done = i
+            assert not (yield dut.slave.success)
+            assert (yield dut.slave.aborted)
+        yield
+
+    # The master finishes on the clock cycle after the end of the current cycle,
+    # then the slave follows
+    assert m_abort is not None
+    assert t_master_done == t_abort + m_end - m_abort + 1
+    assert t_master_done < t_slave_done < t_master_done + 5
+    assert (yield dut.master.cycles_completed) == (yield dut.slave.cycles_completed)
+
+    # The next run is not aborted
+    yield dut.master.run_stb.eq(1)
+    yield
+    yield dut.master.run_stb.eq(0)
+    yield dut.slave.run_stb.eq(1)
+    yield
+    yield dut.slave.run_stb.eq(0)
+    yield
+    assert not (yield dut.master.aborted)
+    assert not (yield dut.slave.aborted)
+
+
+def attempts_per_us(dut, pipelined, m_end=10, n_clocks=2000, t_clock_ns=8):
+    """Measure the rate of entanglement attempts of a standalone state machine."""
+    yield dut.m_end.eq(m_end)
+    yield dut.is_master.eq(1)
+    yield dut.standalone.eq(1)
+    yield dut.pipelined.eq(pipelined)
+    yield dut.time_remaining_buf.eq(n_clocks)
+    yield
+    yield dut.run_stb.eq(1)
+    yield
+    yield dut.run_stb.eq(0)
+    for _ in range(n_clocks):
+        yield
+    n_cycles = yield dut.cycles_completed
+    return n_cycles / (n_clocks * t_clock_ns * 1e-3)
+
+
+def msm_attempt_rate_test(dut, results, pipelined, m_end=10):
+    """Store the attempt rate of the state machine in ``results[pipelined]``."""
+    results[pipelined] = yield from attempts_per_us(dut, pipelined, m_end=m_end)
+
+
 if __name__ == "__main__":
     dut = MsmPair()
     run_simulation(dut, msm_pair_test(dut), vcd_name="msm_pair.vcd")
 
     dut = MainStateMachine()
     run_simulation(dut, msm_standalone_test(dut), vcd_name="msm_standalone.vcd")
+
+    dut = MainStateMachine()
+    run_simulation(dut, msm_continuous_test(dut), vcd_name="msm_continuous.vcd")
+
+    dut = MsmPair()
+    run_simulation(dut, msm_pipelined_pair_test(dut), vcd_name="msm_pipelined_pair.vcd")
+
+    dut = MsmPair()
+    run_simulation(dut, msm_early_exit_test(dut), vcd_name="msm_early_exit.vcd")
+
+    dut = MsmPair()
+    run_simulation(dut, msm_abort_test(dut), vcd_name="msm_abort.vcd")
+
+    for m_end in (10, 30):
+        rates = {}
+        for pipelined in (False, True):
+            dut = MainStateMachine()
+            run_simulation(dut, msm_attempt_rate_test(dut, rates, pipelined, m_end))
+        print(
+            "m_end={}: {:.2f} attempts/us, {:.2f} attempts/us pipelined".format(
+                m_end, rates[False], rates[True]
+            )
+        )
+        # Idle cycles (IDLE, TRIGGER_SLAVE, TRIGGER_SLAVE2) removed by pipelining
+        assert abs(rates[True] / rates[False] - (m_end + 4) / (m_end + 1)) < 0.02
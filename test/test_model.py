@@ -0,0 +1,282 @@
+"""Test the :class:`entangler.model.CoreModel` against the gateware it models.
+
+Random configurations & input edges are replayed into a simulated ``EntanglerCore``
+and the model, and everything the model predicts is compared, cycle by cycle.
+"""
+import copy
+import os
+import sys
+
+import numpy as np
+
+# add gateware simulation tools "module" (at ./helpers/*)
+sys.path.append(os.path.join(os.path.dirname(__file__), "helpers"))
+
+
+from migen import Module  # noqa: E402
+from migen import run_simulation  # noqa: E402
+from migen import Signal  # noqa: E402
+
+from entangler.core import EntanglerCore  # noqa: E402
+from entangler.model import CoreModel  # noqa: E402
+from entangler.model import TIMEOUT  # noqa: E402
+from gateware_utils import ReplayPhy  # noqa: E402 ./helpers/gateware_utils
+
+
+class ReplayHarness(Module):
+    """Test harness replaying input edges into a standalone ``EntanglerCore``."""
+
+    def __init__(self, num_outputs=4, num_inputs=4, num_patterns=4):
+        """Connect an ``EntanglerCore`` instance to replayed inputs."""
+        self.counter = Signal(32)
+        self.counting = Signal()
+
+        self.phy_apds = []
+        for i in range(num_inputs):
+            phy = ReplayPhy(self.counter, self.counting)
+            setattr(self.submodules, "phy_apd{}".format(i), phy)
+            self.phy_apds.append(phy)
+        self.submodules.phy_ref = ReplayPhy(self.counter, self.counting)
+
+        self.submodules.core = EntanglerCore(
+            None,
+            None,
+            None,
+            self.phy_apds + [self.phy_ref],
+            simulate=True,
+            num_outputs=num_outputs,
+            num_inputs=num_inputs,
+            num_patterns=num_patterns,
+        )
+
+        self.comb += [
+            self.counter.eq(self.core.msm.m),
+            self.counting.eq(self.core.msm.counting),
+        ]
+
+
+def random_config(rng, model):
+    """Randomly configure the model."""
+    m_end = int(rng.integers(4, 24))
+    model.m_end = m_end
+    model.m_start[:] = rng.integers(0, m_end + 1, model.num_outputs)
+    model.m_stop[:] = rng.integers(0, m_end + 1, model.num_outputs)
+    model.gate_start[:] = rng.integers(0, 8 * m_end, model.num_inputs)
+    model.gate_stop[:] = model.gate_start + rng.integers(0, 8 * m_end, model.num_inputs)
+    model.patterns[:] = rng.integers(0, 1 << model.num_inputs, model.num_patterns)
+    model.patterns[0] = rng.integers(1, 1 << model.num_inputs)
+    model.pattern_ens = int(rng.integers(0, 1 << model.num_patterns))
+    model.pipelined = bool(rng.integers(2))
+    model.early_exit = bool(rng.integers(2))
+
+
+def random_edges(rng, model, n_cycles, p_edge=0.5, n_edges=2):
+    """Random reference & input edges, at most one per coarse clock cycle."""
+    t_max = 8 * model.m_end
+    ref = np.where(rng.random(n_cycles) < 0.8, rng.integers(0, t_max, n_cycles), -1)
+    apd = np.where(
+        rng.random((n_cycles, model.num_inputs, n_edges)) < p_edge,
+        rng.integers(0, t_max, (n_cycles, model.num_inputs, n_edges)),
+        -1,
+    )
+    apd.sort(axis=2)
+    coarse = apd >> 3
+    apd[:, :, 1:][(apd[:, :, 1:] >= 0) & (coarse[:, :, 1:] == coarse[:, :, :-1])] = -1
+    return ref, apd
+
+
+def configure(dut, model):
+    """Write the model configuration into the core."""
+    core = dut.core
+    yield core.msm.m_end.eq(model.m_end)
+    yield core.msm.is_master.eq(1)
+    yield core.msm.standalone.eq(1)
+    yield core.msm.pipelined.eq(model.pipelined)
+    yield core.msm.early_exit.eq(model.early_exit)
+    for i, sequencer in enumerate(core.sequencers):
+        yield sequencer.m_start.eq(int(model.m_start[i]))
+        yield sequencer.m_stop.eq(int(model.m_stop[i]))
+    for i, gater in enumerate(core.apd_gaters):
+        yield gater.gate_start.eq(int(model.gate_start[i]))
+        yield gater.gate_stop.eq(int(model.gate_stop[i]))
+    for i, pattern in enumerate(core.heralder.patterns):
+        yield pattern.eq(int(model.patterns[i]))
+    yield core.heralder.pattern_ens.eq(model.pattern_ens)
+    yield
+
+
+def read_all(signals):
+    """Read the values of several signals."""
+    values = []
+    for signal in signals:
+        values.append((yield signal))
+    return values
+
+
+def replay_run(dut, ref, apd, time_remaining, n_successes):
+    """Run the core on the given input edges, and record what it does."""
+    core = dut.core
+    msm = core.msm
+    phys = dut.phy_apds + [dut.phy_ref]
+    # Edges of each PHY in each cycle, in order
+    edges = [
+        [sorted(t for t in apd[j, i] if t >= 0) for i in range(len(dut.phy_apds))]
+        + [[ref[j]] if ref[j] >= 0 else []]
+        for j in range(len(ref))
+    ]
+
+    def load_cycle(j):
+        pending = [list(e) for e in edges[j]] if j < len(edges) else [[] for _ in phys]
+        for phy, times in zip(phys, pending):
+            yield phy.valid.eq(bool(times))
+            if times:
+                yield phy.t_event.eq(int(times[0]))
+        return pending
+
+    record = {
+        "cycle_stb": [],
+        "restart": [],
+        "sig": [],
+        "sig_ts": [],
+        "ref_ts": [],
+        "cycles_completed": [],
+        "outputs": [],
+        "events": [],
+        "done": None,
+    }
+    yield msm.time_remaining_buf.eq(time_remaining)
+    yield msm.n_successes_buf.eq(n_successes)
+    yield msm.run_stb.eq(1)
+    pending = yield from load_cycle(0)
+    cycle = 0
+    outputs = []
+    yield
+    yield msm.run_stb.eq(0)
+    for clock in range(20000):
+        if (yield msm.counting):
+            outputs.append((yield from read_all(core.outputs)))
+        if (yield msm.herald_stb) or (yield msm.done_stb):
+            result = TIMEOUT
+            if (yield msm.success):
+                result = yield core.herald_result
+            record["events"].append((clock, result))
+        if (yield msm.done_stb):
+            record["done"] = clock
+            break
+        # Advance the replayed edges of the PHYs that fired
+        for i, phy in enumerate(phys):
+            if (yield phy.stb_rising):
+                pending[i].pop(0)
+                yield phy.valid.eq(bool(pending[i]))
+                if pending[i]:
+                    yield phy.t_event.eq(int(pending[i][0]))
+        if (yield msm.cycle_stb):
+            record["cycle_stb"].append(clock)
+            record["restart"].append((yield msm.cycle_restart))
+            record["sig"].append((yield core.heralder.sig))
+            record["sig_ts"].append(
+                (yield from read_all(g.sig_ts for g in core.apd_gaters))
+            )
+            record["ref_ts"].append((yield core.apd_gaters[0].ref_ts))
+            record["cycles_completed"].append((yield msm.cycles_completed))
+            record["outputs"].append(np.array(outputs, dtype=bool).T)
+            outputs = []
+            cycle += 1
+            pending = yield from load_cycle(cycle)
+        yield
+    record["n_triggers"] = yield core.n_triggers
+    record["n_clicks"] = yield from read_all(core.n_clicks)
+    record["n_matches"] = yield from read_all(core.n_matches)
+    return record
+
+
+def compare_run(model, record, ref, apd, time_remaining, n_successes):
+    """Check the gateware record of a run against the model."""
+    expected = model.run(ref, apd, time_remaining, n_successes)
+    assert expected["finished"]
+    assert record["done"] == expected["done"], (record["done"], expected["done"])
+    assert record["events"][-1] == (expected["done"], expected["result"])
+    heralds = list(zip(expected["herald_times"], expected["herald_results"]))
+    if expected["result"] == TIMEOUT:
+        heralds.append((expected["done"], TIMEOUT))
+    assert record["events"] == heralds, (record["events"], heralds)
+
+    cycles = expected["cycles"]
+    n = expected["n_cycles"]
+    assert len(record["cycle_stb"]) == n
+    starts = expected["cycle_starts"]
+    assert record["cycle_stb"] == list(starts + cycles["end_m"])
+    assert record["sig"] == list(cycles["clicks"])
+    assert np.array_equal(
+        np.array(record["sig_ts"]).reshape(-1, model.num_inputs), cycles["sig_ts"]
+    )
+    assert record["ref_ts"] == list(cycles["ref_ts"])
+    assert record["cycles_completed"] == list(range(n))
+    assert record["n_triggers"] == expected["n_triggers"]
+    assert record["n_clicks"] == list(expected["n_clicks"])
+    assert record["n_matches"] == list(expected["n_matches"])
+    restarted = False
+    for j in range(n):
+        levels = model.outputs(restarted)[:, : cycles["end_m"][j] + 1]
+        assert np.array_equal(record["outputs"][j], levels), j
+        restarted = bool(record["restart"][j])
+
+
+def model_test(dut, seed, n_configs=4, runs_per_config=2, n_cycles=30):
+    """Check the model predicts random runs of the gateware."""
+    rng = np.random.default_rng(seed)
+    model = CoreModel()
+    for _ in range(n_configs):
+        random_config(rng, model)
+        yield from configure(dut, model)
+        # Consecutive runs, which share the gater state
+        for _ in range(runs_per_config):
+            ref, apd = random_edges(rng, model, n_cycles)
+            n_successes = int(rng.integers(1, 4))
+            # Time out within the given cycles
+            while True:
+                time_remaining = int(rng.integers(0, (model.m_end + 4) * n_cycles))
+                trial = copy.deepcopy(model)
+                if trial.run(ref, apd, time_remaining, n_successes)["finished"]:
+                    break
+            record = yield from replay_run(dut, ref, apd, time_remaining, n_successes)
+            compare_run(model, record, ref, apd, time_remaining, n_successes)
+            for _ in range(5):
+                yield
+
+
+def write_test():
+    """Check register writes configure the model as the gateware."""
+    model = CoreModel()
+    model.write(2, 100)
+    model.write(0, 0b11001)
+    model.write(3, (0b11 << 16) | (0b1010 << 4) | 0b0101)
+    model.write(0b01000 + 1, (401 << 16) | 11)
+    model.write(0b01000 + 4 + 2, (31 << 16) | 14)
+    assert model.m_end == 100
+    assert model.pipelined and model.early_exit
+    assert list(model.patterns[:2]) == [0b0101, 0b1010]
+    assert model.pattern_ens == 0b11
+    assert (model.m_start[1], model.m_stop[1]) == (11, 401)
+    assert (model.gate_start[2], model.gate_stop[2]) == (14, 31)
+
+    # The edge sequencer, herald lookup table & shadow registers are not modelled,
+    # and neither are runs, the edge table, reads & the extended registers
+    invalid = [(0, 0b111 | flag) for flag in [1 << 5, 1 << 6, 1 << 9]]
+    invalid += [(index, 1) for index in [1, 4, 5, 6, 7]]
+    invalid += [(0b10000, 0), (0b11000, 0)]
+    invalid += [(0b100000 + offset, 1) for offset in range(20)]
+    for addr, data in invalid:
+        try:
+            model.write(addr, data)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("no ValueError raised")
+
+
+if __name__ == "__main__":
+    write_test()
+    for seed in range(3):
+        dut = ReplayHarness()
+        run_simulation(dut, model_test(dut, seed), vcd_name="model.vcd")
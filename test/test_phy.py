@@ -12,39 +12,50 @@ from migen import Signal  # noqa: E402
 
 from gateware_utils import MockPhy  # noqa: E402 ./helpers/gateware_utils
 from gateware_utils import rtio_output_event  # noqa: E402
+from entangler.phy import ABORT_CODE  # noqa: E402
 from entangler.phy import Entangler  # noqa: E402
+from entangler.phy import TAG_EVENT  # noqa: E402
+from entangler.phy import TAG_READ  # noqa: E402
+from entangler.phy import TAG_REPORT  # noqa: E402
+from entangler.phy import TAG_TELEMETRY  # noqa: E402
 
 
 class PhyHarness(Module):
     """PHY Test Harness for :class:`entangler.phy.Entangler`."""
 
-    def __init__(self):
+    def __init__(self, num_outputs=4, num_inputs=4, num_patterns=4, **kwargs):
         """Connect the mocked PHY devices to this device."""
         self.counter = Signal(32)
 
-        self.submodules.phy_apd0 = MockPhy(self.counter)
-        self.submodules.phy_apd1 = MockPhy(self.counter)
-        self.submodules.phy_apd2 = MockPhy(self.counter)
-        self.submodules.phy_apd3 = MockPhy(self.counter)
+        input_phys = []
+        for i in range(num_inputs):
+            phy = MockPhy(self.counter)
+            setattr(self.submodules, "phy_apd{}".format(i), phy)
+            input_phys.append(phy)
         self.submodules.phy_ref = MockPhy(self.counter)
-        input_phys = [
-            self.phy_apd0,
-            self.phy_apd1,
-            self.phy_apd2,
-            self.phy_apd3,
-            self.phy_ref,
-        ]
+        input_phys.append(self.phy_ref)
 
         core_link_pads = None
         output_pads = None
         passthrough_sigs = None
         self.submodules.core = Entangler(
-            core_link_pads, output_pads, passthrough_sigs, input_phys, simulate=True
+            core_link_pads,
+            output_pads,
+            passthrough_sigs,
+            input_phys,
+            simulate=True,
+            num_outputs=num_outputs,
+            num_inputs=num_inputs,
+            num_patterns=num_patterns,
+            **kwargs,
         )
 
         self.comb += self.counter.eq(self.core.core.msm.m)
 
 
+# The is_master bit is written in the rio_phy domain
+CLOCKS = {"sys": 8, "rio": 8, "rio_phy": 8}
+
 ADDR_CONFIG = 0
 ADDR_RUN = 1
 ADDR_NCYCLES = 2
@@ -104,47 +115,559 @@ def test_basic(dut):
         yield
 
 
+def timeout_point(dut, timeout, n_cycles=10):
+    """Time out a standalone run, and return the clock cycle it timed out on.
+
+    The clock cycle is counted from the write to the run register.
+    """
+    yield
+    yield from rtio_output_event(dut.core.rtlink, ADDR_CONFIG, 0b110)  # disable
+    yield from rtio_output_event(dut.core.rtlink, ADDR_NCYCLES, n_cycles)
+    yield from rtio_output_event(dut.core.rtlink, ADDR_CONFIG, 0b111)  # enable
+    yield from rtio_output_event(dut.core.rtlink, ADDR_RUN, timeout)
+
+    t_timeout = None
+    for i in range(timeout + n_cycles + 50):
+        if (yield dut.core.rtlink.i.stb):
+            data = yield dut.core.rtlink.i.data
+            if data == 0x3FFF:
+                # This should be the first and only timeout
+                assert t_timeout is None
+                # Timeout should happen in a timely fashion
+                assert i <= timeout + n_cycles + 5
+                t_timeout = i
+        yield
+    assert t_timeout is not None
+    return t_timeout
+
+
 def test_timeout(dut):
     """Test that :mod:`entangler` timeout works.
 
     Sweeps the timeout is swept to occur at all possible points in the
     state machine operation.
     """
-    # Declare internal helper functions.
+    for i in range(1, 20):
+        yield from timeout_point(dut, i, n_cycles=10)
+
+
+def test_wide_address_map(dut):
+    """Test register addressing of an 8-output, 8-APD, 8-pattern ``Entangler``."""
+    # 16 timing registers, so the register index is 4 bits wide
+    addr_timing = 0b01 << 4
+    addr_timestamp = 0b11 << 4
+
     def out(addr, data):
         yield from rtio_output_event(dut.core.rtlink, addr, data)
 
-    def do_timeout(timeout, n_cycles=10):
+    yield from out(addr_timing + 7, (6 << 16) | 5)  # Last sequencer
+    yield from out(addr_timing + 8 + 7, (40 << 16) | 30)  # Last gate
+    # Two words of 2 patterns each: patterns 6 & 7 are in word 3
+    yield from out(ADDR_HERALDS, (3 << 24) | (0b11 << 16) | (0x81 << 8) | 0x42)
+    yield
+
+    assert (yield dut.core.core.sequencers[7].m_start) == 5
+    assert (yield dut.core.core.sequencers[7].m_stop) == 6
+    assert (yield dut.core.core.apd_gaters[7].gate_start) == 30
+    assert (yield dut.core.core.apd_gaters[7].gate_stop) == 40
+    assert (yield dut.core.core.heralder.patterns[6]) == 0x42
+    assert (yield dut.core.core.heralder.patterns[7]) == 0x81
+    assert (yield dut.core.core.heralder.pattern_ens) == 0b1100_0000
+
+    # Read reference timestamp, after all 8 APD timestamps
+    yield from out(addr_timestamp + 8, 0)
+    yield
+    yield  # Through the read queue
+    assert (yield dut.core.rtlink.i.stb)
+
+
+def test_completion_report(dut):
+    """Test the completion report follows the timeout event of a run."""
+
+    def out(addr, data):
+        yield from rtio_output_event(dut.core.rtlink, addr, data)
+
+    yield dut.phy_ref.t_event.eq(1000)
+    for i in range(4):
+        yield getattr(dut, "phy_apd{}".format(i)).t_event.eq(1000)
+    yield from out(ADDR_NCYCLES, 10)
+    yield from out(ADDR_CONFIG, (1 << 8) | 0b111)  # Enable standalone, report
+    yield from out(ADDR_RUN, 50)
+
+    events = []
+    for _ in range(100):
+        if (yield dut.core.rtlink.i.stb):
+            data = yield dut.core.rtlink.i.data
+            events.append((data >> 14, data & 0x3FFF))
+        yield
+
+    # Timeout, then cycle count, trigger count & 5 timestamps
+    assert len(events) == 8
+    assert events[0] == (TAG_EVENT, 0x3FFF)
+    assert all(tag == TAG_REPORT for tag, _ in events[1:])
+    assert events[1][1] == (yield dut.core.core.msm.cycles_completed)
+    assert events[1][1] > 0
+    assert events[2][1] == 0
+
+
+def test_burst_read(dut):
+    """Test a burst read streams the status registers & timestamps."""
+
+    def out(addr, data):
+        yield from rtio_output_event(dut.core.rtlink, addr, data)
+
+    yield dut.phy_ref.t_event.eq(1000)
+    yield from out(ADDR_NCYCLES, 10)
+    yield from out(ADDR_CONFIG, 0b111)  # Enable standalone
+    yield from out(ADDR_RUN, 30)
+    for _ in range(60):
         yield
-        yield from out(ADDR_CONFIG, 0b110)  # disable, standalone
-        yield from out(ADDR_NCYCLES, n_cycles)
-        yield from out(ADDR_CONFIG, 0b111)  # Enable standalone
-        yield from out(ADDR_RUN, timeout)
 
-        timedout = False
-        for i in range(timeout + n_cycles + 50):
+    # Status, ncycles, then from the ref timestamp onwards
+    expected = [0b100, (yield dut.core.core.msm.cycles_completed)]
+    ref_ts = yield dut.core.core.apd_gaters[0].ref_ts
+    events = []
+    for addr, count in [(0b10000, 2), (0b11000 + 4, 1)]:
+        yield from out(0b100000 + 9, (count << 16) | addr)
+        for _ in range(5):
             if (yield dut.core.rtlink.i.stb):
-                data = (yield dut.core.rtlink.i.data)
-                if data == 0x3FFF:
-                    # This should be the first and only timeout
-                    assert not timedout
-                    # Timeout should happen in a timely fashion
-                    assert i <= timeout + n_cycles + 5
-                    timedout = True
+                events.append((yield dut.core.rtlink.i.data))
             yield
-        assert timedout
+    assert events == [(TAG_READ << 14) | data for data in expected + [ref_ts]]
 
-    for i in range(1, 20):
-        yield from do_timeout(i, n_cycles=10)
+
+def test_read_during_burst(dut):
+    """Test reads issued during a burst read are answered after it, in order."""
+
+    def out(addr, data):
+        yield from rtio_output_event(dut.core.rtlink, addr, data)
+
+    yield dut.phy_ref.t_event.eq(1000)
+    yield from out(ADDR_NCYCLES, 10)
+    yield from out(ADDR_CONFIG, 0b111)  # Enable standalone
+    yield from out(ADDR_RUN, 30)
+    for _ in range(60):
+        yield
+
+    core = dut.core.core
+    ncycles = yield core.msm.cycles_completed
+    status = [0b100, ncycles, (yield core.msm.time_remaining)]
+    status.append((yield core.triggers_received))
+    ref_ts = yield core.apd_gaters[0].ref_ts
+    n_cycles = yield core.n_cycles
+    # A burst of the 4 status registers, then (while it is in progress) a register
+    # read, a statistics snapshot & read, another burst, and a status read
+    writes = [
+        (0b100000 + 9, (4 << 16) | 0b10000),
+        (0b10001, 0),
+        (0b100000 + 7, 0),
+        (0b100000 + 8, 0),
+        (0b100000 + 9, (1 << 16) | (0b11000 + 4)),
+        (0b10000, 0),
+    ]
+    events = []
+    for i in range(20):
+        if (yield dut.core.rtlink.i.stb):
+            events.append((yield dut.core.rtlink.i.data))
+        if i < len(writes):
+            yield from out(*writes[i])
+        else:
+            yield
+    expected = status + [ncycles, n_cycles & 0x3FFF, ref_ts, 0b100]
+    assert events == [(TAG_READ << 14) | data for data in expected]
+
+
+def test_histogram_readout(dut):
+    """Test the histograms of all APDs read out contiguously, for any bin count."""
+    num_bins = dut.core.core.histograms[0].num_bins
+
+    def out(addr, data):
+        yield from rtio_output_event(dut.core.rtlink, addr, data)
+
+    # APD i clicks in bin i + 1 (8 mu bins) after the reference, in every cycle
+    yield dut.phy_ref.t_event.eq(8 * 3 + 1)
+    for i in range(4):
+        yield getattr(dut, "phy_apd{}".format(i)).t_event.eq(8 * 3 + 1 + 8 * (i + 1))
+    yield from out(0b100000 + 2, 3 << 16)  # Histogram offset 0, 8 mu bins
+    yield from out(ADDR_NCYCLES, 10)
+    yield from out(ADDR_CONFIG, 0b111)  # Enable standalone
+    yield from out(ADDR_RUN, 50)
+    for _ in range(60):
+        yield
+
+    yield from out(0b100000 + 3, 0)  # Rewind the readout pointer
+    words = []
+    for i in range(2 * 4 * num_bins + 5):
+        if (yield dut.core.rtlink.i.stb):
+            words.append((yield dut.core.rtlink.i.data) & 0x3FFF)
+        if i < 2 * 4 * num_bins:
+            yield from out(0b100000 + 4, 0)
+        else:
+            yield
+    assert len(words) == 2 * 4 * num_bins
+    counts = [low | (high << 14) for low, high in zip(words[::2], words[1::2])]
+    n_cycles = counts[1]
+    assert n_cycles > 0
+    for i in range(4):
+        expected = [0] * num_bins
+        expected[i + 1] = n_cycles
+        assert counts[i * num_bins : (i + 1) * num_bins] == expected  # noqa
+
+
+def test_histogram_first_cycle(dut):
+    """Test clicks in the first cycle of a run are histogrammed, once cleared."""
+    num_bins = dut.core.core.histograms[0].num_bins
+
+    def out(addr, data):
+        yield from rtio_output_event(dut.core.rtlink, addr, data)
+
+    # APD 0 clicks in bin 1 (8 mu bins) after the reference, in every cycle
+    yield dut.phy_ref.t_event.eq(8 * 3 + 1)
+    yield dut.phy_apd0.t_event.eq(8 * 3 + 1 + 8)
+    for i in range(1, 4):
+        yield getattr(dut, "phy_apd{}".format(i)).t_event.eq(1000)
+    yield from out(0b100000 + 2, 3 << 16)  # Histogram offset 0, 8 mu bins
+    yield from out(ADDR_NCYCLES, 10)
+    yield from out(ADDR_CONFIG, 0b111)  # Enable standalone
+    # A run of several cycles, then one that times out during its first cycle
+    for timeout in [50, 5]:
+        yield from out(0b100000 + 19, 0)  # Clear the histograms
+        for _ in range(num_bins):
+            yield
+        yield from out(ADDR_RUN, timeout)
+        for _ in range(timeout + 30):
+            yield
+    assert (yield dut.core.core.msm.cycles_completed) == 1
+
+    # Read bin 1 of APD 0
+    yield from out(0b100000 + 3, 1 << 1)
+    words = []
+    for i in range(6):
+        if (yield dut.core.rtlink.i.stb):
+            words.append((yield dut.core.rtlink.i.data))
+        if i < 2:
+            yield from out(0b100000 + 4, 0)
+        else:
+            yield
+    assert words == [(TAG_READ << 14) | 1, TAG_READ << 14]
+
+
+def test_read_every_clock(dut):
+    """Test reads on every clock cycle around the end of a run are not dropped.
+
+    The core-done event and completion report are interleaved with the read
+    responses, which are delayed but all delivered in order.
+    """
+
+    def out(addr, data):
+        yield from rtio_output_event(dut.core.rtlink, addr, data)
+
+    yield dut.phy_ref.t_event.eq(1000)
+    for i in range(4):
+        yield getattr(dut, "phy_apd{}".format(i)).t_event.eq(1000)
+    yield from out(ADDR_NCYCLES, 10)
+    yield from out(ADDR_CONFIG, (1 << 8) | 0b111)  # Enable standalone, report
+    yield from out(ADDR_RUN, 40)
+
+    events = []
+    n_reads = 0
+    for i in range(150):
+        if (yield dut.core.rtlink.i.stb):
+            data = yield dut.core.rtlink.i.data
+            events.append((data >> 14, data & 0x3FFF))
+        if i < 100:
+            # Read status on every clock cycle
+            yield from out(0b10000, 0)
+            n_reads += 1
+        else:
+            yield
+
+    tags = [tag for tag, _ in events]
+    assert tags.count(TAG_READ) == n_reads
+    assert tags.count(TAG_EVENT) == 1
+    assert tags.count(TAG_REPORT) == 7
+    done = tags.index(TAG_EVENT)
+    assert events[done] == (TAG_EVENT, 0x3FFF)
+    # The report follows the core-done event, ahead of the queued reads
+    assert tags[done + 1 : done + 8] == [TAG_REPORT] * 7  # noqa
+    assert events[done + 1][1] == (yield dut.core.core.msm.cycles_completed)
+    # Status reads: running until the timeout, then timed out (& not ready)
+    statuses = [data for tag, data in events if tag == TAG_READ]
+    assert statuses[0] == 0b001
+    assert statuses[-1] == 0b100
+
+
+def test_telemetry(dut):
+    """Test telemetry events are sent every few cycles of a run."""
+
+    def out(addr, data):
+        yield from rtio_output_event(dut.core.rtlink, addr, data)
+
+    # Reference & APD 0 click in the gate window in every cycle
+    yield dut.phy_ref.t_event.eq(8 * 3 + 1)
+    yield dut.phy_apd0.t_event.eq(8 * 3 + 1 + 20)
+    for i in range(1, 4):
+        yield getattr(dut, "phy_apd{}".format(i)).t_event.eq(1000)
+    yield from out(ADDR_TIMING + 4, (30 << 16) | 18)
+    yield from out(ADDR_NCYCLES, 10)
+    yield from out(0b100000 + 10, 3)  # Telemetry every 3 cycles
+    yield from out(ADDR_CONFIG, 0b111)  # Enable standalone
+    yield from out(ADDR_RUN, 150)
+
+    telemetry = []
+    for _ in range(200):
+        if (yield dut.core.rtlink.i.stb):
+            data = yield dut.core.rtlink.i.data
+            if data >> 14 == TAG_TELEMETRY:
+                telemetry.append(data & 0x3FFF)
+        yield
+
+    # [cycles, triggers, clicks of each APD] every 3 cycles
+    n_cycles = yield dut.core.core.msm.cycles_completed
+    records = [telemetry[i : i + 6] for i in range(0, len(telemetry), 6)]  # noqa
+    assert len(records) == n_cycles // 3
+    for i, record in enumerate(records):
+        assert record == [3 * (i + 1), 3, 3, 0, 0, 0]
+
+
+def test_abort(dut):
+    """Test an aborted run finishes early with the abort code."""
+
+    def out(addr, data):
+        yield from rtio_output_event(dut.core.rtlink, addr, data)
+
+    yield dut.phy_ref.t_event.eq(1000)
+    yield from out(ADDR_NCYCLES, 10)
+    yield from out(ADDR_CONFIG, 0b111)  # Enable standalone
+    yield from out(ADDR_RUN, 1000)
+    for _ in range(50):
+        yield
+    yield from out(0b100000 + 11, 0)  # Abort
+
+    events = []
+    for _ in range(20):
+        if (yield dut.core.rtlink.i.stb):
+            events.append((yield dut.core.rtlink.i.data))
+        yield
+    assert events == [ABORT_CODE]
+
+    # Status: not ready, aborted
+    yield from out(0b10000, 0)
+    yield
+    yield
+    assert (yield dut.core.rtlink.i.stb)
+    assert (yield dut.core.rtlink.i.data) == (TAG_READ << 14) | 0b1000
+
+
+def test_config_slots(dut):
+    """Test switching between configurations stored in config slots."""
+
+    def out(addr, data):
+        yield from rtio_output_event(dut.core.rtlink, addr, data)
+
+    core = dut.core.core
+
+    def live_config():
+        config = []
+        for seq in core.sequencers:
+            config.append(((yield seq.m_start), (yield seq.m_stop)))
+        for gater in core.apd_gaters:
+            config.append(((yield gater.gate_start), (yield gater.gate_stop)))
+        for pattern in core.heralder.patterns:
+            config.append((yield pattern))
+        config.append((yield core.heralder.pattern_ens))
+        config.append((yield core.msm.m_end))
+        return config
+
+    # Write slot 1, then the live registers
+    yield from out(0b100000 + 12, 2)
+    yield from out(ADDR_TIMING + 0, (9 << 16) | 5)
+    yield from out(ADDR_TIMING + 5, (40 << 16) | 20)
+    yield from out(ADDR_HERALDS, (0b11 << 16) | 0b10100101)
+    yield from out(ADDR_NCYCLES, 40)
+    yield from out(0b100000 + 12, 0)
+    yield from out(ADDR_TIMING + 0, (2 << 16) | 1)
+    yield from out(ADDR_NCYCLES, 20)
+    yield
+    slot_1 = [(5, 9), (0, 0), (0, 0), (0, 0), (0, 0), (20, 40), (0, 0), (0, 0)]
+    slot_1 += [0b0101, 0b1010, 0, 0, 0b0011, 40]
+    live = [(1, 2)] + [(0, 0)] * 7 + [0] * 5 + [20]
+    assert (yield from live_config()) == live
+
+    yield from out(0b100000 + 13, 1)  # Load slot 1
+    yield
+    assert (yield from live_config()) == slot_1
+    yield from out(0b100000 + 13, 0)  # Load (empty) slot 0
+    yield
+    assert (yield from live_config()) == [(0, 0)] * 8 + [0] * 6
+
+
+def test_shadow_commit(dut):
+    """Test shadowed configuration writes are applied at a cycle boundary."""
+
+    def out(addr, data):
+        yield from rtio_output_event(dut.core.rtlink, addr, data)
+
+    msm = dut.core.core.msm
+    sequencer = dut.core.core.sequencers[0]
+    yield dut.phy_ref.t_event.eq(1000)
+    yield from out(ADDR_TIMING + 0, (3 << 16) | 2)
+    yield from out(ADDR_NCYCLES, 20)
+    yield from out(ADDR_CONFIG, (1 << 9) | 0b111)  # Enable standalone, shadow
+    yield from out(ADDR_RUN, 1000)
+    for _ in range(30):
+        yield
+
+    # Held until committed
+    yield from out(ADDR_TIMING + 0, (9 << 16) | 5)
+    yield from out(ADDR_NCYCLES, 30)
+    for _ in range(30):
+        yield
+    assert (yield sequencer.m_start) == 2
+    assert (yield msm.m_end) == 20
+
+    yield from out(0b100000 + 14, 0)  # Commit
+    yield from out(0b10000, 0)  # Read status: commit pending
+    yield
+    yield
+    assert (yield dut.core.rtlink.i.data) == (TAG_READ << 14) | 0b10001
+    m = []
+    while (yield sequencer.m_start) == 2:
+        m.append((yield msm.m))
+        yield
+    # Applied on the idle clock cycle between two cycles, all registers at once
+    assert m[-2:] == [20, 21] and (yield msm.m) == 0
+    assert (yield sequencer.m_stop) == 9
+    assert (yield msm.m_end) == 30
+
+    # Back to immediate writes
+    yield from out(ADDR_CONFIG, 0b111)
+    yield from out(ADDR_TIMING + 0, (4 << 16) | 1)
+    yield
+    assert (yield sequencer.m_start) == 1
+
+
+def test_parameter_scan(dut):
+    """Test a gate window scan records the clicks of each point in one run."""
+
+    def out(addr, data):
+        yield from rtio_output_event(dut.core.rtlink, addr, data)
+
+    gater = dut.core.core.apd_gaters[0]
+    # Reference & APD 0 click, 20 mu after the reference, in every cycle
+    yield dut.phy_ref.t_event.eq(8 * 3 + 1)
+    yield dut.phy_apd0.t_event.eq(8 * 3 + 1 + 20)
+    for i in range(1, 4):
+        yield getattr(dut, "phy_apd{}".format(i)).t_event.eq(1000)
+    yield from out(ADDR_TIMING + 4, (10 << 16) | 2)
+    yield from out(ADDR_HERALDS, (1 << 16) | 0b0001)
+    yield from out(ADDR_NCYCLES, 20)
+    # Step the gate window start & stop of APD 0 by 8 mu, 4 points of 3 cycles
+    yield from out(0b100000 + 15, (8 << 16) | (0b11 << 8) | 4)
+    yield from out(0b100000 + 16, (4 << 16) | 3)
+    yield from out(ADDR_CONFIG, 0b111)  # Enable standalone
+    yield from out(ADDR_RUN, 1000)
+
+    events = []
+    gate_windows = set()
+    for _ in range(400):
+        if (yield dut.core.rtlink.i.stb):
+            events.append((yield dut.core.rtlink.i.data))
+        gate_windows.add(((yield gater.gate_start), (yield gater.gate_stop)))
+        yield
+    # Heralds do not finish the run, which ends with the scan
+    assert events == [ABORT_CODE]
+    assert gate_windows == {(2, 10), (10, 18), (18, 26), (26, 34)}
+    assert ((yield gater.gate_start), (yield gater.gate_stop)) == (2, 10)
+
+    # Read the number of points, then the records from the first point
+    writes = [(0b10000 + 6, 0), (0b100000 + 17, 0)] + [(0b100000 + 18, 0)] * 20
+    records = []
+    for i in range(40):
+        if (yield dut.core.rtlink.i.stb):
+            data = yield dut.core.rtlink.i.data
+            assert data >> 14 == TAG_READ
+            records.append(data & 0x3FFF)
+        if i < len(writes):
+            yield from out(*writes[i])
+        else:
+            yield
+    assert records[0] == 4
+    # [heralds, clicks of each APD] for each point
+    points = [records[i : i + 5] for i in range(1, len(records), 5)]  # noqa
+    assert points == [[0] * 5, [0] * 5, [3, 3, 0, 0, 0], [0] * 5]
 
 
 if __name__ == "__main__":
+    dut = PhyHarness()
+    run_simulation(dut, test_basic(dut), vcd_name="phy.vcd", clocks=CLOCKS)
+
+    dut = PhyHarness()
+    run_simulation(dut, test_timeout(dut), vcd_name="phy_timeout.vcd", clocks=CLOCKS)
+
+    dut = PhyHarness(num_outputs=8, num_inputs=8, num_patterns=8)
+    run_simulation(
+        dut, test_wide_address_map(dut), vcd_name="phy_wide.vcd", clocks=CLOCKS
+    )
+
+    dut = PhyHarness()
+    run_simulation(
+        dut, test_completion_report(dut), vcd_name="phy_report.vcd", clocks=CLOCKS
+    )
+
+    dut = PhyHarness()
+    run_simulation(
+        dut, test_burst_read(dut), vcd_name="phy_burst_read.vcd", clocks=CLOCKS
+    )
+
+    dut = PhyHarness()
+    run_simulation(
+        dut,
+        test_read_during_burst(dut),
+        vcd_name="phy_read_during_burst.vcd",
+        clocks=CLOCKS,
+    )
+
+    dut = PhyHarness(num_histogram_bins=6)
+    run_simulation(
+        dut, test_histogram_readout(dut), vcd_name="phy_histogram.vcd", clocks=CLOCKS
+    )
+
+    dut = PhyHarness(num_histogram_bins=8)
+    run_simulation(
+        dut,
+        test_histogram_first_cycle(dut),
+        vcd_name="phy_histogram_first_cycle.vcd",
+        clocks=CLOCKS,
+    )
+
     dut = PhyHarness()
     run_simulation(
-        dut, test_basic(dut), vcd_name="phy.vcd", clocks={"sys": 8, "rio": 8}
+        dut,
+        test_read_every_clock(dut),
+        vcd_name="phy_read_every_clock.vcd",
+        clocks=CLOCKS,
     )
 
     dut = PhyHarness()
     run_simulation(
-        dut, test_timeout(dut), vcd_name="phy_timeout.vcd", clocks={"sys": 8, "rio": 8}
+        dut, test_telemetry(dut), vcd_name="phy_telemetry.vcd", clocks=CLOCKS
+    )
+
+    dut = PhyHarness()
+    run_simulation(dut, test_abort(dut), vcd_name="phy_abort.vcd", clocks=CLOCKS)
+
+    dut = PhyHarness(num_config_slots=4)
+    run_simulation(
+        dut, test_config_slots(dut), vcd_name="phy_config_slots.vcd", clocks=CLOCKS
+    )
+
+    dut = PhyHarness()
+    run_simulation(
+        dut, test_shadow_commit(dut), vcd_name="phy_shadow_commit.vcd", clocks=CLOCKS
+    )
+
+    dut = PhyHarness(num_scan_points=8)
+    run_simulation(
+        dut, test_parameter_scan(dut), vcd_name="phy_parameter_scan.vcd", clocks=CLOCKS
     )
@@ -0,0 +1,165 @@
+"""Test the :class:`entangler.rate.RateEstimator` against the core model."""
+import numpy as np
+
+from entangler.driver import EntanglerConfig
+from entangler.model import CoreModel
+from entangler.rate import RateEstimator
+
+HERALDS = [0b0101, 0b1010]
+PHOTON_PATTERNS = {0b0101: 0.2, 0b1010: 0.2, 0b0011: 0.1}
+
+
+def make_model(estimator, starts, stops, cycle_length_mu):
+    """Core model with the estimator's settings (as written by the driver)."""
+    model = CoreModel()
+    model.m_end = cycle_length_mu // 8
+    model.gate_start[:] = np.asarray(starts) + 1
+    model.gate_stop[:] = np.asarray(stops) + 1
+    model.patterns[: len(HERALDS)] = HERALDS
+    model.pattern_ens = (1 << len(HERALDS)) - 1
+    model.pipelined = estimator.pipelined
+    return model
+
+
+def herald_probability_test(n_cycles=200000, seed=0):
+    """Check the herald probabilities against a Monte Carlo run of the model."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(120)
+    arrival = np.where(t >= 30, np.exp(-(t - 30) / 15), 0)
+    estimator = RateEstimator(
+        arrival,
+        PHOTON_PATTERNS,
+        HERALDS,
+        efficiencies=[0.8, 0.6, 0.7, 0.5],
+        dark_rates=1e6,
+        t_ref_mu=21,
+    )
+    starts, stops = [30, 35, 28, 40], [60, 70, 50, 90]
+    estimate = estimator.estimate(starts, stops)
+    model = make_model(estimator, starts, stops, int(estimate["cycle_length_mu"]))
+
+    # Photons sent to each input, detected with the input's efficiency
+    patterns = np.array(list(PHOTON_PATTERNS) + [0])
+    probabilities = list(PHOTON_PATTERNS.values())
+    probabilities.append(1 - sum(probabilities))
+    sent = rng.choice(patterns, size=n_cycles, p=probabilities)
+    sent = (sent[:, None] >> np.arange(4)) & 1 == 1
+    detected = sent & (rng.random((n_cycles, 4)) < estimator.efficiencies)
+    t_photon = rng.choice(len(t), size=(n_cycles, 4), p=estimator.arrival[0])
+    # Up to two dark counts per input in the range of arrival times
+    n_dark = rng.poisson(estimator.dark_rates[0] * len(t) * estimator.mu, (n_cycles, 4))
+    t_dark = rng.integers(0, len(t), (n_cycles, 4, 2))
+    t_dark[n_dark[:, :, None] <= np.arange(2)] = -1
+    edges = np.concatenate(
+        [np.where(detected, t_photon, -1)[:, :, None], t_dark], axis=2
+    )
+    # Edges of an input must be in different coarse clock cycles
+    t_ref = estimator.t_ref_mu
+    edges = np.where(edges >= 0, edges + t_ref, -1)
+    edges.sort(axis=2)
+    same = (edges[:, :, 1:] >> 3) == (edges[:, :, :-1] >> 3)
+    edges[:, :, 1:][same] = -1
+
+    cycles = model.cycles(np.full(n_cycles, t_ref), edges)
+    clicks = (cycles["clicks"][:, None] >> np.arange(4)) & 1 == 1
+    in_gate = (
+        detected
+        & (t_photon >= np.array(starts) + 1)
+        & (t_photon <= np.array(stops) + 1)
+    )
+    true = cycles["herald"] & np.all((clicks == sent) & (in_gate | ~sent), axis=1)
+
+    def check(measured, expected):
+        assert abs(measured - expected) < 5 * np.sqrt(expected / n_cycles), (
+            measured,
+            expected,
+        )
+
+    check(cycles["herald"].mean(), estimate["p_herald"])
+    check(true.mean(), estimate["p_true"])
+
+
+def cycle_length_test():
+    """Check the cycle length is the shortest to see the edges at gate stop."""
+    for pipelined in [False, True]:
+        estimator = RateEstimator(
+            np.ones(200), {0b0101: 1}, HERALDS, t_ref_mu=13, pipelined=pipelined
+        )
+        for stop in range(40, 60):
+            cycle_length_mu = int(estimator.cycle_length_mu(stop))
+            for shorter in [0, 8]:
+                model = make_model(estimator, 20, stop, cycle_length_mu - shorter)
+                edges = np.full((1, 4), -1)
+                edges[0, [0, 2]] = 13 + stop + 1
+                herald = model.cycles([13], edges)["herald"][0]
+                assert herald == (shorter == 0), (pipelined, stop, shorter)
+
+
+def run_time_test():
+    """Check the time per herald includes the idle cycles between cycles & runs."""
+    arrival = np.zeros(100)
+    arrival[30] = 1
+    for pipelined in [False, True]:
+        estimator = RateEstimator(arrival, {0b0101: 1}, HERALDS, pipelined=pipelined)
+        estimate = estimator.estimate([10] * 4, [50] * 4)
+        assert estimate["p_herald"] == 1
+        model = make_model(estimator, [10] * 4, [50] * 4, estimate["cycle_length_mu"])
+        edges = np.full((1, 4), -1)
+        edges[0, [0, 2]] = 30
+        run = model.run([0], edges, time_remaining=1000)
+        assert run["result"] == 1
+        assert np.isclose(run["done"] * 8e-9, 1 / estimate["herald_rate"])
+
+
+def optimize_test():
+    """Check the optimizer finds the narrowest gate covering all the photons."""
+    arrival = np.zeros(200)
+    arrival[40:80] = 1
+    estimator = RateEstimator(
+        arrival,
+        {0b0101: 0.5, 0b1010: 0.5},
+        HERALDS,
+        efficiencies=0.5,
+        dark_rates=1e5,
+        min_cycle_length_mu=800,
+    )
+    settings = estimator.optimize()
+    assert settings.gate_starts_mu == [39] * 4
+    assert settings.gate_stops_mu == [78] * 4
+    assert settings.cycle_length_mu == 800
+
+    # Without a minimum cycle length, the tail of the photons is cut off to
+    # shorten the cycle
+    estimator.min_cycle_length_mu = 0
+    shorter = estimator.optimize()
+    assert shorter.cycle_length_mu < 800
+    assert shorter.estimate["success_rate"] > settings.estimate["success_rate"]
+
+    config = EntanglerConfig()
+    settings.apply(config)
+    config.set_config(enable=True)
+    upload = config.to_array().reshape(-1, 2).tolist()
+    assert [config.gate_address(0), (79 << 16) | 40] in upload
+
+
+def false_herald_test():
+    """Check gates narrow to keep the false herald fraction below the limit."""
+    t = np.arange(200)
+    arrival = np.exp(-((t - 60) ** 2) / 200)
+    estimator = RateEstimator(
+        arrival, {0b0101: 0.01, 0b1010: 0.01}, HERALDS, dark_rates=2e4
+    )
+    best = estimator.optimize()
+    clean = estimator.optimize(max_false_fraction=best.estimate["false_fraction"] / 2)
+    assert clean.estimate["false_fraction"] <= best.estimate["false_fraction"] / 2
+    assert clean.estimate["success_rate"] < best.estimate["success_rate"]
+    widths = np.array(clean.gate_stops_mu) - np.array(clean.gate_starts_mu)
+    assert np.all(widths < np.array(best.gate_stops_mu) - best.gate_starts_mu)
+
+
+if __name__ == "__main__":
+    herald_probability_test()
+    cycle_length_test()
+    run_time_test()
+    optimize_test()
+    false_herald_test()
@@ -4,6 +4,7 @@ from migen import run_simulation
 from migen import Signal
 
 from entangler.core import ChannelSequencer
+from entangler.core import EdgeSequencer
 
 
 class ChannelSequencerHarness(Module):
@@ -39,6 +40,62 @@ def channel_sequencer_test(dut):
             assert (yield dut.core.output) == 0
 
 
+class EdgeSequencerHarness(Module):
+    """Test harness for the :class:`EdgeSequencer`."""
+
+    def __init__(self):
+        """Wrap & provide passthroughs for the :class:`EdgeSequencer`."""
+        self.m = Signal(10)
+        self.submodules.core = EdgeSequencer(self.m, num_channels=2, depth=8)
+
+
+def edge_sequencer_test(dut):
+    """Test the :class:`EdgeSequencer` outputs multiple pulses per channel."""
+    # (time, channel mask, level)
+    edges = [(5, 0b01, 1), (8, 0b01, 0), (10, 0b11, 1), (15, 0b01, 0), (20, 0b10, 0)]
+
+    yield dut.core.write_reset.eq(1)
+    yield
+    yield dut.core.write_reset.eq(0)
+    for t, mask, level in edges:
+        yield dut.core.write_data.eq(t | (mask << 10) | (level << 12))
+        yield dut.core.write_stb.eq(1)
+        yield
+    yield dut.core.write_stb.eq(0)
+    yield dut.core.n_edges.eq(len(edges))
+
+    for _ in range(2):
+        # Run twice, to check clear restarts the sequence
+        yield dut.core.clear.eq(1)
+        yield dut.m.eq(0)
+        yield
+        yield dut.core.clear.eq(0)
+        yield
+
+        expected = 0
+        for i in range(30):
+            yield dut.m.eq(i)
+            yield
+            # Outputs change on the clock cycle after m reaches the edge time
+            assert (yield dut.core.output) == expected
+            for t, mask, level in edges:
+                if t == i:
+                    expected = (expected & ~mask) | (mask if level else 0)
+
+    # Only the first n_edges are used
+    yield dut.core.n_edges.eq(1)
+    yield dut.core.clear.eq(1)
+    yield
+    yield dut.core.clear.eq(0)
+    for i in range(30):
+        yield dut.m.eq(i)
+        yield
+    assert (yield dut.core.output) == 0b01
+
+
 if __name__ == "__main__":
     dut = ChannelSequencerHarness()
     run_simulation(dut, channel_sequencer_test(dut), vcd_name="sequencer.vcd")
+
+    dut = EdgeSequencerHarness()
+    run_simulation(dut, edge_sequencer_test(dut), vcd_name="edge_sequencer.vcd")
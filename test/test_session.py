@@ -0,0 +1,121 @@
+"""Test simulating many testbenches on one elaborated harness (``helpers/session.py``).
+
+Every run of a :class:`SimSession` must behave exactly as on a freshly
+instantiated harness. Running this file also benchmarks the time saved.
+"""
+import os
+import sys
+import time
+
+# add gateware simulation tools "module" (at ./helpers/*)
+sys.path.append(os.path.dirname(__file__))
+sys.path.append(os.path.join(os.path.dirname(__file__), "helpers"))
+
+
+from session import SimSession  # noqa: E402 ./helpers/session
+from sweep import run_point  # noqa: E402 ./helpers/sweep
+from sweep import run_points  # noqa: E402
+from test_entangler_core import StandaloneHarness  # noqa: E402
+from test_entangler_core import standalone_test  # noqa: E402
+from test_entangler_core import statistics_test  # noqa: E402
+from test_phy import PhyHarness  # noqa: E402
+from test_phy import timeout_point  # noqa: E402
+from test_sweep import CLOCKS  # noqa: E402
+from test_sweep import herald_point  # noqa: E402
+
+
+def aborted_test(dut):
+    """Leave the core mid-run, as a failed testbench would."""
+    yield dut.core.msm.m_end.eq(20)
+    yield dut.core.msm.standalone.eq(1)
+    yield dut.core.msm.time_remaining_buf.eq(1000)
+    yield dut.phy_ref.t_event.eq(8 * 3 + 1)
+    yield dut.phy_apd0.t_event.eq(8 * 3 + 1 + 20)
+    yield dut.core.msm.run_stb.eq(1)
+    yield
+    yield dut.core.msm.run_stb.eq(0)
+    for _ in range(50):
+        yield
+    raise RuntimeError("aborted")
+
+
+def fresh_run(harness_factory, stimulus, clocks=None):
+    """State of a freshly instantiated harness after running the stimulus."""
+    session = SimSession(harness_factory(), clocks)
+    session.run(stimulus(session.dut))
+    return session.state()
+
+
+def test_reset_state():
+    """Check a reset harness is in the same state as a fresh one."""
+    fresh = SimSession(StandaloneHarness())
+    session = SimSession(StandaloneHarness())
+    session.run(statistics_test(session.dut))
+    assert session.state() != fresh.state()
+    session.reset()
+    assert session.state() == fresh.state()
+
+
+def test_standalone_runs():
+    """Check runs end in the same state as on fresh harnesses, in any order."""
+    stimuli = [standalone_test, statistics_test, aborted_test, standalone_test]
+    fresh = {
+        stimulus: fresh_run(StandaloneHarness, stimulus)
+        for stimulus in stimuli
+        if stimulus is not aborted_test
+    }
+    session = SimSession(StandaloneHarness())
+    for stimulus in stimuli:
+        try:
+            session.run(stimulus(session.dut))
+        except RuntimeError:
+            assert stimulus is aborted_test
+            continue
+        assert session.state() == fresh[stimulus], stimulus.__name__
+    assert session.n_runs == len(stimuli)
+
+
+def test_phy_runs():
+    """Check sweep points give the same results as on fresh harnesses."""
+    points = [
+        {"timeout": 30, "n_cycles": 4, "t_ref": 9, "t_herald": 19},
+        {"timeout": 3, "n_cycles": 9, "t_ref": 9, "t_herald": 63},
+        {"timeout": 30, "n_cycles": 4, "t_ref": 9, "t_herald": 30},
+    ]
+    fresh = [run_point(PhyHarness, herald_point, p, CLOCKS) for p in points]
+    reused = run_points(PhyHarness, herald_point, points, CLOCKS)
+    assert [r.value for r in reused] == [r.value for r in fresh]
+    assert all(r.ok for r in reused)
+
+
+def benchmark_session(n_points=10, repeats=1):
+    """Time a timeout sweep on fresh harnesses, and on one reused harness.
+
+    Returns:
+        tuple: seconds taken with fresh harnesses, and with a reused harness.
+    """
+    points = [{"timeout": timeout, "n_cycles": 4} for timeout in range(n_points)]
+    t_fresh = t_reused = float("inf")
+    for _ in range(repeats):
+        t_start = time.perf_counter()
+        fresh = [run_point(PhyHarness, timeout_point, p, CLOCKS) for p in points]
+        t_fresh = min(t_fresh, time.perf_counter() - t_start)
+        t_start = time.perf_counter()
+        reused = run_points(PhyHarness, timeout_point, points, CLOCKS)
+        t_reused = min(t_reused, time.perf_counter() - t_start)
+        assert [r.value for r in reused] == [r.value for r in fresh]
+    return t_fresh, t_reused
+
+
+if __name__ == "__main__":
+    test_reset_state()
+    test_standalone_runs()
+    test_phy_runs()
+
+    n_points = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    t_fresh, t_reused = benchmark_session(n_points, repeats=3)
+    print(
+        "{} points: {:.2f} s fresh, {:.2f} s reused ({:.0%} saved)".format(
+            n_points, t_fresh, t_reused, 1 - t_reused / t_fresh
+        )
+    )
@@ -0,0 +1,275 @@
+"""Soak test the entangler gateware with random stimulus.
+
+Random reference & APD edges (photons, jitter, dark counts...) are replayed into
+the gateware over many runs, and each herald & run result is checked against the
+:class:`entangler.model.CoreModel`. The soak drives a standalone
+:class:`entangler.core.EntanglerCore` directly, in independent chunks of cycles that
+are simulated in parallel. A shorter soak of the full :class:`entangler.phy.Entangler`
+also checks the RTIO input events. The tests take no arguments, so they also run
+under pytest.
+
+Throughput is limited by the migen simulator: the core soak checks about 20 cycles
+per second in each process (about 300 clock cycles per second, measured on one Xeon
+core), and the PHY soak about 14. A soak of 10**5 cycles, ``python test_soak.py
+100000 [seed]``, so takes about 85 minutes of CPU time, spread over all the CPUs.
+"""
+import concurrent.futures
+import os
+import sys
+
+import numpy as np
+
+# add gateware simulation tools "module" (at ./helpers/*)
+sys.path.append(os.path.dirname(__file__))
+sys.path.append(os.path.join(os.path.dirname(__file__), "helpers"))
+
+
+from migen import Module  # noqa: E402
+from migen import run_simulation  # noqa: E402
+from migen import Signal  # noqa: E402
+
+from entangler.core import EntanglerCore  # noqa: E402
+from entangler.model import CoreModel  # noqa: E402
+from entangler.model import TIMEOUT  # noqa: E402
+from entangler.phy import Entangler  # noqa: E402
+from gateware_utils import rtio_output_event  # noqa: E402 ./helpers/gateware_utils
+from stimulus import EdgeReplay  # noqa: E402 ./helpers/stimulus
+from stimulus import random_edges  # noqa: E402
+from stimulus import Scoreboard  # noqa: E402
+from test_model import configure  # noqa: E402
+
+ADDR_CONFIG = 0
+ADDR_RUN = 1
+ADDR_NCYCLES = 2
+ADDR_HERALDS = 3
+ADDR_RUN_N = 4
+ADDR_NSUCCESSES = 5
+ADDR_TIMING = 0b1000
+
+CLOCKS = {"sys": 8, "rio": 8, "rio_phy": 8}
+
+
+class SoakHarness(Module):
+    """Test harness replaying edges into a standalone ``EntanglerCore``.
+
+    With ``phy``, the core is that of an :class:`entangler.phy.Entangler`, driven
+    through its RTIO link.
+    """
+
+    def __init__(self, ref, apd, phy=False):
+        """Connect edge replay PHYs to the core."""
+        self.counter = Signal(32)
+        self.counting = Signal()
+        self.cycle_stb = Signal()
+
+        self.submodules.replay = EdgeReplay(
+            self.counter, self.counting, self.cycle_stb, ref, apd
+        )
+        input_phys = self.replay.phy_apds + [self.replay.phy_ref]
+        if phy:
+            self.submodules.phy = Entangler(None, None, None, input_phys, simulate=True)
+            self.core = self.phy.core
+        else:
+            self.submodules.core = EntanglerCore(
+                None, None, None, input_phys, simulate=True
+            )
+
+        msm = self.core.msm
+        self.comb += [
+            self.counter.eq(msm.m),
+            self.counting.eq(msm.counting),
+            self.cycle_stb.eq(msm.cycle_stb),
+        ]
+
+
+def random_writes(rng, m_end):
+    """Random configuration register writes for a standalone device."""
+    heralds = [0b0101, 0b1010] + list(rng.integers(1, 16, 2))
+    enables = rng.integers(1, 16)
+    data = sum(h << (4 * i) for i, h in enumerate(heralds)) | (enables << 16)
+    writes = [(ADDR_NCYCLES, m_end), (ADDR_HERALDS, int(data))]
+    for i in range(4):
+        start = int(rng.integers(8, 60))
+        stop = start + int(rng.integers(10, 100))
+        writes.append((ADDR_TIMING + 4 + i, (stop << 16) | start))
+    pipelined, early_exit = rng.integers(0, 2, 2)
+    writes.append((ADDR_CONFIG, 0b111 | (pipelined << 3) | (early_exit << 4)))
+    return [(addr, int(data)) for addr, data in writes]
+
+
+def random_stimulus(rng, n_cycles):
+    """Random cycle length & reference & APD edges of ``n_cycles`` cycles."""
+    m_end = int(rng.integers(6, 20))
+    ref, apd = random_edges(
+        rng,
+        n_cycles,
+        m_end,
+        t_ref_mu=16,
+        ref_jitter_mu=2,
+        p_ref=0.95,
+        photon_patterns={0b0101: 0.2, 0b1010: 0.2, 0b0011: 0.1},
+        arrival_mu=(20, 80),
+        jitter_mu=3,
+        efficiency=0.7,
+        dark_rate=2e-3,
+    )
+    return m_end, ref, apd
+
+
+def random_runs(rng, model, ref, apd, max_cycles_per_run=50):
+    """Draw random runs over the replayed cycles, with the results the model expects.
+
+    Yields:
+        tuple: the time remaining & number of successes of each run, and the result
+        of :meth:`entangler.model.CoreModel.run`, until the replayed cycles run out.
+    """
+    cycle_clocks = model.cycle_length() + 1
+    offset = 0
+    while True:
+        time_remaining = int(rng.integers(0, max_cycles_per_run * cycle_clocks))
+        n_successes = int(rng.integers(1, 4))
+        window = slice(offset, offset + 2 * max_cycles_per_run)
+        expected = model.run(ref[window], apd[window], time_remaining, n_successes)
+        if not expected["finished"]:
+            return
+        yield time_remaining, n_successes, expected
+        offset += expected["n_cycles"]
+
+
+def core_soak_test(dut, rng, writes, ref, apd):
+    """Run the core through all the replayed cycles, checking each run.
+
+    Returns:
+        int: the number of cycles checked.
+    """
+    msm = dut.core.msm
+    model = CoreModel()
+    for addr, data in writes:
+        model.write(addr, data)
+    yield from configure(dut, model)
+
+    n_cycles = 0
+    for run, (time_remaining, n_successes, expected) in enumerate(
+        random_runs(rng, model, ref, apd)
+    ):
+        yield msm.time_remaining_buf.eq(time_remaining)
+        yield msm.n_successes_buf.eq(n_successes)
+        yield msm.run_stb.eq(1)
+        yield
+        yield msm.run_stb.eq(0)
+        events = []
+        for clock in range(expected["done"] + 1):
+            if (yield msm.herald_stb | msm.done_stb):
+                result = TIMEOUT
+                if (yield msm.success):
+                    result = yield dut.core.herald_result
+                events.append((clock, result))
+            yield
+        heralds = list(zip(expected["herald_times"], expected["herald_results"]))
+        if expected["result"] == TIMEOUT:
+            heralds.append((expected["done"], TIMEOUT))
+        assert events == heralds, "run {}: {} != {}".format(run, events, heralds)
+        n_cycles += expected["n_cycles"]
+        assert (yield dut.replay.cycle) == n_cycles
+    return n_cycles
+
+
+def phy_soak_test(dut, scoreboard, rng, writes, ref, apd):
+    """Run the PHY through all the replayed cycles, checking each run's events."""
+    model = CoreModel()
+    for addr, data in writes:
+        yield from rtio_output_event(dut.phy.rtlink, addr, data)
+        model.write(addr, data)
+
+    n_cycles = 0
+    for run, (time_remaining, n_successes, expected) in enumerate(
+        random_runs(rng, model, ref, apd)
+    ):
+        if n_successes == 1:
+            yield from rtio_output_event(dut.phy.rtlink, ADDR_RUN, time_remaining)
+        else:
+            yield from rtio_output_event(dut.phy.rtlink, ADDR_NSUCCESSES, n_successes)
+            yield from rtio_output_event(dut.phy.rtlink, ADDR_RUN_N, time_remaining)
+        for _ in range(expected["done"] + 2):
+            yield
+        scoreboard.check(run, expected)
+        n_cycles += expected["n_cycles"]
+        assert (yield dut.replay.cycle) == n_cycles
+
+
+def run_soak(n_cycles, seed):
+    """Soak test the core with ``n_cycles`` cycles of random stimulus.
+
+    Returns:
+        int: the number of cycles checked, those of the runs that finished within
+        the ``n_cycles`` cycles.
+    """
+    rng = np.random.default_rng(seed)
+    m_end, ref, apd = random_stimulus(rng, n_cycles)
+    dut = SoakHarness(ref, apd)
+    writes = random_writes(rng, m_end)
+    checked = []
+
+    def stimulus():
+        checked.append((yield from core_soak_test(dut, rng, writes, ref, apd)))
+
+    run_simulation(dut, stimulus(), clocks={"sys": 8})
+    return checked[0]
+
+
+def run_phy_soak(n_cycles, seed):
+    """Soak test the PHY with ``n_cycles`` cycles of random stimulus."""
+    rng = np.random.default_rng(seed)
+    m_end, ref, apd = random_stimulus(rng, n_cycles)
+    dut = SoakHarness(ref, apd, phy=True)
+    scoreboard = Scoreboard(dut.phy.rtlink)
+    writes = random_writes(rng, m_end)
+    run_simulation(
+        dut,
+        [scoreboard.monitor(), phy_soak_test(dut, scoreboard, rng, writes, ref, apd)],
+        clocks=CLOCKS,
+    )
+
+
+def soak(n_cycles, seed=0, chunk_cycles=500, processes=None):
+    """Soak test the core over ``n_cycles`` cycles, in parallel chunks.
+
+    Each chunk is an independent soak with its own random configuration & stimulus,
+    simulated in a process pool.
+
+    Args:
+        n_cycles (int): total number of cycles of random stimulus.
+        seed (int, optional): seed of the random stimulus of all chunks. Defaults
+            to 0.
+        chunk_cycles (int, optional): number of cycles of each chunk. Defaults to
+            500.
+        processes (int, optional): number of worker processes. Defaults to the
+            number of CPUs. With 1, the chunks are simulated in this process.
+
+    Returns:
+        int: the number of cycles checked.
+    """
+    n_chunks = -(-n_cycles // chunk_cycles)
+    sizes = [chunk_cycles] * (n_chunks - 1) + [n_cycles - chunk_cycles * (n_chunks - 1)]
+    seeds = np.random.SeedSequence(seed).spawn(n_chunks)
+    if processes == 1:
+        return sum(map(run_soak, sizes, seeds))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as pool:
+        return sum(pool.map(run_soak, sizes, seeds))
+
+
+def test_soak():
+    """Check the core against the model over random runs."""
+    assert soak(1000) > 900
+
+
+def test_phy_soak():
+    """Check the PHY input events against the model over random runs."""
+    run_phy_soak(150, 0)
+
+
+if __name__ == "__main__":
+    n_cycles = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    print("{} cycles checked".format(soak(n_cycles, seed)))
+    test_phy_soak()
@@ -0,0 +1,148 @@
+"""Sweep :class:`entangler.phy.Entangler` timing over many independent simulations.
+
+The points of each sweep are simulated in parallel (see ``helpers/sweep.py``), and
+checked against the :class:`entangler.model.CoreModel`. The tests take no
+arguments, so they also run under pytest.
+"""
+import functools
+import os
+import sys
+
+import numpy as np
+
+# add gateware simulation tools "module" (at ./helpers/*)
+sys.path.append(os.path.dirname(__file__))
+sys.path.append(os.path.join(os.path.dirname(__file__), "helpers"))
+
+
+from entangler.model import CoreModel  # noqa: E402
+from gateware_utils import rtio_output_event  # noqa: E402 ./helpers/gateware_utils
+from sweep import check_sweep  # noqa: E402 ./helpers/sweep
+from sweep import run_sweep  # noqa: E402
+from sweep import run_point  # noqa: E402
+from test_phy import ADDR_CONFIG  # noqa: E402
+from test_phy import ADDR_HERALDS  # noqa: E402
+from test_phy import ADDR_NCYCLES  # noqa: E402
+from test_phy import ADDR_RUN  # noqa: E402
+from test_phy import ADDR_TIMING  # noqa: E402
+from test_phy import PhyHarness  # noqa: E402
+from test_phy import timeout_point  # noqa: E402
+
+CLOCKS = {"sys": 8, "rio": 8, "rio_phy": 8}
+
+
+def herald_point(dut, timeout, n_cycles, t_ref, t_herald):
+    """Run with edges on inputs 0 & 2 every cycle, and return the run result event.
+
+    Returns:
+        tuple: clock cycle of the run result event since the write to the run
+        register, and the event data.
+    """
+
+    def out(addr, data):
+        yield from rtio_output_event(dut.core.rtlink, addr, data)
+
+    yield dut.phy_ref.t_event.eq(t_ref)
+    yield dut.phy_apd0.t_event.eq(t_herald)
+    yield dut.phy_apd2.t_event.eq(t_herald)
+    # Park the other inputs past the end of the cycle
+    yield dut.phy_apd1.t_event.eq(1000)
+    yield dut.phy_apd3.t_event.eq(1000)
+    yield from out(ADDR_CONFIG, 0b110)  # disable, standalone
+    yield from out(ADDR_NCYCLES, n_cycles)
+    yield from out(ADDR_HERALDS, (1 << 16) | 0b0101)
+    for i in range(4):
+        yield from out(ADDR_TIMING + 4 + i, (1000 << 16) | 8)
+    yield from out(ADDR_CONFIG, 0b111)  # enable standalone
+    yield from out(ADDR_RUN, timeout)
+    for i in range(timeout + n_cycles + 50):
+        if (yield dut.core.rtlink.i.stb):
+            return i, (yield dut.core.rtlink.i.data)
+        yield
+    raise AssertionError("No run result")
+
+
+def expected_run(n_cycles, timeout, t_ref=None, t_herald=None):
+    """Model of a run with the same edges in every cycle.
+
+    The mock PHYs register an edge at ``t_event`` on the coarse clock cycle after
+    the counter reaches it, which the model sees as an edge at ``t_event + 8``.
+    """
+    model = CoreModel()
+    model.m_end = n_cycles
+    model.gate_start[:] = 8
+    model.gate_stop[:] = 1000
+    model.patterns[0] = 0b0101
+    model.pattern_ens = 1
+    n = timeout // (n_cycles + 1) + 2
+    ref = np.full(n, -1 if t_ref is None else t_ref + 8)
+    apd = np.full((n, 4), -1)
+    if t_herald is not None:
+        apd[:, [0, 2]] = t_herald + 8
+    return model.run(ref, apd, timeout)
+
+
+def test_timeout_sweep(processes=None):
+    """Check runs time out when the model expects, for every cycle length."""
+    points = [
+        {"timeout": timeout, "n_cycles": n_cycles}
+        for n_cycles in [1, 4, 10]
+        for timeout in range(1, 20, 3)
+    ]
+    results = run_sweep(PhyHarness, timeout_point, points, processes, CLOCKS)
+    for point, t_timeout in zip(points, check_sweep(results)):
+        expected = expected_run(point["n_cycles"], point["timeout"])
+        assert t_timeout == expected["done"], (point, t_timeout, expected["done"])
+
+
+def test_herald_sweep(processes=None):
+    """Check heralds are timed as the model expects, over the cycle."""
+    points = [
+        {"timeout": timeout, "n_cycles": n_cycles, "t_ref": 9, "t_herald": t_herald}
+        for n_cycles in [4, 9]
+        for timeout in [3, 30]
+        # Edges over the cycle; the mock PHYs delay the last ones past its end
+        for t_herald in range(19, 8 * n_cycles, 11)
+    ]
+    results = run_sweep(PhyHarness, herald_point, points, processes, CLOCKS)
+    for point, (t_done, data) in zip(points, check_sweep(results)):
+        expected = expected_run(**point)
+        assert (t_done, data) == (expected["done"], expected["result"]), (
+            point,
+            (t_done, data),
+            (expected["done"], expected["result"]),
+        )
+
+
+def failing_point(_dut, fail):
+    """Stimulus failing if asked to."""
+    yield
+    assert not fail, "failing point"
+    return "passed"
+
+
+def test_sweep_failures():
+    """Check failed points are reported, without stopping the others."""
+    results = run_sweep(
+        functools.partial(PhyHarness, num_inputs=2),
+        failing_point,
+        [{"fail": False}, {"fail": True}, {"fail": False}],
+        clocks=CLOCKS,
+    )
+    assert [result.ok for result in results] == [True, False, True]
+    assert results[0].value == "passed"
+    assert "failing point" in results[1].error
+    try:
+        check_sweep(results)
+    except AssertionError as error:
+        assert "1 of 3 sweep points failed" in str(error)
+    else:
+        raise AssertionError("check_sweep did not fail")
+    in_process = run_point(PhyHarness, failing_point, {"fail": False}, CLOCKS)
+    assert in_process.value == "passed"
+
+
+if __name__ == "__main__":
+    test_timeout_sweep()
+    test_herald_sweep()
+    test_sweep_failures()